@@ -0,0 +1,133 @@
+import datetime
+from rest_framework.exceptions import ValidationError
+from .models import User, Desk
+
+
+WORK_DAYS = 5
+# desk week masks ordered by the number of days already taken, fullest first
+MASKS_BY_FILL = sorted(range(1 << WORK_DAYS), key=lambda mask: (-bin(mask).count('1'), mask))
+
+
+def office_days(remote_percentage):
+    return max(0, min(WORK_DAYS, round(WORK_DAYS * (100 - remote_percentage) / 100)))
+
+
+# Hot-desking plan for one week.
+# employees: (user_id, office_id, days_needed, fixed_desk_id or None)
+# desks: (desk_id, office_id) of the usable desks that can be shared
+# Returns ({user_id: {day index: desk_id}}, days that could not be placed).
+#
+# Days are picked greedily, larger demands first, on the days where the
+# employee's office (team) has the fewest people and then the least loaded
+# days overall, so demand never exceeds the desk count and every team is spread
+# over the week. Desks are tracked as 5 bit masks of taken days and bucketed by
+# (office, mask): an employee takes the fullest desk whose mask does not clash
+# with their days, preferring their own office, so most people keep one desk
+# for the whole week. Each step only looks at the 32 masks, not at the desks.
+def allocate_week(employees, desks):
+    capacity = len(desks)
+    load = [0] * WORK_DAYS
+    team_load = {}
+    masks = {}
+    unmet = 0
+    for position, (user_id, office_id, days_needed, fixed_desk) in enumerate(
+            sorted(employees, key=lambda employee: (-employee[2], employee[1], employee[0]))):
+        team = team_load.setdefault(office_id, [0] * WORK_DAYS)
+        # rotate ties so equal employees do not all start on Monday
+        order = sorted((day for day in range(WORK_DAYS) if load[day] < capacity),
+                       key=lambda day: (team[day], load[day], (day - position) % WORK_DAYS))
+        mask = 0
+        for day in order[:days_needed]:
+            mask |= 1 << day
+            load[day] += 1
+            team[day] += 1
+        unmet += days_needed - min(days_needed, len(order))
+        if mask:
+            masks[user_id] = (office_id, mask, fixed_desk)
+
+    offices = sorted({office_id for desk_id, office_id in desks})
+    buckets = {}
+    desk_masks = {}
+    desk_offices = {}
+    for desk_id, office_id in desks:
+        buckets.setdefault((office_id, 0), []).append(desk_id)
+        desk_masks[desk_id] = 0
+        desk_offices[desk_id] = office_id
+
+    def take(desk_id, mask):
+        bucket = buckets[(desk_offices[desk_id], desk_masks[desk_id])]
+        # find() hands out the last desk of a bucket, only fixed desks sit elsewhere
+        if bucket[-1] == desk_id:
+            bucket.pop()
+        else:
+            bucket.remove(desk_id)
+        desk_masks[desk_id] |= mask
+        buckets.setdefault((desk_offices[desk_id], desk_masks[desk_id]), []).append(desk_id)
+
+    def find(office_id, clash):
+        for office in [office_id] + offices:
+            for mask in MASKS_BY_FILL:
+                if not mask & clash and buckets.get((office, mask)):
+                    return buckets[(office, mask)][-1]
+        return None
+
+    plan = {}
+    # permanent desk owners sit at their own desk
+    for user_id, (office_id, mask, fixed_desk) in masks.items():
+        if fixed_desk in desk_masks and not desk_masks[fixed_desk] & mask:
+            take(fixed_desk, mask)
+            plan[user_id] = {day: fixed_desk for day in range(WORK_DAYS) if mask >> day & 1}
+    for user_id, (office_id, mask, fixed_desk) in masks.items():
+        if user_id in plan:
+            continue
+        desk_id = find(office_id, mask)
+        if desk_id is not None:
+            take(desk_id, mask)
+            plan[user_id] = {day: desk_id for day in range(WORK_DAYS) if mask >> day & 1}
+            continue
+        # no desk is free on all of the days, take one desk per day
+        plan[user_id] = {}
+        for day in range(WORK_DAYS):
+            if mask >> day & 1:
+                desk_id = find(office_id, 1 << day)
+                take(desk_id, 1 << day)
+                plan[user_id][day] = desk_id
+    return plan, unmet
+
+
+def week_start(value):
+    day = datetime.date.fromisoformat(value) if value else datetime.date.today() + datetime.timedelta(days=7)
+    return day - datetime.timedelta(days=day.weekday())
+
+
+# monday of the ?week= query parameter
+def get_week_start(request):
+    try:
+        return week_start(request.query_params.get('week'))
+    except ValueError:
+        raise ValidationError({'week': 'Expected a date as YYYY-MM-DD.'})
+
+
+# plan the active employees of the offices over their usable desks
+def plan_offices(office_ids, monday):
+    employees = User.userObjects.filter(office_id__in=office_ids).values_list('id', 'office_id', 'remote_percentage')
+    desks = list(Desk.objects.filter(office_id__in=office_ids, is_usable=True).values_list('id', 'office_id', 'user_id'))
+    fixed = {user_id: desk_id for desk_id, office_id, user_id in desks if user_id is not None}
+    plan, unmet = allocate_week(
+        [(user_id, office_id, office_days(remote_percentage), fixed.get(user_id))
+         for user_id, office_id, remote_percentage in employees],
+        [(desk_id, office_id) for desk_id, office_id, user_id in desks],
+    )
+    dates = [(monday + datetime.timedelta(days=day)).isoformat() for day in range(WORK_DAYS)]
+    demand = dict.fromkeys(dates, 0)
+    for days in plan.values():
+        for day in days:
+            demand[dates[day]] += 1
+    return {
+        'week': monday.isoformat(),
+        'capacity': len(desks),
+        'demand': demand,
+        'unmet_days': unmet,
+        'employees': [{'user_id': user_id, 'days': {dates[day]: desk_id for day, desk_id in sorted(days.items())}}
+                      for user_id, days in sorted(plan.items())],
+    }
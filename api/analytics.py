@@ -0,0 +1,158 @@
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+from .models import User, Building, Office, Request, OfficeStats
+
+
+# (field, lower bound exclusive, upper bound inclusive) of the remote_percentage ranges
+REMOTE_BUCKETS = (
+    ('remote_0', None, 0),
+    ('remote_1_25', 0, 25),
+    ('remote_26_50', 25, 50),
+    ('remote_51_75', 50, 75),
+    ('remote_76_100', 75, 100),
+)
+REQUEST_FIELDS = {
+    Request.PENDING: 'pending_requests',
+    Request.APPROVED: 'approved_requests',
+    Request.REJECTED: 'rejected_requests',
+}
+COUNTER_FIELDS = (('employees', 'remote_percentage_sum') + tuple(field for field, low, high in REMOTE_BUCKETS)
+                  + tuple(REQUEST_FIELDS.values()))
+# User fields the summary depends on
+USER_FIELDS = ('office_id', 'is_active', 'remote_percentage')
+
+
+def remote_bucket(remote_percentage):
+    for field, low, high in REMOTE_BUCKETS:
+        if (low is None or remote_percentage > low) and remote_percentage <= high:
+            return field
+    return REMOTE_BUCKETS[-1][0]
+
+
+# counters contributed by a single user
+def user_stats(is_active, remote_percentage):
+    if not is_active:
+        return {}
+    remote_percentage = float(remote_percentage)
+    return {'employees': 1, 'remote_percentage_sum': remote_percentage, remote_bucket(remote_percentage): 1}
+
+
+# counters contributed by a single request
+def request_stats(status):
+    return {REQUEST_FIELDS[status]: 1} if status in REQUEST_FIELDS else {}
+
+
+# Collects counter changes per office, so a bulk write costs one UPDATE per office.
+# States are (office_id, *fields) tuples or None, contribution maps the fields to counters.
+class StatsDelta:
+    def __init__(self):
+        self.offices = {}
+
+    def move(self, before, after, contribution):
+        if before == after:
+            return
+        for state, sign in ((before, -1), (after, 1)):
+            if state is None or state[0] is None:
+                continue
+            delta = self.offices.setdefault(state[0], {})
+            for field, value in contribution(*state[1:]).items():
+                delta[field] = delta.get(field, 0) + sign * value
+
+    def apply(self):
+        for office_id, delta in sorted(self.offices.items()):
+            changes = {field: F(field) + value for field, value in delta.items() if value}
+            if changes:
+                OfficeStats.objects.filter(office=office_id).update(**changes)
+        self.offices = {}
+
+
+def move_stats(before, after, contribution):
+    delta = StatsDelta()
+    delta.move(before, after, contribution)
+    delta.apply()
+
+
+def user_state(user):
+    return (user.office_id_id, user.is_active, user.remote_percentage)
+
+
+def request_state(request):
+    return (request.office_id_id, request.status)
+
+
+def _user_counts():
+    buckets = {
+        field: Count('id', filter=Q(remote_percentage__lte=high) & (
+            Q(remote_percentage__gt=low) if low is not None else Q()))
+        for field, low, high in REMOTE_BUCKETS
+    }
+    return {
+        row['office_id']: row for row in User.userObjects.filter(office_id__isnull=False).order_by()
+        .values('office_id').annotate(employees=Count('id'), remote_percentage_sum=Sum('remote_percentage'), **buckets)
+    }
+
+
+def _request_counts():
+    return {
+        row['office_id']: row for row in Request.objects.order_by().values('office_id').annotate(
+            **{field: Count('id', filter=Q(status=status)) for status, field in REQUEST_FIELDS.items()}
+        )
+    }
+
+
+# recompute every summary row from the User and Request tables, returns the number of rows fixed
+@transaction.atomic
+def rebuild_stats():
+    OfficeStats.objects.bulk_create([OfficeStats(office_id=office_id) for office_id in
+                                     Office.objects.filter(stats__isnull=True).values_list('id', flat=True)])
+    users, requests = _user_counts(), _request_counts()
+    fixed = 0
+    for stats in OfficeStats.objects.select_for_update().order_by('office'):
+        values = {field: 0 for field in COUNTER_FIELDS}
+        for counts in (users.get(stats.office_id), requests.get(stats.office_id)):
+            if counts is not None:
+                values.update({field: counts[field] or 0 for field in COUNTER_FIELDS if field in counts})
+        if any(getattr(stats, field) != value for field, value in values.items()):
+            OfficeStats.objects.filter(pk=stats.pk).update(**values)
+            fixed += 1
+    return fixed
+
+
+def _summary(row):
+    employees = row['employees'] or 0
+    return {
+        'total_desks': row['total_desks'],
+        'usable_desks': row['usable_desks'],
+        'occupied_desks': row['occupied_desks'],
+        'occupancy_percentage': round(100 * row['occupied_desks'] / row['total_desks'], 1)
+                                if row['total_desks'] else 0.0,
+        'employees': employees,
+        'remote_percentage': {
+            'average': round((row['remote_percentage_sum'] or 0) / employees, 1) if employees else 0.0,
+            'distribution': {field[len('remote_'):].replace('_', '-'): row[field] or 0
+                             for field, low, high in REMOTE_BUCKETS},
+        },
+        'requests': {field[:-len('_requests')]: row[field] or 0 for field in REQUEST_FIELDS.values()},
+    }
+
+
+# Workplace analytics per office, building and for the whole organisation.
+# Desk counters come from the occupancy counters, the rest from the summary rows:
+# one query per level, the cost does not depend on the number of users or requests.
+def workplace_analytics():
+    stats_fields = {field: F('stats__' + field) for field in COUNTER_FIELDS}
+    offices = Office.objects.order_by('id').values(
+        'id', 'name', 'building_id', 'total_desks', 'usable_desks', 'occupied_desks', **stats_fields)
+    buildings = Building.objects.order_by('id').values('id', 'name', 'total_desks', 'usable_desks', 'occupied_desks')\
+        .annotate(**{field: Coalesce(Sum('office__stats__' + field), 0, output_field=OfficeStats._meta.get_field(
+            field)) for field in COUNTER_FIELDS})
+    offices, buildings = list(offices), list(buildings)
+    organisation = {field: sum(building[field] or 0 for building in buildings)
+                    for field in ('total_desks', 'usable_desks', 'occupied_desks') + COUNTER_FIELDS}
+    return {
+        'organisation': _summary(organisation),
+        'buildings': [dict(id=row['id'], name=row['name'], **_summary(row)) for row in buildings],
+        'offices': [dict(id=row['id'], name=row['name'], building_id=row['building_id'], **_summary(row))
+                    for row in offices],
+    }
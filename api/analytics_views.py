@@ -0,0 +1,13 @@
+from .permissions import UserAdminPermission
+from .analytics import workplace_analytics
+from rest_framework import viewsets
+from rest_framework.response import Response
+
+
+# Workplace analytics: desk occupancy, remote_percentage distribution and
+# request counts per office, per building and for the whole organisation
+class AnalyticsView(viewsets.ViewSet):
+    permission_classes = [UserAdminPermission]
+
+    def list(self, request):
+        return Response(workplace_analytics())
@@ -0,0 +1,25 @@
+from django.urls import path
+from .async_views import async_read
+from .user_views import UserList, UserDetail
+from .building_views import BuildingList
+from .office_views import OfficeList
+from .desk_views import DeskList
+from .request_views import RequestList
+
+
+app_name = 'api_async'
+
+
+# async versions of the read endpoints of api.urls, served under /api/async/
+urlpatterns = [
+    path('users/', async_read(UserList, 'list'), name='users'),
+    path('users/<int:pk>/', async_read(UserDetail, 'retrieve'), name='user'),
+    path('buildings/', async_read(BuildingList, 'list'), name='buildings'),
+    path('buildings/<int:pk>/', async_read(BuildingList, 'retrieve'), name='building'),
+    path('offices/', async_read(OfficeList, 'list'), name='offices'),
+    path('offices/<int:pk>/', async_read(OfficeList, 'retrieve'), name='office'),
+    path('desks/', async_read(DeskList, 'list'), name='desks'),
+    path('desks/<int:pk>/', async_read(DeskList, 'retrieve'), name='desk'),
+    path('requests/', async_read(RequestList, 'list'), name='requests'),
+    path('requests/<int:pk>/', async_read(RequestList, 'retrieve'), name='request'),
+]
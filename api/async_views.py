@@ -0,0 +1,51 @@
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.http import Http404, HttpResponseNotAllowed
+from rest_framework.exceptions import APIException, PermissionDenied
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.views import exception_handler
+
+
+# Async read endpoints for ASGI deployments.
+# Django 4.0 has no async ORM (aget and async iteration came in 4.1) and DRF views
+# are sync, so the token and permission checks run on the event loop and the
+# viewset's own read method runs in a thread of the executor through sync_to_async,
+# with its queries, response cache and serialization unchanged. Not thread sensitive:
+# the requests of a worker run their queries side by side on the executor threads,
+# not one after another on a single shared thread.
+def async_read(viewset_class, action):
+
+    def run(viewset, request, kwargs):
+        try:
+            response = getattr(viewset, action)(request, **kwargs)
+            return render(response, viewset, request)
+        finally:
+            # the thread serves other requests next, its connection is closed (or pooled) now
+            connections.close_all()
+
+    async def view(request, **kwargs):
+        if request.method != 'GET':
+            return HttpResponseNotAllowed(['GET'])
+        drf_request = Request(request)
+        viewset = viewset_class(request=drf_request, action=action, args=(), kwargs=kwargs, format_kwarg=None)
+        try:
+            # permissions only read the token claims, nothing blocks here, a missing token
+            # is a 403 as on the sync endpoints
+            for permission in viewset.get_permissions():
+                if not permission.has_permission(drf_request, viewset):
+                    raise PermissionDenied(getattr(permission, 'message', None))
+            return await sync_to_async(run, thread_sensitive=False)(viewset, drf_request, kwargs)
+        except (APIException, Http404) as exc:
+            return render(exception_handler(exc, {'view': viewset, 'request': drf_request}), viewset, drf_request)
+
+    # the metrics label of the view
+    view.__name__ = view.__qualname__ = '%s.%s:async' % (viewset_class.__name__, action)
+    return view
+
+
+def render(response, viewset, request):
+    response.accepted_renderer = JSONRenderer()
+    response.accepted_media_type = JSONRenderer.media_type
+    response.renderer_context = {'view': viewset, 'request': request}
+    return response.render()
@@ -0,0 +1,50 @@
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+from .metrics import record_phase
+
+
+# Request-scoped authentication state.
+# The access token is decoded once per request and shared by every permission
+# class and view. Role checks use the claims added in MyTokenObtainPairSerializer,
+# the User row is only fetched when a view actually needs it.
+class AuthContext:
+
+    def __init__(self, request, token):
+        self.request = request
+        self.token = token
+
+    @property
+    def role(self):
+        return self.token.get('role')
+
+    @property
+    def user_id(self):
+        return self.token.get(api_settings.USER_ID_CLAIM)
+
+    @cached_property
+    def user(self):
+        # single DB lookup, raises AuthenticationFailed for unknown/inactive users
+        with record_phase(self.request, 'auth'):
+            return JWTAuthentication().get_user(self.token)
+
+
+def get_auth_context(request):
+    # cache on the underlying HttpRequest so the DRF Request wrappers share it
+    http_request = getattr(request, '_request', request)
+    try:
+        return http_request.auth_context
+    except AttributeError:
+        pass
+
+    context = None
+    authentication = JWTAuthentication()
+    with record_phase(http_request, 'auth'):
+        header = authentication.get_header(http_request)
+        if header is not None:
+            raw_token = authentication.get_raw_token(header)
+            if raw_token is not None:
+                context = AuthContext(http_request, authentication.get_validated_token(raw_token))
+
+    http_request.auth_context = context
+    return context
@@ -0,0 +1,271 @@
+import datetime
+import math
+import random
+import time
+from django.contrib.postgres.fields.ranges import DateRange
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import Client
+from .models import User, Building, Office, Desk, Request, DeskReservation
+from .occupancy import rebuild_occupancy
+from .analytics import rebuild_stats
+from .response_cache import bump_version
+from .serializers import MyTokenObtainPairSerializer
+from .spatial import PX_PER_METER
+
+
+# Synthetic organisation for benchmarks.
+# Rows are bulk inserted (callers usually run inside a rolled back transaction),
+# the occupancy counters, analytics summary and cache versions are fixed up at the end.
+def seed_organisation(buildings=2, floors=3, offices_per_floor=2, desks_per_office=100,
+                      users=1000, requests=500, reservations=0, seed=0):
+    rng = random.Random(seed)
+    prefix = 'bench-%d-%d' % (seed, time.time() * 1000)
+
+    building_rows = Building.objects.bulk_create([
+        Building(name='Building %d' % i, floors_count=floors, address='%s street %d' % (prefix, i))
+        for i in range(buildings)
+    ])
+    office_rows = Office.objects.bulk_create([
+        Office(name='Office %d.%d' % (floor, i), building_id=building, floor_number=floor,
+               x_size_m=60, y_size_m=40)
+        for building in building_rows for floor in range(floors) for i in range(offices_per_floor)
+    ])
+
+    user_rows = []
+    for i in range(users):
+        office = office_rows[i % len(office_rows)]
+        user_rows.append(User(
+            email='%s-%d@bench.local' % (prefix, i), password='!', first_name='First%d' % i,
+            last_name='Last%d' % i, role='Employee', office_id=office, building_id_id=office.building_id_id,
+            gender=rng.choice('MFO'), remote_percentage=rng.choice((0, 20, 40, 60, 80, 100)), is_active=True,
+        ))
+    # the first user is the Admin, users n..2n-1 administer office i = user % n
+    user_rows[0].role = 'Admin'
+    office_admins = user_rows[len(office_rows):2 * len(office_rows)]
+    for user in office_admins:
+        user.role = 'Office Admin'
+    user_rows = User.objects.bulk_create(user_rows, batch_size=5000)
+    for office, user in zip(office_rows, office_admins):
+        office.office_admin = user
+    Office.objects.bulk_update(office_rows, ['office_admin'])
+
+    office_users = {}
+    for user in user_rows:
+        office_users.setdefault(user.office_id_id, []).append(user)
+    desk_rows = []
+    for office in office_rows:
+        occupants = office_users.get(office.id, [])
+        for number in range(desks_per_office):
+            occupant = occupants[number] if number < len(occupants) and rng.random() < 0.6 else None
+            desk_rows.append(Desk(
+                office_id=office, desk_number=number, user_id=occupant, is_usable=rng.random() < 0.95,
+                x_size_m=1.6, y_size_m=0.8, x_pos_px=number % 25 * 90, y_pos_px=number // 25 * 50,
+            ))
+    desk_rows = Desk.objects.bulk_create(desk_rows, batch_size=5000)
+
+    request_rows = Request.objects.bulk_create([
+        Request(user_id=user, office_id_id=user.office_id_id, remote_percentage=rng.choice((20, 40, 60, 80, 100)),
+                request_reason='Benchmark', status=rng.choice('PPAR'))
+        for user in rng.sample(user_rows, min(requests, len(user_rows)))
+    ], batch_size=5000)
+
+    # week long bookings from 2026-01-05 on, every user holds at most one desk per week
+    pairs = list(zip([desk for desk in desk_rows if desk.is_usable], rng.sample(user_rows, len(user_rows))))
+    reservation_rows = []
+    for n in range(reservations if pairs else 0):
+        desk, user = pairs[n % len(pairs)]
+        monday = datetime.date(2026, 1, 5) + datetime.timedelta(weeks=n // len(pairs))
+        reservation_rows.append(DeskReservation(desk_id=desk, user_id=user,
+                                                dates=DateRange(monday, monday + datetime.timedelta(days=5))))
+    reservation_rows = DeskReservation.objects.bulk_create(reservation_rows, batch_size=5000)
+
+    rebuild_occupancy()
+    rebuild_stats()
+    bump_version('user', 'building', 'office', 'desk')
+    return {
+        'admin': user_rows[0],
+        'office_admin': office_admins[0] if office_admins else user_rows[0],
+        'employee': user_rows[-1],
+        'building': building_rows[0],
+        'office': office_rows[0],
+        'desk': desk_rows[0],
+        'usable_desk': next((desk for desk in desk_rows if desk.is_usable), None),
+        'request': request_rows[0] if request_rows else None,
+        'requests': request_rows,
+        'reservation': reservation_rows[0] if reservation_rows else None,
+    }
+
+
+# Benchmarks of running servers commit their seeded rows, the servers read them from their
+# own connections. They only run once told the configured database is a scratch one.
+def add_scratch_database_argument(parser):
+    parser.add_argument('--scratch-database', action='store_true',
+                        help='Confirm the configured database is a scratch one, rows are committed to it.')
+
+
+def check_scratch_database(options):
+    if not options['scratch_database']:
+        raise CommandError('This benchmark commits rows to the database %r, point DB_NAME at a scratch '
+                           'database and pass --scratch-database.' % connection.settings_dict['NAME'])
+
+
+def auth_headers(user):
+    token = MyTokenObtainPairSerializer.get_token(user).access_token
+    return {'HTTP_AUTHORIZATION': 'Bearer ' + str(token)}
+
+
+# bulk layout payload of `count` desks in a grid filling the office
+def desk_layout(office, count):
+    columns = math.ceil(math.sqrt(count * office.x_size_m / office.y_size_m))
+    x_step, y_step = office.x_size_m / columns, office.y_size_m / math.ceil(count / columns)
+    return [{'desk_number': number, 'x_size_m': x_step * 0.9, 'y_size_m': y_step * 0.9,
+             'x_pos_px': int(number % columns * x_step * PX_PER_METER),
+             'y_pos_px': int(number // columns * y_step * PX_PER_METER)} for number in range(count)]
+
+
+# (name, role, method, path, body) for every API endpoint, a callable body is called with
+# the iteration so repeated writes (imports, bookings, decisions) do real work every time
+def api_endpoints(org):
+    office, building, desk = org['office'].id, org['building'].id, org['desk'].id
+    layout = [{'desk_number': number, 'x_size_m': 1.6, 'y_size_m': 0.8, 'x_pos_px': number % 25 * 90,
+               'y_pos_px': number // 25 * 50} for number in range(200)]
+    pending = [request.id for request in org['requests'] if request.status == 'P']
+    endpoints = [
+        ('users.list', 'admin', 'get', '/api/users/', None),
+        ('users.list.office', 'admin', 'get', '/api/users/?office_id=%d' % office, None),
+        ('users.since', 'admin', 'get', '/api/users/?since=0', None),
+        ('users.retrieve', 'admin', 'get', '/api/users/%d/' % org['employee'].id, None),
+        ('users.export', 'admin', 'get', '/api/users/export/csv/', None),
+        ('me', 'admin', 'get', '/api/me/', None),
+        ('buildings.list', 'admin', 'get', '/api/buildings/', None),
+        ('buildings.since', 'admin', 'get', '/api/buildings/?since=0', None),
+        ('buildings.retrieve', 'admin', 'get', '/api/buildings/%d/' % building, None),
+        ('buildings.allocation', 'admin', 'get', '/api/buildings/%d/allocation/' % building, None),
+        ('buildings.availability', 'employee', 'get', '/api/buildings/%d/availability/?date=2026-01-06' % building,
+         None),
+        ('offices.list', 'admin', 'get', '/api/offices/', None),
+        ('offices.since', 'admin', 'get', '/api/offices/?since=0', None),
+        ('offices.retrieve', 'admin', 'get', '/api/offices/%d/' % office, None),
+        ('offices.allocation', 'admin', 'get', '/api/offices/%d/allocation/' % office, None),
+        ('offices.floor_plan', 'employee', 'get', '/api/offices/%d/floor_plan.svg/' % office, None),
+        ('offices.images', 'admin', 'get', '/api/offices/%d/images/' % office, None),
+        ('offices.desks.region', 'admin', 'get', '/api/offices/%d/desks/region/?x0=0&y0=0&x1=400&y1=300' % office,
+         None),
+        ('offices.desks.nearest_free', 'admin', 'get', '/api/offices/%d/desks/nearest_free/?x=500&y=200' % office,
+         None),
+        ('offices.desks.bulk', 'admin', 'post', '/api/offices/%d/desks/bulk/' % office, layout),
+        ('desks.list', 'admin', 'get', '/api/desks/', None),
+        ('desks.list.office', 'admin', 'get', '/api/desks/?office_id=%d' % office, None),
+        ('desks.since', 'admin', 'get', '/api/desks/?since=0', None),
+        ('desks.retrieve', 'admin', 'get', '/api/desks/%d/' % desk, None),
+        ('desks.overlapping', 'admin', 'get', '/api/desks/%d/overlapping/' % desk, None),
+        ('desks.export', 'admin', 'get', '/api/desks/export/csv/', None),
+        ('requests.list.admin', 'admin', 'get', '/api/requests/', None),
+        ('requests.list.office_admin', 'office_admin', 'get', '/api/requests/', None),
+        ('requests.list.employee', 'employee', 'get', '/api/requests/', None),
+        ('requests.since', 'admin', 'get', '/api/requests/?since=0', None),
+        ('requests.export', 'admin', 'get', '/api/requests/export/csv/', None),
+        ('reservations.list', 'admin', 'get', '/api/reservations/?office_id=%d' % office, None),
+        ('analytics', 'admin', 'get', '/api/analytics/', None),
+        # writes, ten pending requests and a few new users per iteration
+        ('requests.decide', 'admin', 'post', '/api/requests/decide/',
+         lambda i: [{'id': request_id, 'approve': True} for request_id in pending[i * 10:i * 10 + 10]]),
+        ('users.import', 'admin', 'post', '/api/users/import/',
+         lambda i: [{'email': 'import-%d-%d-%d@bench.local' % (office, i, n), 'password': 'Benchmark-%d' % n,
+                     'first_name': 'Import', 'last_name': 'User', 'office_id': office} for n in range(5)]),
+    ]
+    if org['request'] is not None:
+        endpoints.append(('requests.retrieve', 'admin', 'get', '/api/requests/%d/' % org['request'].id, None))
+    if org['reservation'] is not None:
+        endpoints.append(('reservations.retrieve', 'admin', 'get', '/api/reservations/%d/' % org['reservation'].id,
+                          None))
+    if org['usable_desk'] is not None:
+        # a week each, far behind the seeded bookings
+        endpoints.append(('reservations.create', 'admin', 'post', '/api/reservations/', lambda i: {
+            'desk_id': org['usable_desk'].id,
+            'start_date': (datetime.date(2030, 1, 7) + datetime.timedelta(weeks=i)).isoformat(),
+            'end_date': (datetime.date(2030, 1, 11) + datetime.timedelta(weeks=i)).isoformat()}))
+    # last, a floor sized layout leaves the office with 2,000 desks
+    endpoints.append(('offices.desks.bulk.2000', 'admin', 'post', '/api/offices/%d/desks/bulk/' % office,
+                      desk_layout(org['office'], 2000)))
+    return endpoints
+
+
+# (name, role, path below /api/) of the read endpoints served by both api.urls and api.async_urls
+def read_endpoints(org):
+    office = org['office'].id
+    endpoints = [
+        ('users.list', 'admin', 'users/'),
+        ('users.retrieve', 'admin', 'users/%d/' % org['employee'].id),
+        ('buildings.list', 'admin', 'buildings/'),
+        ('buildings.retrieve', 'admin', 'buildings/%d/' % org['building'].id),
+        ('offices.list', 'admin', 'offices/'),
+        ('offices.retrieve', 'admin', 'offices/%d/' % office),
+        ('desks.list.office', 'admin', 'desks/?office_id=%d' % office),
+        ('desks.retrieve', 'admin', 'desks/%d/' % org['desk'].id),
+        ('requests.list.admin', 'admin', 'requests/'),
+        ('requests.list.office_admin', 'office_admin', 'requests/'),
+        ('requests.list.employee', 'employee', 'requests/'),
+    ]
+    if org['request'] is not None:
+        endpoints.append(('requests.retrieve', 'admin', 'requests/%d/' % org['request'].id))
+    return endpoints
+
+
+# execute_wrapper counting queries and their time, precise to the perf_counter
+class QueryTimer:
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))]
+
+
+# run every endpoint `iterations` times, timings are in milliseconds
+def run_endpoints(org, iterations=20, before_request=None):
+    client = Client(HTTP_HOST='127.0.0.1')
+    headers = {role: auth_headers(org[role]) for role in ('admin', 'office_admin', 'employee')}
+    results = {}
+    for name, role, method, path, body in api_endpoints(org):
+        latencies, query_counts, query_times = [], [], []
+        status_code = None
+        for i in range(iterations):
+            if before_request is not None:
+                before_request()
+            kwargs = dict(headers[role])
+            if body is not None:
+                kwargs.update(data=body(i) if callable(body) else body, content_type='application/json')
+            timer = QueryTimer()
+            with connection.execute_wrapper(timer):
+                started = time.perf_counter()
+                response = getattr(client, method)(path, **kwargs)
+                if response.streaming:
+                    # exports run their queries while the body is read
+                    b''.join(response.streaming_content)
+                latencies.append((time.perf_counter() - started) * 1000)
+            status_code = response.status_code
+            query_counts.append(timer.count)
+            query_times.append(timer.seconds * 1000)
+        results[name] = {
+            'status': status_code,
+            'p50_ms': percentile(latencies, 50),
+            'p90_ms': percentile(latencies, 90),
+            'p99_ms': percentile(latencies, 99),
+            'max_ms': max(latencies),
+            'queries': max(query_counts),
+            'sql_ms': sum(query_times) / len(query_times),
+        }
+    return results
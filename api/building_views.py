@@ -1,11 +1,17 @@
 from .models import Building, Office
 from .serializers import BuildingSerializer, BuildingGetSerializer
 from .permissions import UserAuthenticatedPermission, UserAdminPermission, UserOfficeAdminPermission
+from .pagination import paginate
+from .response_cache import cached_response
+from .sync import sync_response
+from .allocation import get_week_start, plan_offices
+from .reservation_views import parse_date, building_availability
 from rest_framework import status, viewsets
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from django.shortcuts import get_object_or_404
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404
 
 
 # Display Buildings
@@ -14,11 +20,19 @@ class BuildingList(viewsets.ViewSet):
     queryset = Building.objects.all()
     serializer_class = BuildingSerializer
 
+    # ?since=<cursor> returns the changed and deleted buildings instead, see api.sync
     def list(self, request):
+        if 'since' in request.query_params:
+            return sync_response(Building.objects.all(), 'building', request, BuildingGetSerializer)
+        return self.list_page(request)
+
+    # the building counters roll up the office counters
+    @cached_response('building', 'office', 'desk')
+    def list_page(self, request):
         buildings = Building.objects.all()
-        serializer = BuildingGetSerializer(buildings, many=True)
-        return Response(serializer.data)
+        return paginate(buildings, request, self, BuildingGetSerializer)
 
+    @cached_response('building')
     def retrieve(self, request, pk=None):
         building = get_object_or_404(Building, pk=pk)
         serializer = BuildingSerializer(building)
@@ -57,4 +71,27 @@ class BuildingList(viewsets.ViewSet):
             # can't delete buildings with offices
             return Response(status=status.HTTP_400_BAD_REQUEST)
         building.delete()
-        return Response({"Success": "Building deleted succesfully."}, status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        return Response({"Success": "Building deleted succesfully."}, status=status.HTTP_204_NO_CONTENT)
+
+    # hot-desking plan over all offices of the building, see OfficeList.allocation
+    @action(detail=True, methods=['get'])
+    def allocation(self, request, pk=None):
+        building = get_object_or_404(Building, pk=pk)
+        office_ids = list(Office.objects.filter(building_id=building.id).values_list('id', flat=True))
+        return Response(plan_offices(office_ids, get_week_start(request)))
+
+    # usable desks of the building and who reserved them on ?date=YYYY-MM-DD
+    @action(detail=True, methods=['get'], permission_classes=[UserAuthenticatedPermission])
+    def availability(self, request, pk=None):
+        day = parse_date(request)
+        if not pk.isdigit():
+            raise Http404
+        desks = building_availability(pk, day)
+        # only look the building up when it has no desks
+        if not desks and not Building.objects.filter(pk=pk).exists():
+            raise Http404
+        return Response({
+            'date': day.isoformat(),
+            'available': sum(desk['available'] for desk in desks),
+            'desks': desks,
+        })
@@ -0,0 +1,38 @@
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+# Database the ORM reads from in the current request, set by ReplicaReadMiddleware.
+# Outside of requests (management commands, shell) reads stay on the primary.
+read_database = ContextVar('read_database', default=None)
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def sticky_key(user_id):
+    return 'db-primary:%s' % user_id
+
+
+# Reads go to the database chosen for the request, writes always to the primary.
+# The replicas are kept in sync by PostgreSQL streaming replication, so they are never migrated.
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        return read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replica_aliases():
+            return False
+        return None
@@ -1,11 +1,18 @@
 from .models import Desk
-from .serializers import DeskSerializer
+from .serializers import DeskSerializer, DeskGetSerializer
 from .permissions import UserAuthenticatedPermission, UserAdminPermission, UserOfficeAdminPermission
+from .pagination import filter_queryset, paginate, parse_bool
+from .export import DESK_COLUMNS, export_response
+from .spatial import get_office_grid
+from .response_cache import cached_response
+from .sync import sync_response
 from rest_framework import status, viewsets
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from django.shortcuts import get_object_or_404
+from django.db import transaction
 from django.http import JsonResponse
 from django.forms.models import model_to_dict
 
@@ -16,13 +23,40 @@ class DeskList(viewsets.ViewSet):
     permission_classes = [AllowAny]
     queryset = Desk.objects.all()
     serializer_class = DeskSerializer
+    filter_fields = {
+        'office_id': ('office_id', int),
+        'building_id': ('office_id__building_id', int),
+        'user_id': ('user_id', int),
+        'is_usable': ('is_usable', parse_bool),
+    }
 
+    # ?since=<cursor> returns the changed and deleted desks instead, see api.sync
+    # the feed is not cached, rows are versioned by triggers and not by the cache versions
     def list(self, request):
-        desks = Desk.objects.all()
-        serializer = DeskSerializer(desks, many=True)
-        return Response(serializer.data)
+        if 'since' in request.query_params:
+            return sync_response(Desk.objects.all(), 'desk', request, DeskSerializer)
+        return self.list_page(request)
+
+    @cached_response('desk')
+    def list_page(self, request):
+        desks = filter_queryset(Desk.objects.all(), request, self.filter_fields)
+        return paginate(desks, request, self, DeskSerializer)
+
+    # stream the desk assignments matching the list filters as CSV or NDJSON
+    @action(detail=False, methods=['get'], url_path=r'export/(?P<file_format>csv|ndjson)',
+            permission_classes=[UserAdminPermission|UserOfficeAdminPermission])
+    def export(self, request, file_format=None):
+        desks = filter_queryset(Desk.objects.all(), request, self.filter_fields)
+        return export_response(desks, DESK_COLUMNS, file_format, 'desks')
+
+    @cached_response('desk')
+    def retrieve(self, request, pk=None):
+        desk = get_object_or_404(Desk, pk=pk)
+        return Response(DeskGetSerializer(desk).data)
 
     # create a new desk
+    # desk writes run in a transaction with the occupancy counter updates
+    @transaction.atomic
     def create(self, request):
         serializer = DeskSerializer(data=request.data)
         # perform validation checks
@@ -37,11 +71,11 @@ class DeskList(viewsets.ViewSet):
                 x_pos_px=serializer.validated_data['x_pos_px'],
                 y_pos_px=serializer.validated_data['y_pos_px'],
             )
-            desk.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     # update a desk
+    @transaction.atomic
     def update(self, request, pk=None):
         desk = get_object_or_404(Desk, pk=pk)
         serializer = DeskSerializer(desk, data=request.data)
@@ -52,7 +86,15 @@ class DeskList(viewsets.ViewSet):
 
     # delete a desk 
     # to-do: can delete only if no user is assigned
+    @transaction.atomic
     def destroy(self, request, pk=None):
         desk = get_object_or_404(Desk, pk=pk)
         desk.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    # desks of the same office whose footprint overlaps this desk
+    @action(detail=True, methods=['get'])
+    def overlapping(self, request, pk=None):
+        desk = get_object_or_404(Desk.objects.only('id', 'office_id'), pk=pk)
+        desks = Desk.objects.filter(id__in=get_office_grid(desk.office_id_id).overlapping(desk.id))
+        return Response(DeskGetSerializer(desks.order_by('id'), many=True).data)
@@ -0,0 +1,251 @@
+import asyncio
+import json
+import time
+from urllib.parse import parse_qs
+import psycopg2
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from .models import User
+
+
+# Server-sent events of request creations and status changes, for ASGI deployments
+# (routed in offices/asgi.py, Django 4.0 cannot stream from async views).
+# Migration 0015 NOTIFYs the api_request channel when a request is created or its
+# status changes, on commit. Every process LISTENs on one connection read by the event
+# loop and hands the events to its open streams: the user of the request, the Office
+# Admins of its office and the Admins. An idle stream is a coroutine and a queue, no
+# thread or database connection. Events missed while reconnecting are read from the
+# ?since=<cursor> feed of /api/requests/.
+
+CHANNEL = 'api_request'
+EVENTS_PATH = '/api/events/requests/'
+KEEPALIVE_SECONDS = getattr(settings, 'EVENTS_KEEPALIVE_SECONDS', 25)
+# a stream further behind is closed, the client reconnects and catches up from the feed
+MAX_QUEUED_EVENTS = 100
+RETRY_MILLISECONDS = 5000
+# The LISTEN connection only reads, a server or network gone silently would never wake it:
+# TCP keepalives probe it after a minute idle and fail it within another, the socket turns
+# readable with the error and Broker.read closes the streams.
+LISTEN_KEEPALIVES = {'keepalives': 1, 'keepalives_idle': 60, 'keepalives_interval': 15, 'keepalives_count': 4,
+                     'tcp_user_timeout': 120 * 1000}
+
+stats = {'streams': 0, 'events': 0, 'dropped': 0}
+
+
+class Subscriber:
+
+    def __init__(self, keys):
+        self.keys = keys
+        # None closes the stream
+        self.queue = asyncio.Queue()
+
+
+# subscriber keys an event is sent to
+def event_keys(event):
+    return (('user', event['user_id']), ('office', event['office_id']), ('all',))
+
+
+def subscriber_keys(role, user_id, office_id):
+    keys = {('user', user_id)}
+    if role == 'Admin':
+        keys.add(('all',))
+    elif role == 'Office Admin' and office_id is not None:
+        keys.add(('office', office_id))
+    return keys
+
+
+class Broker:
+
+    def __init__(self):
+        self.connection = None
+        self.loop = None
+        self.connecting = None
+        # key -> set of Subscriber
+        self.subscribers = {}
+
+    def _connect(self):
+        connection = psycopg2.connect(**{**connections[DEFAULT_DB_ALIAS].get_connection_params(),
+                                         **LISTEN_KEEPALIVES})
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute('LISTEN %s' % CHANNEL)
+        return connection
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            # e.g. a new loop after the old one was closed
+            self.close()
+            self.loop = loop
+        if self.connection is not None and self.connection.closed:
+            self.close()
+        if self.connection is None:
+            if self.connecting is None:
+                self.connecting = loop.create_task(self._start(loop))
+            await asyncio.shield(self.connecting)
+
+    async def _start(self, loop):
+        try:
+            connection = await loop.run_in_executor(None, self._connect)
+        finally:
+            self.connecting = None
+        if self.loop is not loop:
+            connection.close()
+            return
+        self.connection = connection
+        loop.add_reader(connection.fileno(), self.read)
+        self.read()
+
+    def read(self):
+        try:
+            self.connection.poll()
+        except psycopg2.Error:
+            self.close()
+            return
+        while self.connection.notifies:
+            self.publish(json.loads(self.connection.notifies.pop(0).payload))
+
+    def publish(self, event):
+        subscribers = set()
+        for key in event_keys(event):
+            subscribers.update(self.subscribers.get(key, ()))
+        for subscriber in subscribers:
+            if subscriber.queue.qsize() >= MAX_QUEUED_EVENTS:
+                stats['dropped'] += 1
+                self.unsubscribe(subscriber)
+                subscriber.queue.put_nowait(None)
+            else:
+                subscriber.queue.put_nowait(event)
+
+    async def subscribe(self, keys):
+        await self.start()
+        subscriber = Subscriber(keys)
+        for key in keys:
+            self.subscribers.setdefault(key, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        for key in subscriber.keys:
+            subscribers = self.subscribers.get(key)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self.subscribers[key]
+
+    # the open streams end, their clients reconnect to a new LISTEN connection
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.loop.remove_reader(self.connection.fileno())
+            except (RuntimeError, ValueError, psycopg2.Error):
+                # closed loop or connection
+                pass
+            self.connection.close()
+            self.connection = None
+        for subscriber in {subscriber for subscribers in self.subscribers.values() for subscriber in subscribers}:
+            subscriber.queue.put_nowait(None)
+        self.subscribers = {}
+
+
+broker = Broker()
+
+
+def user_office(user_id):
+    try:
+        return User.objects.filter(pk=user_id).values_list('office_id', flat=True).first()
+    finally:
+        connections.close_all()
+
+
+def get_token(scope):
+    for name, value in scope['headers']:
+        if name == b'authorization':
+            parts = value.split()
+            if len(parts) == 2 and parts[0] == b'Bearer':
+                return parts[1]
+    # EventSource cannot send headers
+    tokens = parse_qs(scope['query_string'].decode('latin1')).get('token')
+    return tokens[0].encode() if tokens else None
+
+
+async def send_json(send, status, data):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': json.dumps(data).encode()})
+
+
+def format_event(event):
+    data = {field: event[field] for field in ('id', 'user_id', 'office_id', 'status', 'remote_percentage')}
+    return ('event: %s\ndata: %s\n\n' % ('created' if event['created'] else 'updated',
+                                         json.dumps(data))).encode()
+
+
+# ASGI app of GET /api/events/requests/, authenticated like the API (or with ?token=).
+# The stream ends when the access token expires.
+async def request_events(scope, receive, send):
+    if scope['method'] != 'GET':
+        await send_json(send, 405, {'detail': 'Method "%s" not allowed.' % scope['method']})
+        return
+    raw_token = get_token(scope)
+    if raw_token is None:
+        await send_json(send, 401, {'detail': 'Authentication credentials were not provided.'})
+        return
+    try:
+        token = JWTAuthentication().get_validated_token(raw_token)
+    except InvalidToken as error:
+        await send_json(send, 401, error.detail)
+        return
+
+    role, user_id = token.get('role'), token[api_settings.USER_ID_CLAIM]
+    office_id = None
+    if role == 'Office Admin':
+        office_id = await sync_to_async(user_office, thread_sensitive=False)(user_id)
+    try:
+        subscriber = await broker.subscribe(subscriber_keys(role, user_id, office_id))
+    except psycopg2.Error:
+        await send_json(send, 503, {'detail': 'Request events are unavailable.'})
+        return
+    stats['streams'] += 1
+    disconnected = False
+
+    async def wait_disconnect():
+        nonlocal disconnected
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected = True
+        subscriber.queue.put_nowait(None)
+
+    watcher = asyncio.ensure_future(wait_disconnect())
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            # no proxy buffering
+            (b'x-accel-buffering', b'no'),
+        ]})
+        await send({'type': 'http.response.body', 'body': b'retry: %d\n\n' % RETRY_MILLISECONDS,
+                    'more_body': True})
+        while True:
+            timeout = min(KEEPALIVE_SECONDS, token['exp'] - time.time())
+            if timeout <= 0:
+                break
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                # keeps proxies from closing idle streams
+                await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+                continue
+            if event is None:
+                break
+            await send({'type': 'http.response.body', 'body': format_event(event), 'more_body': True})
+            stats['events'] += 1
+        if not disconnected:
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        stats['streams'] -= 1
+        broker.unsubscribe(subscriber)
+        watcher.cancel()
@@ -0,0 +1,73 @@
+import csv
+import io
+import json
+from itertools import islice
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+
+CHUNK_SIZE = 2000
+
+# (column, ORM lookup) of every export
+USER_COLUMNS = (
+    ('id', 'id'), ('email', 'email'), ('first_name', 'first_name'), ('last_name', 'last_name'), ('role', 'role'),
+    ('office_id', 'office_id'), ('building_id', 'building_id'), ('gender', 'gender'), ('birth_date', 'birth_date'),
+    ('nationality', 'nationality'), ('remote_percentage', 'remote_percentage'), ('is_active', 'is_active'),
+)
+DESK_COLUMNS = (
+    ('id', 'id'), ('building_id', 'office_id__building_id'), ('office_id', 'office_id'),
+    ('desk_number', 'desk_number'), ('is_usable', 'is_usable'), ('user_id', 'user_id'),
+    ('user_email', 'user_id__email'),
+)
+REQUEST_COLUMNS = (
+    ('id', 'id'), ('user_id', 'user_id'), ('user_email', 'user_id__email'), ('office_id', 'office_id'),
+    ('remote_percentage', 'remote_percentage'), ('status', 'status'), ('request_reason', 'request_reason'),
+    ('reject_reason', 'reject_reason'),
+)
+
+
+def chunks(rows):
+    while True:
+        chunk = list(islice(rows, CHUNK_SIZE))
+        if not chunk:
+            return
+        yield chunk
+
+
+def csv_stream(names, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # the header goes out before the first rows are fetched
+    writer.writerow(names)
+    yield buffer.getvalue()
+    for chunk in chunks(rows):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+
+
+def ndjson_stream(names, rows):
+    encoder = DjangoJSONEncoder()
+    for chunk in chunks(rows):
+        yield ''.join(encoder.encode(dict(zip(names, row))) + '\n' for row in chunk)
+
+
+STREAMS = {
+    'csv': (csv_stream, 'text/csv; charset=utf-8'),
+    'ndjson': (ndjson_stream, 'application/x-ndjson'),
+}
+
+
+# Stream a queryset as CSV or NDJSON.
+# Rows come from a server-side cursor (iterator), CHUNK_SIZE at a time, and are
+# written out chunk by chunk, so memory does not grow with the table and the
+# response starts before the query is fully read.
+def export_response(queryset, columns, file_format, name):
+    stream, content_type = STREAMS[file_format]
+    rows = queryset.order_by('id').values_list(*[lookup for column, lookup in columns]).iterator(
+        chunk_size=CHUNK_SIZE)
+    response = StreamingHttpResponse(stream([column for column, lookup in columns], rows),
+                                     content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (name, file_format)
+    return response
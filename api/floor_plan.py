@@ -0,0 +1,68 @@
+from django.core.cache import cache
+from django.utils.html import escape
+from .models import Desk
+from .spatial import PX_PER_METER
+
+
+FLOOR_PLAN_TIMEOUT = 7 * 24 * 60 * 60
+STYLE = ('.wall{fill:#fafafa;stroke:#9e9e9e;stroke-width:2}'
+         '.desk{stroke:#424242;stroke-width:1}'
+         '.free{fill:#c8e6c9}.occupied{fill:#90caf9}.unusable{fill:#e0e0e0}'
+         'text{font:11px sans-serif;fill:#212121;text-anchor:middle;dominant-baseline:central}')
+
+
+def initials(first_name, last_name):
+    return (first_name[:1] + last_name[:1]).upper()
+
+
+def _number(value):
+    return ('%.1f' % value).rstrip('0').rstrip('.')
+
+
+# SVG of the office walls and desks, coloured by state, with the occupant's initials.
+# desks: (id, desk_number, x_pos_px, y_pos_px, x_size_m, y_size_m, is_usable, first_name, last_name),
+# the names are None for free desks.
+def render_floor_plan(office, desks):
+    width, height = office.x_size_m * PX_PER_METER, office.y_size_m * PX_PER_METER
+    shapes = []
+    for desk_id, desk_number, x, y, x_size_m, y_size_m, is_usable, first_name, last_name in desks:
+        desk_width, desk_height = x_size_m * PX_PER_METER, y_size_m * PX_PER_METER
+        width, height = max(width, x + desk_width), max(height, y + desk_height)
+        state = 'unusable' if not is_usable else 'free' if first_name is None else 'occupied'
+        title = 'Desk %d' % desk_number
+        if first_name is not None:
+            title += ': %s %s' % (first_name, last_name)
+        shapes.append('<g data-desk-id="%d"><title>%s</title><rect class="desk %s" x="%d" y="%d" width="%s" '
+                      'height="%s"/>' % (desk_id, escape(title), state, x, y, _number(desk_width), _number(desk_height)))
+        if first_name is not None:
+            shapes.append('<text x="%s" y="%s">%s</text>' % (
+                _number(x + desk_width / 2), _number(y + desk_height / 2), escape(initials(first_name, last_name))))
+        shapes.append('</g>')
+    width, height = _number(width), _number(height)
+    return ''.join([
+        '<svg xmlns="http://www.w3.org/2000/svg" width="%s" height="%s" viewBox="0 0 %s %s">' % (
+            width, height, width, height),
+        '<style>%s</style>' % STYLE,
+        '<rect class="wall" x="0" y="0" width="%s" height="%s"/>' % (width, height),
+        *shapes,
+        '</svg>',
+    ])
+
+
+def floor_plan_key(office):
+    return 'api:floor_plan:%d:%d' % (office.id, office.layout_version)
+
+
+# The rendered SVG is cached under the office's layout_version, which desk changes,
+# office updates and name changes of the occupants bump, so a repeated view costs the
+# primary key lookup of the office and one cache hit.
+def get_floor_plan(office):
+    key = floor_plan_key(office)
+    svg = cache.get(key)
+    if svg is None:
+        desks = Desk.objects.filter(office_id=office.id).order_by('desk_number', 'id').values_list(
+            'id', 'desk_number', 'x_pos_px', 'y_pos_px', 'x_size_m', 'y_size_m', 'is_usable',
+            'user_id__first_name', 'user_id__last_name')
+        svg = render_floor_plan(office, desks)
+        cache.set(key, svg, timeout=FLOOR_PLAN_TIMEOUT)
+    return svg
@@ -0,0 +1,79 @@
+import json
+import platform
+from datetime import datetime, timezone
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from api.benchmark import seed_organisation, run_endpoints
+from api.query_plans import analyze
+
+
+class Command(BaseCommand):
+    help = ('Seed a synthetic organisation, run every API endpoint through the test client and report '
+            'latency percentiles, SQL query count and SQL time per endpoint. The seeded rows are rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buildings', type=int, default=2)
+        parser.add_argument('--floors', type=int, default=3)
+        parser.add_argument('--offices-per-floor', type=int, default=2)
+        parser.add_argument('--desks', type=int, default=100, help='Desks per office.')
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--reservations', type=int, default=500)
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--cold', action='store_true', help='Clear the response cache before every request.')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--compare', help='Previous JSON results to compare against.')
+        parser.add_argument('--threshold', type=float, default=20,
+                            help='Percent p50 slowdown (or any extra query) reported as a regression.')
+
+    def handle(self, *args, **options):
+        counts = {name: options[name] for name in
+                  ('buildings', 'floors', 'offices_per_floor', 'desks', 'users', 'requests', 'reservations', 'seed')}
+        with transaction.atomic():
+            org = seed_organisation(counts['buildings'], counts['floors'], counts['offices_per_floor'],
+                                    counts['desks'], counts['users'], counts['requests'], counts['reservations'],
+                                    seed=counts['seed'])
+            # planner statistics of the seeded rows, as autovacuum would have them
+            analyze()
+            results = run_endpoints(org, options['iterations'], cache.clear if options['cold'] else None)
+            transaction.set_rollback(True)
+        cache.clear()
+
+        report = {
+            'meta': dict(counts, iterations=options['iterations'], cold=options['cold'],
+                         python=platform.python_version(), created=datetime.now(timezone.utc).isoformat()),
+            'endpoints': results,
+        }
+        self.write_table(results)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2, sort_keys=True)
+        if options['compare']:
+            with open(options['compare']) as baseline:
+                regressions = self.compare(json.load(baseline)['endpoints'], results, options['threshold'])
+            if regressions:
+                raise CommandError('%d endpoint(s) regressed: %s' % (len(regressions), ', '.join(regressions)))
+
+    def write_table(self, results):
+        self.stdout.write('%-30s %6s %9s %9s %9s %8s %9s' % (
+            'endpoint', 'status', 'p50 ms', 'p90 ms', 'p99 ms', 'queries', 'sql ms'))
+        for name, row in results.items():
+            self.stdout.write('%-30s %6d %9.2f %9.2f %9.2f %8d %9.2f' % (
+                name, row['status'], row['p50_ms'], row['p90_ms'], row['p99_ms'], row['queries'], row['sql_ms']))
+
+    def compare(self, baseline, results, threshold):
+        regressions = []
+        self.stdout.write('\n%-30s %12s %12s' % ('endpoint', 'p50 change', 'queries'))
+        for name, row in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            change = (row['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0
+            regressed = change > threshold or row['queries'] > before['queries']
+            self.stdout.write('%-30s %+11.1f%% %5d -> %-4d%s' % (
+                name, change, before['queries'], row['queries'], '  REGRESSION' if regressed else ''))
+            if regressed:
+                regressions.append(name)
+        return regressions
@@ -0,0 +1,47 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from api.allocation import allocate_week, office_days, WORK_DAYS
+
+
+class Command(BaseCommand):
+    help = 'Time the hot-desking allocation engine on a synthetic building.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=10000)
+        parser.add_argument('--offices', type=int, default=40)
+        parser.add_argument('--desks', type=int, default=6000)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        offices = options['offices']
+        desks = [(desk_id, desk_id % offices) for desk_id in range(options['desks'])]
+        owners = {desk_id: None for desk_id, office_id in desks}
+        employees = []
+        for user_id in range(options['employees']):
+            office_id = user_id % offices
+            # every tenth employee keeps a permanent desk in their office
+            fixed_desk = user_id // offices * offices + office_id if user_id % 10 == 0 else None
+            if fixed_desk not in owners or owners[fixed_desk] is not None:
+                fixed_desk = None
+            elif fixed_desk is not None:
+                owners[fixed_desk] = user_id
+            employees.append((user_id, office_id, office_days(rng.choice((0, 20, 40, 60, 80, 100))), fixed_desk))
+
+        timings = []
+        for i in range(options['repeat']):
+            started = time.perf_counter()
+            plan, unmet = allocate_week(employees, desks)
+            timings.append(time.perf_counter() - started)
+
+        demand = [0] * WORK_DAYS
+        split = 0
+        for days in plan.values():
+            split += len(set(days.values())) > 1
+            for day in days:
+                demand[day] += 1
+        self.stdout.write('%d employees, %d desks, %d offices: best %.3fs' % (
+            len(employees), len(desks), offices, min(timings)))
+        self.stdout.write('daily demand %s, unmet days %d, employees moving desks %d' % (demand, unmet, split))
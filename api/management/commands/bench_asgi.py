@@ -0,0 +1,93 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from api.benchmark import (seed_organisation, auth_headers, read_endpoints, percentile, add_scratch_database_argument,
+                           check_scratch_database)
+from api.models import User, Building
+
+
+# One HTTP/1.1 GET on a fresh connection, returns the status code.
+async def fetch(host, port, path, headers):
+    reader, writer = await asyncio.open_connection(host, port)
+    lines = ['GET %s HTTP/1.1' % path, 'Host: %s:%d' % (host, port), 'Connection: close']
+    lines += ['%s: %s' % header for header in headers.items()]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin1'))
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return int(response.split(b' ', 2)[1])
+
+
+async def load(url, requests, concurrency):
+    parts = urlsplit(url)
+    host, port, prefix = parts.hostname, parts.port or 80, parts.path.rstrip('/')
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(path, headers):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                status = await fetch(host, port, prefix + path, headers)
+            except OSError:
+                status = 0
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += status != 200
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(path, headers) for path, headers in requests))
+    return time.perf_counter() - started, latencies, errors
+
+
+class Command(BaseCommand):
+    help = ('Load the read endpoints of a WSGI and an ASGI deployment side by side, e.g. '
+            'gunicorn offices.wsgi -b :8001 and '
+            'gunicorn offices.asgi:application -k uvicorn.workers.UvicornWorker -b :8002.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi-url', help='Base URL of the WSGI deployment, e.g. http://127.0.0.1:8001')
+        parser.add_argument('--asgi-url', help='Base URL of the ASGI deployment, e.g. http://127.0.0.1:8002')
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--desks-per-office', type=int, default=100)
+        add_scratch_database_argument(parser)
+
+    def handle(self, *args, **options):
+        deployments = [(name, options[name + '_url'], prefix) for name, prefix in
+                       (('wsgi', '/api/'), ('asgi', '/api/async/')) if options[name + '_url']]
+        if not deployments:
+            raise CommandError('Give --wsgi-url and/or --asgi-url.')
+        check_scratch_database(options)
+
+        # the servers read the seeded rows from their own connections, so they are committed
+        # and deleted again at the end
+        with transaction.atomic():
+            org = seed_organisation(users=options['users'], desks_per_office=options['desks_per_office'],
+                                    requests=options['users'] // 2)
+        try:
+            headers = {role: {'Authorization': auth_headers(org[role])['HTTP_AUTHORIZATION']}
+                       for role in ('admin', 'office_admin', 'employee')}
+            endpoints = read_endpoints(org)
+            results = {}
+            for name, url, prefix in deployments:
+                requests = [(prefix + path, headers[role])
+                            for label, role, path in (endpoints[i % len(endpoints)] for i in range(options['requests']))]
+                # one warm up round per endpoint
+                asyncio.run(load(url, requests[:len(endpoints)], options['concurrency']))
+                seconds, latencies, errors = asyncio.run(load(url, requests, options['concurrency']))
+                results[name] = len(requests) / seconds
+                self.stdout.write('%s: %d requests, concurrency %d: %.0f req/s, p50 %.1fms, p95 %.1fms, '
+                                  'p99 %.1fms, max %.1fms, %d errors' % (
+                                      name, len(requests), options['concurrency'], results[name],
+                                      percentile(latencies, 50), percentile(latencies, 95),
+                                      percentile(latencies, 99), max(latencies), errors))
+            if len(results) == 2:
+                self.stdout.write('asgi/wsgi throughput: %.2fx' % (results['asgi'] / results['wsgi']))
+        finally:
+            prefix = org['building'].address.rsplit(' street', 1)[0]
+            User.objects.filter(email__startswith=prefix + '-').delete()
+            Building.objects.filter(address__startswith=prefix + ' ').delete()
@@ -0,0 +1,63 @@
+import time
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from api.benchmark import (seed_organisation, auth_headers, read_endpoints, percentile, add_scratch_database_argument,
+                           check_scratch_database)
+from api.models import User, Building
+from api.postgresql_pool.pool import close_pools, get_pool
+
+
+class Command(BaseCommand):
+    help = ('Run the read endpoints with and without the database connection pool and compare the per '
+            'request latency. Every request ends with the connection closed, as with CONN_MAX_AGE = 0.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='Requests per endpoint and mode.')
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--desks-per-office', type=int, default=50)
+        add_scratch_database_argument(parser)
+
+    def handle(self, *args, **options):
+        pool_options = connection.settings_dict.get('POOL')
+        if not pool_options:
+            raise CommandError('The default database has no POOL settings.')
+        check_scratch_database(options)
+
+        # committed, so a new connection sees them, and deleted again at the end
+        with transaction.atomic():
+            org = seed_organisation(users=options['users'], desks_per_office=options['desks_per_office'],
+                                    requests=options['users'] // 2)
+        connection.close()
+        try:
+            client = Client(HTTP_HOST='127.0.0.1')
+            headers = {role: auth_headers(org[role]) for role in ('admin', 'office_admin', 'employee')}
+            endpoints = read_endpoints(org)
+            results = {}
+            for mode, settings in (('direct', None), ('pooled', pool_options)):
+                connection.settings_dict['POOL'] = settings
+                latencies = []
+                # one warm up round per endpoint
+                for iteration in range(options['iterations'] + 1):
+                    for name, role, path in endpoints:
+                        started = time.perf_counter()
+                        client.get('/api/' + path, **headers[role])
+                        connection.close()
+                        if iteration:
+                            latencies.append((time.perf_counter() - started) * 1000)
+                cache.clear()
+                results[mode] = sum(latencies) / len(latencies)
+                self.stdout.write('%s: %d requests, mean %.2fms, p50 %.2fms, p90 %.2fms, p99 %.2fms' % (
+                    mode, len(latencies), results[mode], percentile(latencies, 50), percentile(latencies, 90),
+                    percentile(latencies, 99)))
+            stats = get_pool(connection.get_connection_params(), pool_options).stats()
+            self.stdout.write('pool: %(checkouts)d checkouts, %(connects)d connects, %(size)d open' % stats)
+            self.stdout.write('pooled saves %.2fms per request' % (results['direct'] - results['pooled']))
+        finally:
+            connection.settings_dict['POOL'] = pool_options
+            prefix = org['building'].address.rsplit(' street', 1)[0]
+            User.objects.filter(email__startswith=prefix + '-').delete()
+            Building.objects.filter(address__startswith=prefix + ' ').delete()
+            connection.close()
+            close_pools()
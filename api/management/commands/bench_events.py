@@ -0,0 +1,105 @@
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlsplit
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from api.benchmark import (seed_organisation, auth_headers, percentile, add_scratch_database_argument,
+                           check_scratch_database)
+from api.models import User, Building, Request
+
+
+# Opens an event stream, calls on_event(data) for every event until cancelled.
+async def listen(host, port, path, headers, connected, on_event):
+    reader, writer = await asyncio.open_connection(host, port)
+    lines = ['GET %s HTTP/1.1' % path, 'Host: %s:%d' % (host, port)]
+    lines += ['%s: %s' % header for header in headers.items()]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin1'))
+    await writer.drain()
+    status = int((await reader.readline()).split(b' ', 2)[1])
+    connected(status)
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.startswith(b'data: '):
+                on_event(json.loads(line[len(b'data: '):]))
+    finally:
+        writer.close()
+
+
+class Command(BaseCommand):
+    help = ('Hold --streams idle request event streams open on an ASGI deployment, e.g. '
+            'uvicorn offices.asgi:application --port 8002, then create requests and measure how long '
+            'the events take to reach their streams.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8002', help='Base URL of the ASGI deployment.')
+        parser.add_argument('--streams', type=int, default=2000)
+        parser.add_argument('--events', type=int, default=200)
+        add_scratch_database_argument(parser)
+
+    def handle(self, *args, **options):
+        check_scratch_database(options)
+        # the server reads the seeded rows from its own connections, so they are committed
+        # and deleted again at the end
+        with transaction.atomic():
+            org = seed_organisation(users=options['streams'], desks_per_office=10, requests=0)
+        prefix = org['building'].address.rsplit(' street', 1)[0]
+        try:
+            users = list(User.objects.filter(email__startswith=prefix + '-', role='Employee').order_by('id'))
+            headers = {user.id: {'Authorization': auth_headers(user)['HTTP_AUTHORIZATION']} for user in users}
+            connection.close()
+            asyncio.run(self.run(options, users, headers))
+        finally:
+            User.objects.filter(email__startswith=prefix + '-').delete()
+            Building.objects.filter(address__startswith=prefix + ' ').delete()
+
+    async def run(self, options, users, headers):
+        parts = urlsplit(options['url'])
+        host, port, path = parts.hostname, parts.port or 80, parts.path.rstrip('/') + '/api/events/requests/'
+        loop = asyncio.get_running_loop()
+        statuses, received = [], {}
+        all_connected = loop.create_future()
+
+        def connected(status):
+            statuses.append(status)
+            if len(statuses) == len(users):
+                all_connected.set_result(None)
+
+        def on_event(data):
+            received[data['id']] = time.perf_counter()
+
+        started = time.perf_counter()
+        streams = [asyncio.ensure_future(listen(host, port, path, headers[user.id], connected, on_event))
+                   for user in users]
+        await all_connected
+        self.stdout.write('%d streams open in %.2fs, %d errors' % (
+            len(users), time.perf_counter() - started, sum(status != 200 for status in statuses)))
+
+        def create_requests(users):
+            committed = {}
+            try:
+                for user in users:
+                    # autocommit, the event is sent on commit, latencies include the insert
+                    started = time.perf_counter()
+                    request = Request.objects.create(user_id=user, office_id_id=user.office_id_id,
+                                                     remote_percentage=20, request_reason='Benchmark')
+                    committed[request.id] = started
+            finally:
+                connection.close()
+            return committed
+
+        sample = random.Random(0).sample(users, min(options['events'], len(users)))
+        committed = await loop.run_in_executor(None, create_requests, sample)
+        await asyncio.sleep(1)
+        latencies = [(received[request_id] - at) * 1000 for request_id, at in committed.items()
+                     if request_id in received]
+        self.stdout.write('%d events, %d delivered: p50 %.1fms, p95 %.1fms, p99 %.1fms, max %.1fms' % (
+            len(committed), len(latencies), percentile(latencies, 50), percentile(latencies, 95),
+            percentile(latencies, 99), max(latencies, default=0)))
+        for stream in streams:
+            stream.cancel()
+        await asyncio.gather(*streams, return_exceptions=True)
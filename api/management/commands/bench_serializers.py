@@ -0,0 +1,51 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from api.models import User, Building, Office, Desk
+from api.serializers import ProjectionSerializer, UserListSerializer, DeskSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare list rendering through the DRF serializers and the projection fast path.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        # seeded rows are rolled back at the end
+        with transaction.atomic():
+            building = Building.objects.create(name='Bench', floors_count=1, address='Bench %d' % time.time())
+            office = Office.objects.create(name='Bench', building_id=building, floor_number=1)
+            users = User.objects.bulk_create([
+                User(email='bench%d@bench.local' % i, first_name='Bench', last_name='User', office_id=office,
+                     building_id=building, remote_percentage=i % 101)
+                for i in range(rows)
+            ], batch_size=5000)
+            Desk.objects.bulk_create([
+                Desk(office_id=office, desk_number=i, user_id=users[i] if i % 2 else None,
+                     x_size_m=1.6, y_size_m=0.8, x_pos_px=i % 100 * 20, y_pos_px=i // 100 * 20)
+                for i in range(rows)
+            ], batch_size=5000)
+
+            for label, queryset, serializer_class in (
+                    ('users', User.objects.filter(office_id=office).order_by('id'), UserListSerializer),
+                    ('desks', Desk.objects.filter(office_id=office).order_by('id'), DeskSerializer)):
+                serializer_time = self.best(options['repeat'], lambda: JSONRenderer().render(
+                    serializer_class(queryset, many=True).data))
+                projection = ProjectionSerializer(serializer_class)
+                projection_time = self.best(options['repeat'], lambda: JSONRenderer().render(
+                    projection.render(list(projection.values(queryset)))))
+                self.stdout.write('%s (%d rows): serializer %.3fs, projection %.3fs, %.1fx faster' % (
+                    label, rows, serializer_time, projection_time, serializer_time / projection_time))
+            transaction.set_rollback(True)
+
+    def best(self, repeat, run):
+        timings = []
+        for i in range(repeat):
+            started = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
@@ -0,0 +1,25 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from api.user_import import parse_rows, import_users, WORKERS
+
+
+class Command(BaseCommand):
+    help = 'Create users in bulk from a CSV or JSON file, invalid rows are reported and skipped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('csv', 'json'), help='Defaults to the file extension.')
+        parser.add_argument('--workers', type=int, default=WORKERS, help='Password hashing processes.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('json' if path.lower().endswith('.json') else 'csv')
+        try:
+            with open(path, encoding='utf-8-sig') as file:
+                rows = parse_rows(file.read(), file_format)
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+        result = import_users(rows, workers=options['workers'])
+        for error in result['errors']:
+            self.stderr.write('row %d: %s' % (error['row'], json.dumps(error['errors'])))
+        self.stdout.write('%d users created, %d rows rejected' % (result['created'], len(result['errors'])))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from api.models import Office_Image
+from api.office_images import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Generate the thumbnails of uploaded office images still pending, e.g. after a worker restart.'
+
+    def handle(self, *args, **options):
+        pending = list(Office_Image.objects.filter(status=Office_Image.PENDING).order_by('id').values_list('id', flat=True))
+        for image_id in pending:
+            generate_thumbnails(image_id)
+        failed = Office_Image.objects.filter(id__in=pending, status=Office_Image.FAILED).count()
+        self.stdout.write(self.style.SUCCESS('%d images processed, %d failed.' % (len(pending), failed)))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from api.sync import prune_tombstones
+
+
+class Command(BaseCommand):
+    help = ('Delete the tombstones of the delta sync feeds older than --days. Clients whose cursor is '
+            'older get 410 Gone and reload their lists.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30)
+
+    def handle(self, *args, **options):
+        deleted = prune_tombstones(options['days'])
+        self.stdout.write(self.style.SUCCESS('%d tombstones deleted.' % deleted))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api.analytics import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the office analytics summary rows from the User and Request tables.'
+
+    def handle(self, *args, **options):
+        fixed = rebuild_stats()
+        self.stdout.write(self.style.SUCCESS('Analytics rebuilt, %d rows corrected.' % fixed))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api.occupancy import rebuild_occupancy
+
+
+class Command(BaseCommand):
+    help = 'Recompute office and building desk occupancy counters from the Desk table.'
+
+    def handle(self, *args, **options):
+        fixed = rebuild_occupancy()
+        self.stdout.write(self.style.SUCCESS('Occupancy rebuilt, %d rows corrected.' % fixed))
@@ -0,0 +1,192 @@
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        # labels -> [count per bucket (+inf last), sum]
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self, label_names):
+        lines = ['# HELP %s %s' % (self.name, self.description), '# TYPE %s histogram' % self.name]
+        with self.lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self.series.items())
+        for labels, counts, total in series:
+            label_text = ','.join('%s="%s"' % (name, value) for name, value in zip(label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append('%s_bucket{%s,le="%s"} %d' % (self.name, label_text, bound, cumulative))
+            lines.append('%s_sum{%s} %s' % (self.name, label_text, repr(float(total))))
+            lines.append('%s_count{%s} %d' % (self.name, label_text, cumulative))
+        return lines
+
+
+# Per worker registry, every gunicorn worker exposes its own series.
+LABELS = ('view', 'method')
+REQUEST_DURATION = Histogram('offices_request_duration_seconds', 'Total request time.', DURATION_BUCKETS)
+PHASE_DURATION = {
+    'auth': Histogram('offices_auth_duration_seconds', 'Time spent authenticating the request.', DURATION_BUCKETS),
+    'serialize': Histogram('offices_serialize_duration_seconds', 'Time spent serializing response data.',
+                           DURATION_BUCKETS),
+}
+DB_DURATION = Histogram('offices_db_duration_seconds', 'Time spent in SQL queries.', DURATION_BUCKETS)
+DB_QUERIES = Histogram('offices_db_queries', 'SQL queries per request.', QUERY_BUCKETS)
+HISTOGRAMS = (REQUEST_DURATION, *PHASE_DURATION.values(), DB_DURATION, DB_QUERIES)
+
+# database connection pools (api.postgresql_pool), labelled by database name
+POOL_LABELS = ('database',)
+POOL_WAIT = Histogram('offices_db_pool_wait_seconds', 'Time spent waiting for a pooled database connection.',
+                      DURATION_BUCKETS)
+POOL_GAUGES = {
+    'size': 'Open pooled connections.',
+    'idle': 'Idle pooled connections.',
+    'in_use': 'Pooled connections checked out.',
+    'waiting': 'Threads waiting for a pooled connection.',
+}
+POOL_COUNTERS = {
+    'checkouts': 'Pooled connection checkouts.',
+    'timeouts': 'Checkouts that gave up waiting for a connection.',
+    'connects': 'Connections opened by the pool.',
+    'health_check_failures': 'Pooled connections found broken on checkout.',
+}
+
+# server-sent request events (api.events)
+EVENT_METRICS = (
+    ('offices_event_streams', 'gauge', 'streams', 'Open request event streams.'),
+    ('offices_events_sent_total', 'counter', 'events', 'Request events sent to streams.'),
+    ('offices_event_streams_dropped_total', 'counter', 'dropped', 'Streams closed for falling behind.'),
+)
+
+
+# Timings collected for one request, attached to the HttpRequest by MetricsMiddleware.
+# The middleware also sets them as the current metrics of the request context,
+# which sync_to_async carries over to the threads running the ORM under ASGI.
+class RequestMetrics:
+
+    def __init__(self):
+        self.phases = {}
+        # phases being timed, nested timings of a phase are part of the outer one
+        self.running = set()
+        self.queries = 0
+        self.db_seconds = 0
+
+    # connection.execute_wrapper hook
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_seconds += time.perf_counter() - started
+
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+# execute_wrapper installed on every database connection when it is opened
+def record_query(execute, sql, params, many, context):
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def instrument_connection(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def timed_phase(metrics, phase):
+    if metrics is None or phase in metrics.running:
+        yield
+        return
+    metrics.running.add(phase)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.running.discard(phase)
+        metrics.phases[phase] = metrics.phases.get(phase, 0) + time.perf_counter() - started
+
+
+def record_phase(request, phase):
+    return timed_phase(getattr(getattr(request, '_request', request), 'metrics', None), phase)
+
+
+# for code without the request at hand, e.g. the serializers
+def record_current_phase(phase):
+    return timed_phase(current_metrics.get(), phase)
+
+
+def observe_request(view, method, seconds, metrics):
+    labels = (view, method)
+    REQUEST_DURATION.observe(labels, seconds)
+    for phase, histogram in PHASE_DURATION.items():
+        if phase in metrics.phases:
+            histogram.observe(labels, metrics.phases[phase])
+    DB_DURATION.observe(labels, metrics.db_seconds)
+    DB_QUERIES.observe(labels, metrics.queries)
+
+
+def render_pools():
+    from .postgresql_pool.pool import all_pools
+    stats = sorted((pool.name, pool.stats()) for pool in all_pools())
+    lines = POOL_WAIT.render(POOL_LABELS)
+    for kind, metrics in (('gauge', POOL_GAUGES), ('counter', POOL_COUNTERS)):
+        for field, description in metrics.items():
+            name = 'offices_db_pool_%s%s' % (field, '_total' if kind == 'counter' else '')
+            lines += ['# HELP %s %s' % (name, description), '# TYPE %s %s' % (name, kind)]
+            lines += ['%s{database="%s"} %d' % (name, database, values[field]) for database, values in stats]
+    return lines
+
+
+def render_events():
+    from .events import stats
+    lines = []
+    for name, kind, field, description in EVENT_METRICS:
+        lines += ['# HELP %s %s' % (name, description), '# TYPE %s %s' % (name, kind), '%s %d' % (name, stats[field])]
+    return lines
+
+
+def metrics_allowed(request):
+    if request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS:
+        return True
+    token = settings.METRICS_TOKEN
+    return bool(token) and hmac.compare_digest(request.headers.get('Authorization', ''), 'Bearer ' + token)
+
+
+def metrics_view(request):
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render(LABELS))
+    lines.extend(render_pools())
+    lines.extend(render_events())
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
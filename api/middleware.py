@@ -0,0 +1,179 @@
+import asyncio
+import random
+import time
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+from whitenoise.middleware import WhiteNoiseMiddleware
+from .authentication import get_auth_context
+from .db_router import read_database, replica_aliases, sticky_key
+from .metrics import RequestMetrics, current_metrics, observe_request
+
+
+# Records total, auth, serialization and SQL time of every request, sends them
+# in a Server-Timing header and feeds the /metrics histograms.
+# Runs natively in both modes, so it never puts the async views behind a thread.
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # how Django recognises an async middleware instance
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, started)
+
+    async def __acall__(self, request):
+        started, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, started)
+
+    def start(self, request):
+        request.metrics = metrics = RequestMetrics()
+        request.metrics_view = 'unresolved'
+        return time.perf_counter(), current_metrics.set(metrics)
+
+    def finish(self, request, response, started):
+        metrics = request.metrics
+        total = time.perf_counter() - started
+        timings = ['total;dur=%.2f' % (total * 1000)]
+        timings += ['%s;dur=%.2f' % (phase, seconds * 1000) for phase, seconds in metrics.phases.items()]
+        timings.append('db;dur=%.2f;desc="%d queries"' % (metrics.db_seconds * 1000, metrics.queries))
+        response['Server-Timing'] = ', '.join(timings)
+        observe_request(request.metrics_view, request.method, total, metrics)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None)
+        if view_class is None:
+            request.metrics_view = getattr(view_func, '__name__', 'view')
+            return None
+        # viewsets map the HTTP method to an action
+        action = getattr(view_func, 'actions', {}).get(request.method.lower(), request.method.lower())
+        request.metrics_view = '%s.%s' % (view_class.__name__, action)
+        return None
+
+
+# Sends the reads of safe requests (GET, HEAD, OPTIONS) to a random replica, one
+# replica for the whole request. Other requests read from the primary, and pin the
+# user's reads to the primary for REPLICA_STICKY_SECONDS so they see their own writes.
+# The pins live in the cache, which has to be shared by the workers for this to hold
+# across them. Without DATABASE_REPLICAS the middleware does nothing.
+class ReplicaReadMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        replicas, key = self.start(request)
+        if not replicas:
+            return self.get_response(request)
+        pinned = key is not None and request.method in SAFE_METHODS and cache.get(key) is not None
+        token = read_database.set(self.choose(request, replicas, pinned))
+        try:
+            return self.route_stream(request, self.get_response(request))
+        finally:
+            read_database.reset(token)
+            if key is not None and request.method not in SAFE_METHODS:
+                cache.set(key, True, settings.REPLICA_STICKY_SECONDS)
+
+    async def __acall__(self, request):
+        replicas, key = self.start(request)
+        if not replicas:
+            return await self.get_response(request)
+        pinned = key is not None and request.method in SAFE_METHODS and await cache.aget(key) is not None
+        token = read_database.set(self.choose(request, replicas, pinned))
+        try:
+            return self.route_stream(request, await self.get_response(request))
+        finally:
+            read_database.reset(token)
+            if key is not None and request.method not in SAFE_METHODS:
+                await cache.aset(key, True, settings.REPLICA_STICKY_SECONDS)
+
+    def start(self, request):
+        replicas = replica_aliases()
+        if not replicas:
+            return replicas, None
+        try:
+            context = get_auth_context(request)
+        except APIException:
+            # invalid tokens are rejected by the views
+            context = None
+        user_id = context.user_id if context is not None else None
+        return replicas, sticky_key(user_id) if user_id is not None else None
+
+    def choose(self, request, replicas, pinned):
+        if request.method not in SAFE_METHODS or pinned:
+            database = DEFAULT_DB_ALIAS
+        else:
+            database = random.choice(replicas)
+        request.read_database = database
+        return database
+
+    # streamed responses (exports) read their rows after the middleware returned
+    def route_stream(self, request, response):
+        if getattr(response, 'streaming', False):
+            response.streaming_content = routed_chunks(request.read_database, response.streaming_content)
+        return response
+
+
+def routed_chunks(database, content):
+    chunks = iter(content)
+    while True:
+        token = read_database.set(database)
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            return
+        finally:
+            read_database.reset(token)
+        yield chunk
+
+
+# WhiteNoise only ships a sync middleware, which would run every async request
+# behind a thread. Static files are still served from a thread, the API is not.
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if request.path_info.startswith(self.static_prefix):
+            response = await sync_to_async(self.process_request)(request)
+            if response is not None:
+                return response
+        return await self.get_response(request)
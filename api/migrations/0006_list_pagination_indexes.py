@@ -0,0 +1,37 @@
+# Generated by Django 4.0.7 on 2026-10-18 09:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_alter_building_address'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='desk',
+            index=models.Index(fields=['office_id', 'id'], name='desk_office_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='office',
+            index=models.Index(fields=['building_id', 'id'], name='office_building_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(fields=['status', 'id'], name='request_status_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(fields=['office_id', 'id'], name='request_office_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['office_id', 'id'], name='user_office_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['building_id', 'id'], name='user_building_id_idx'),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 4.0.7 on 2026-10-18 09:19
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+# initial counter values, see api.occupancy.rebuild_occupancy
+def populate_counters(apps, schema_editor):
+    Building = apps.get_model('api', 'Building')
+    Office = apps.get_model('api', 'Office')
+    Desk = apps.get_model('api', 'Desk')
+    for office in Office.objects.all():
+        office_desks = Desk.objects.filter(office_id=office.id)
+        counts = office_desks.aggregate(
+            total_desks=Count('id'),
+            usable_desks=Count('id', filter=Q(is_usable=True)),
+            occupied_desks=Count('id', filter=Q(user_id__isnull=False)),
+            free_desks=Count('id', filter=Q(is_usable=True, user_id__isnull=True)),
+        )
+        counts['desk_ids'] = list(office_desks.order_by('id').values_list('id', flat=True))
+        Office.objects.filter(pk=office.id).update(**counts)
+    for building in Building.objects.all():
+        totals = Office.objects.filter(building_id=building.id).aggregate(
+            total_desks=Sum('total_desks'),
+            usable_desks=Sum('usable_desks'),
+            occupied_desks=Sum('occupied_desks'),
+            free_desks=Sum('free_desks'),
+        )
+        Building.objects.filter(pk=building.id).update(**{field: value or 0 for field, value in totals.items()})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_list_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='building',
+            name='free_desks',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='building',
+            name='occupied_desks',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='building',
+            name='total_desks',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='building',
+            name='usable_desks',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='office',
+            name='free_desks',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='office',
+            name='occupied_desks',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='office',
+            name='total_desks',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='office',
+            name='usable_desks',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
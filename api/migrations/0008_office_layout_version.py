@@ -0,0 +1,18 @@
+# Generated by Django 4.0.7 on 2026-10-18 09:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_occupancy_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='office',
+            name='layout_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.0.7 on 2026-10-18 09:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_office_layout_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApiCacheVersion',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.0.7 on 2026-10-18 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_api_cache_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(condition=models.Q(('remote_percentage__gt', 0), ('status', 'P')), fields=['id'], name='request_pending_remote_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(condition=models.Q(('status', 'P')), fields=['office_id', 'id'], name='request_pending_office_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(fields=['user_id', 'status'], name='request_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['id'], name='user_active_idx'),
+        ),
+    ]
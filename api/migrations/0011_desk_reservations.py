@@ -0,0 +1,40 @@
+# Generated by Django 4.0.7 on 2026-10-18 09:35
+
+from django.conf import settings
+import django.contrib.postgres.constraints
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.expressions
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeskReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dates', django.contrib.postgres.fields.ranges.DateRangeField()),
+                ('desk_id', models.ForeignKey(db_column='desk_id', on_delete=django.db.models.deletion.CASCADE, to='api.desk')),
+                ('user_id', models.ForeignKey(db_column='user_id', on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='deskreservation',
+            index=django.contrib.postgres.indexes.GistIndex(fields=['dates'], name='reservation_dates_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='deskreservation',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(expressions=[(django.db.models.expressions.Func(django.db.models.expressions.F('desk_id'), django.db.models.expressions.F('desk_id'), django.db.models.expressions.Value('[]'), function='int8range'), '='), ('dates', '&&')], name='reservation_desk_no_overlap'),
+        ),
+        migrations.AddConstraint(
+            model_name='deskreservation',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(expressions=[(django.db.models.expressions.Func(django.db.models.expressions.F('user_id'), django.db.models.expressions.F('user_id'), django.db.models.expressions.Value('[]'), function='int8range'), '='), ('dates', '&&')], name='reservation_user_no_overlap'),
+        ),
+    ]
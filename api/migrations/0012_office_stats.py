@@ -0,0 +1,57 @@
+# Generated by Django 4.0.7 on 2026-10-18 09:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Q, Sum
+
+
+# initial summary rows, see api.analytics.rebuild_stats
+def populate_stats(apps, schema_editor):
+    Office = apps.get_model('api', 'Office')
+    OfficeStats = apps.get_model('api', 'OfficeStats')
+    User = apps.get_model('api', 'User')
+    Request = apps.get_model('api', 'Request')
+    for office in Office.objects.all():
+        users = User.objects.filter(office_id=office.id, is_active=True)
+        values = users.aggregate(
+            employees=Count('id'),
+            remote_percentage_sum=Sum('remote_percentage'),
+            remote_0=Count('id', filter=Q(remote_percentage__lte=0)),
+            remote_1_25=Count('id', filter=Q(remote_percentage__gt=0, remote_percentage__lte=25)),
+            remote_26_50=Count('id', filter=Q(remote_percentage__gt=25, remote_percentage__lte=50)),
+            remote_51_75=Count('id', filter=Q(remote_percentage__gt=50, remote_percentage__lte=75)),
+            remote_76_100=Count('id', filter=Q(remote_percentage__gt=75, remote_percentage__lte=100)),
+        )
+        values.update(Request.objects.filter(office_id=office.id).aggregate(
+            pending_requests=Count('id', filter=Q(status='P')),
+            approved_requests=Count('id', filter=Q(status='A')),
+            rejected_requests=Count('id', filter=Q(status='R')),
+        ))
+        OfficeStats.objects.create(office_id=office.id, **{field: value or 0 for field, value in values.items()})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_desk_reservations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OfficeStats',
+            fields=[
+                ('office', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='api.office')),
+                ('employees', models.IntegerField(default=0)),
+                ('remote_percentage_sum', models.FloatField(default=0)),
+                ('remote_0', models.IntegerField(default=0)),
+                ('remote_1_25', models.IntegerField(default=0)),
+                ('remote_26_50', models.IntegerField(default=0)),
+                ('remote_51_75', models.IntegerField(default=0)),
+                ('remote_76_100', models.IntegerField(default=0)),
+                ('pending_requests', models.IntegerField(default=0)),
+                ('approved_requests', models.IntegerField(default=0)),
+                ('rejected_requests', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,130 @@
+# Generated by Django 4.0.7 on 2026-10-18 10:13
+
+from django.db import migrations, models
+
+
+# table: model name of its tombstones, see api.sync
+SYNCED_TABLES = {
+    'api_user': 'user',
+    'api_request': 'request',
+    'api_building': 'building',
+    'api_office': 'office',
+    'api_desk': 'desk',
+}
+
+# Triggers, so bulk_create, bulk_update and queryset updates and deletes are versioned too.
+# The version is the 64 bit id of the writing transaction.
+CREATE_TRIGGERS = [
+    '''
+    CREATE FUNCTION api_set_change_version() RETURNS trigger AS $$
+    BEGIN
+        NEW.change_version := txid_current();
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    '''
+    CREATE FUNCTION api_write_tombstone() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO api_tombstone (model, object_id, change_version, deleted_at)
+        VALUES (TG_ARGV[0], OLD.id, txid_current(), now());
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    *[
+        sql % {'table': table, 'model': model}
+        for table, model in SYNCED_TABLES.items()
+        for sql in (
+            'CREATE TRIGGER %(table)s_change_version BEFORE INSERT OR UPDATE ON %(table)s '
+            'FOR EACH ROW EXECUTE FUNCTION api_set_change_version()',
+            "CREATE TRIGGER %(table)s_tombstone AFTER DELETE ON %(table)s "
+            "FOR EACH ROW EXECUTE FUNCTION api_write_tombstone('%(model)s')",
+        )
+    ],
+]
+
+DROP_TRIGGERS = [
+    *[
+        sql % {'table': table}
+        for table in SYNCED_TABLES
+        for sql in ('DROP TRIGGER %(table)s_change_version ON %(table)s',
+                    'DROP TRIGGER %(table)s_tombstone ON %(table)s')
+    ],
+    'DROP FUNCTION api_set_change_version()',
+    'DROP FUNCTION api_write_tombstone()',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_office_image_thumbnails'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=50)),
+                ('object_id', models.BigIntegerField()),
+                ('change_version', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='building',
+            name='change_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='desk',
+            name='change_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='office',
+            name='change_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='change_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='change_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='building',
+            index=models.Index(fields=['change_version', 'id'], name='building_change_version_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='desk',
+            index=models.Index(fields=['change_version', 'id'], name='desk_change_version_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='office',
+            index=models.Index(fields=['change_version', 'id'], name='office_change_version_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(fields=['change_version', 'id'], name='request_change_version_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['change_version', 'id'], name='user_change_version_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['model', 'change_version'], name='tombstone_model_version_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['deleted_at'], name='tombstone_deleted_at_idx'),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations
+
+
+# NOTIFY api_request on request creations and status changes, see api.events
+# Notifications are sent when the writing transaction commits.
+CREATE_TRIGGER = [
+    '''
+    CREATE FUNCTION api_notify_request() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' AND OLD.status = NEW.status THEN
+            RETURN NULL;
+        END IF;
+        PERFORM pg_notify('api_request', json_build_object(
+            'id', NEW.id,
+            'user_id', NEW.user_id,
+            'office_id', NEW.office_id,
+            'status', NEW.status,
+            'remote_percentage', NEW.remote_percentage,
+            'created', TG_OP = 'INSERT'
+        )::text);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    'CREATE TRIGGER api_request_notify AFTER INSERT OR UPDATE OF status ON api_request '
+    'FOR EACH ROW EXECUTE FUNCTION api_notify_request()',
+]
+
+DROP_TRIGGER = [
+    'DROP TRIGGER api_request_notify ON api_request',
+    'DROP FUNCTION api_notify_request()',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_sync_change_versions'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+    ]
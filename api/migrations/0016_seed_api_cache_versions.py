@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+# one row per cached model, bump_version only increments existing rows
+CACHED_MODELS = ('user', 'building', 'office', 'desk')
+
+
+def seed_versions(apps, schema_editor):
+    ApiCacheVersion = apps.get_model('api', 'ApiCacheVersion')
+    for name in CACHED_MODELS:
+        ApiCacheVersion.objects.get_or_create(name=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_request_notify'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations, models
+
+
+# Tombstones keep the user and office of the deleted row (when it has those columns),
+# so the feeds only send deletes of rows the caller could see, see api.sync
+WRITE_TOMBSTONE = '''
+    CREATE OR REPLACE FUNCTION api_write_tombstone() RETURNS trigger AS $$
+    DECLARE
+        row jsonb := to_jsonb(OLD);
+    BEGIN
+        INSERT INTO api_tombstone (model, object_id, change_version, deleted_at, user_id, office_id)
+        VALUES (TG_ARGV[0], OLD.id, txid_current(), now(), (row->>'user_id')::bigint, (row->>'office_id')::bigint);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+'''
+
+PREVIOUS_WRITE_TOMBSTONE = '''
+    CREATE OR REPLACE FUNCTION api_write_tombstone() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO api_tombstone (model, object_id, change_version, deleted_at)
+        VALUES (TG_ARGV[0], OLD.id, txid_current(), now());
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_seed_api_cache_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tombstone',
+            name='user_id',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='tombstone',
+            name='office_id',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.RunSQL(WRITE_TOMBSTONE, PREVIOUS_WRITE_TOMBSTONE),
+    ]
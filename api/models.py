@@ -1,7 +1,9 @@
 from re import T
 from datetime import datetime
 from django.db import models
-from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.fields import ArrayField, DateRangeField, RangeOperators
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.indexes import GistIndex
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.translation import gettext_lazy as _
@@ -134,6 +136,8 @@ class User(AbstractBaseUser, PermissionsMixin):
     img_url = models.CharField(max_length=200, blank=True)
     is_active = models.BooleanField(default=False)
     is_staff = models.BooleanField(default=False)
+    # set by a database trigger on every insert and update, see api.sync
+    change_version = models.BigIntegerField(default=0, editable=False)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['password', 'role', 'first_name', 'last_name', 'office_id', 'building_id', 
@@ -145,6 +149,14 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     class Meta:
         ordering = ('role',)
+        # keyset pagination filtered by office/building
+        indexes = [
+            models.Index(fields=['office_id', 'id'], name='user_office_id_idx'),
+            models.Index(fields=['building_id', 'id'], name='user_building_id_idx'),
+            # User.userObjects
+            models.Index(fields=['id'], condition=models.Q(is_active=True), name='user_active_idx'),
+            models.Index(fields=['change_version', 'id'], name='user_change_version_idx'),
+        ]
 
     def __str__(self):
         return self.email
@@ -202,6 +214,21 @@ class Request(models.Model):
     status = models.CharField(max_length=1,choices=STATUS_CHOICES, default=PENDING, 
                               null=False, blank=False)
     reject_reason = models.TextField(blank=True, default='Request denied.')
+    # set by a database trigger on every insert and update, see api.sync
+    change_version = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='request_status_id_idx'),
+            models.Index(fields=['office_id', 'id'], name='request_office_id_idx'),
+            # hot filters of RequestList: Admin, Office Admin and the pending check in create
+            models.Index(fields=['id'], condition=models.Q(status='P', remote_percentage__gt=0),
+                         name='request_pending_remote_idx'),
+            models.Index(fields=['office_id', 'id'], condition=models.Q(status='P'),
+                         name='request_pending_office_idx'),
+            models.Index(fields=['user_id', 'status'], name='request_user_status_idx'),
+            models.Index(fields=['change_version', 'id'], name='request_change_version_idx'),
+        ]
 
     def __str__(self):
         return str(self.user_id)
@@ -231,6 +258,19 @@ class Building(models.Model):
     address = models.CharField(max_length=200, null=False, blank=False, unique=True)
     img_url = models.CharField(max_length=200, blank=True)
 
+    # occupancy roll-up of all offices in the building, maintained by api.occupancy
+    total_desks = models.PositiveIntegerField(default=0)
+    usable_desks = models.PositiveIntegerField(default=0)
+    occupied_desks = models.PositiveIntegerField(default=0)
+    free_desks = models.PositiveIntegerField(default=0)
+    # set by a database trigger on every insert and update, see api.sync
+    change_version = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['change_version', 'id'], name='building_change_version_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -246,17 +286,43 @@ class Office(models.Model):
     building_id = models.ForeignKey('Building', on_delete=models.CASCADE, null=False, blank=False, 
                                     db_column='building_id')
     floor_number = models.PositiveIntegerField(null=False, blank=False)
-    total_desks = models.PositiveIntegerField(null=False, blank=False)
-    usable_desks = models.PositiveIntegerField(null=False, blank=False)
+    # occupancy counters, maintained by api.occupancy on every desk change
+    total_desks = models.PositiveIntegerField(null=False, blank=False, default=0)
+    usable_desks = models.PositiveIntegerField(null=False, blank=False, default=0)
+    occupied_desks = models.PositiveIntegerField(default=0)
+    free_desks = models.PositiveIntegerField(default=0)
     x_size_m = models.FloatField(null=False, blank=False, default=0.0)
     y_size_m = models.FloatField(null=False, blank=False, default=0.0)
 
     # array of desk ids
     desk_ids = ArrayField(models.PositiveIntegerField(), null = True, blank=True)
+    # bumped on every desk change, used to invalidate cached layouts
+    layout_version = models.PositiveIntegerField(default=0)
+    # {size: url} thumbnails of the latest uploaded image, for the office cards
+    thumbnails = models.JSONField(default=dict, blank=True)
+    # set by a database trigger on every insert and update, see api.sync
+    change_version = models.BigIntegerField(default=0, editable=False)
 
     office_admin= models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, 
                                            db_column='office_admin_id')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['building_id', 'id'], name='office_building_id_idx'),
+            models.Index(fields=['change_version', 'id'], name='office_change_version_idx'),
+        ]
+
+    # maintained with F() updates (api.occupancy) and a trigger (api.sync), saving a stale
+    # instance would write them back
+    CONCURRENT_FIELDS = ('total_desks', 'usable_desks', 'occupied_desks', 'free_desks', 'layout_version',
+                         'change_version')
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not args and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.CONCURRENT_FIELDS]
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
@@ -272,6 +338,12 @@ class Office(models.Model):
     def get_usable_desks(self):
         return self.usable_desks
 
+    def get_occupied_desks(self):
+        return self.occupied_desks
+
+    def get_free_desks(self):
+        return self.free_desks
+
     def get_office_admin_id(self):
         return self.office_admin_id
 
@@ -287,6 +359,14 @@ class Desk(models.Model):
     x_pos_px = models.PositiveIntegerField(null=False, blank=False, default=0)
     y_pos_px = models.PositiveIntegerField(null=False, blank=False, default=0)
     is_usable = models.BooleanField(default=True)
+    # set by a database trigger on every insert and update, see api.sync
+    change_version = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['office_id', 'id'], name='desk_office_id_idx'),
+            models.Index(fields=['change_version', 'id'], name='desk_change_version_idx'),
+        ]
 
     def __str__(self):
         return str(self.desk_number)
@@ -301,11 +381,112 @@ class Desk(models.Model):
         return self.is_usable
 
 
+def id_range(field):
+    return models.Func(models.F(field), models.F(field), models.Value('[]'), function='int8range')
+
+
+# a desk booked by a user for a date range, stored as a half open [start, end) daterange
+class DeskReservation(models.Model):
+    desk_id = models.ForeignKey('Desk', on_delete=models.CASCADE, null=False, blank=False,
+                                db_column='desk_id')
+    user_id = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+                                null=False, blank=False, db_column='user_id')
+    dates = DateRangeField(null=False, blank=False)
+
+    class Meta:
+        # Ids are compared as single value ranges, GiST handles range equality natively
+        # so the btree_gist extension is not needed. The GiST indexes behind the
+        # constraints are on int8range(desk_id / user_id) and dates, plain desk_id and
+        # user_id filters do not match them and use the foreign key btree indexes. The
+        # date index serves the day lookups of building availability.
+        constraints = [
+            ExclusionConstraint(name='reservation_desk_no_overlap', expressions=[
+                (id_range('desk_id'), RangeOperators.EQUAL), ('dates', RangeOperators.OVERLAPS)]),
+            ExclusionConstraint(name='reservation_user_no_overlap', expressions=[
+                (id_range('user_id'), RangeOperators.EQUAL), ('dates', RangeOperators.OVERLAPS)]),
+        ]
+        indexes = [
+            GistIndex(fields=['dates'], name='reservation_dates_idx'),
+        ]
+
+    def __str__(self):
+        return '%s %s' % (self.desk_id_id, self.dates)
+
+
+# version counter per model, bumped once the writing transaction commits (see api.response_cache)
+class ApiCacheVersion(models.Model):
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return '%s:%d' % (self.name, self.version)
+
+
+# a deleted User, Request, Building, Office or Desk, written by a database trigger, see api.sync
+class Tombstone(models.Model):
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    change_version = models.BigIntegerField()
+    deleted_at = models.DateTimeField()
+    # of the deleted row, to send its delete only to the callers that could see it
+    user_id = models.BigIntegerField(null=True)
+    office_id = models.BigIntegerField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'change_version'], name='tombstone_model_version_idx'),
+            models.Index(fields=['deleted_at'], name='tombstone_deleted_at_idx'),
+        ]
+
+    def __str__(self):
+        return '%s:%d' % (self.model, self.object_id)
+
+
+# analytics summary of one office, maintained by api.analytics on every user and request change
+# only active users are counted
+class OfficeStats(models.Model):
+    office = models.OneToOneField('Office', on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    # signed, so writes keep working while rows skipped by bulk inserts wait for rebuild_stats
+    employees = models.IntegerField(default=0)
+    remote_percentage_sum = models.FloatField(default=0)
+    # employees per remote_percentage range
+    remote_0 = models.IntegerField(default=0)
+    remote_1_25 = models.IntegerField(default=0)
+    remote_26_50 = models.IntegerField(default=0)
+    remote_51_75 = models.IntegerField(default=0)
+    remote_76_100 = models.IntegerField(default=0)
+    pending_requests = models.IntegerField(default=0)
+    approved_requests = models.IntegerField(default=0)
+    rejected_requests = models.IntegerField(default=0)
+
+    def __str__(self):
+        return str(self.office_id)
+
 
 class Office_Image(models.Model):
+
+    PENDING = 'P'
+    READY = 'R'
+    FAILED = 'F'
+
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+    ]
+
     office_id = models.ForeignKey('Office', on_delete=models.CASCADE, null=False, blank=False, 
                                   db_column='office_id')
     img_url = models.CharField(max_length=200, null=False, blank=False)
+    # uploaded images, see api.office_images
+    # storage name of the original, empty for images only known by their URL
+    original = models.CharField(max_length=200, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    # {size: url} of the generated thumbnails
+    thumbnails = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=READY)
+    error = models.TextField(blank=True)
 
     def __str__(self):
         return str(self.office_id)
@@ -0,0 +1,123 @@
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.contrib.postgres.fields import ArrayField
+from django.db import models, transaction
+from django.db.models import Count, F, Func, Q, Sum, Value
+from .models import Building, Office, Desk
+from .response_cache import bump_version
+
+
+COUNTER_FIELDS = ('total_desks', 'usable_desks', 'occupied_desks', 'free_desks')
+
+
+# counters contributed by a single desk
+def desk_occupancy(is_usable, user_id):
+    return {
+        'total_desks': 1,
+        'usable_desks': int(is_usable),
+        'occupied_desks': int(user_id is not None),
+        'free_desks': int(is_usable and user_id is None),
+    }
+
+
+def _desk_ids_func(function, desk_id):
+    return Func(F('desk_ids'), Value(desk_id), function=function,
+                output_field=ArrayField(models.PositiveIntegerField()))
+
+
+# add (sign=1) or remove (sign=-1) a desk from its office and building counters
+def apply_occupancy_delta(office_id, delta, sign=1, desk_id=None):
+    changes = {field: F(field) + sign * value for field, value in delta.items() if value}
+    if not changes and desk_id is None:
+        return
+    if changes:
+        Building.objects.filter(office=office_id).update(**changes)
+    if desk_id is not None:
+        changes['desk_ids'] = _desk_ids_func('array_append' if sign > 0 else 'array_remove', desk_id)
+    Office.objects.filter(pk=office_id).update(**changes)
+
+
+def desk_saved(desk, before):
+    after = (desk.office_id_id, desk.is_usable, desk.user_id_id)
+    if before == after:
+        return
+    if before is None:
+        apply_occupancy_delta(desk.office_id_id, desk_occupancy(*after[1:]), desk_id=desk.id)
+    elif before[0] != after[0]:
+        # desk moved to another office
+        apply_occupancy_delta(before[0], desk_occupancy(*before[1:]), sign=-1, desk_id=desk.id)
+        apply_occupancy_delta(after[0], desk_occupancy(*after[1:]), desk_id=desk.id)
+    else:
+        old, new = desk_occupancy(*before[1:]), desk_occupancy(*after[1:])
+        apply_occupancy_delta(after[0], {field: new[field] - old[field] for field in COUNTER_FIELDS})
+
+
+# office moved to another building, counters: the stored counters of the office
+def office_moved(before_building_id, after_building_id, counters):
+    for building_id, sign in ((before_building_id, -1), (after_building_id, 1)):
+        changes = {field: F(field) + sign * value for field, value in counters.items() if value}
+        if changes:
+            Building.objects.filter(pk=building_id).update(**changes)
+
+
+def desk_deleted(desk):
+    apply_occupancy_delta(desk.office_id_id, desk_occupancy(desk.is_usable, desk.user_id_id),
+                          sign=-1, desk_id=desk.id)
+
+
+# invalidate cached layouts of the offices (spatial index, rendered floor plans)
+def bump_layout_version(*office_ids):
+    Office.objects.filter(pk__in=office_ids).update(layout_version=F('layout_version') + 1)
+
+
+# recompute the counters of one office after bulk writes that skip the desk signals
+def refresh_office_occupancy(office):
+    values = Desk.objects.filter(office_id=office.id).aggregate(
+        total_desks=Count('id'),
+        usable_desks=Count('id', filter=Q(is_usable=True)),
+        occupied_desks=Count('id', filter=Q(user_id__isnull=False)),
+        free_desks=Count('id', filter=Q(is_usable=True, user_id__isnull=True)),
+        desk_ids=ArrayAgg('id', ordering='id', default=None),
+    )
+    delta = {field: values[field] - getattr(office, field) for field in COUNTER_FIELDS}
+    apply_occupancy_delta(office.id, delta)
+    Office.objects.filter(pk=office.id).update(desk_ids=values['desk_ids'] or [],
+                                               layout_version=F('layout_version') + 1)
+
+
+# recompute every counter from the Desk table, returns the number of rows fixed
+@transaction.atomic
+def rebuild_occupancy():
+    fixed = 0
+    counts = {
+        row['office_id']: row for row in Desk.objects.order_by().values('office_id').annotate(
+            total_desks=Count('id'),
+            usable_desks=Count('id', filter=Q(is_usable=True)),
+            occupied_desks=Count('id', filter=Q(user_id__isnull=False)),
+            free_desks=Count('id', filter=Q(is_usable=True, user_id__isnull=True)),
+            desk_ids=ArrayAgg('id', ordering='id'),
+        )
+    }
+    empty = {field: 0 for field in COUNTER_FIELDS}
+    for office in Office.objects.select_for_update().order_by('id'):
+        expected = counts.get(office.id, dict(empty, desk_ids=[]))
+        values = {field: expected[field] for field in COUNTER_FIELDS + ('desk_ids',)}
+        current = {field: getattr(office, field) for field in COUNTER_FIELDS}
+        current['desk_ids'] = office.desk_ids or []
+        if current != values:
+            Office.objects.filter(pk=office.id).update(**values)
+            fixed += 1
+
+    totals = {
+        row['building_id']: row for row in Office.objects.order_by().values('building_id').annotate(
+            **{field: Sum(field) for field in COUNTER_FIELDS}
+        )
+    }
+    for building in Building.objects.select_for_update().order_by('id'):
+        expected = totals.get(building.id, empty)
+        values = {field: expected[field] for field in COUNTER_FIELDS}
+        if any(getattr(building, field) != value for field, value in values.items()):
+            Building.objects.filter(pk=building.id).update(**values)
+            fixed += 1
+    if fixed:
+        bump_version('office', 'building')
+    return fixed
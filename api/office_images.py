@@ -0,0 +1,146 @@
+import hashlib
+import io
+import mimetypes
+import os
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from PIL import Image, ImageOps, UnidentifiedImageError
+from .models import Office, Office_Image
+from .response_cache import bump_version
+
+
+# bounding box sides of the generated thumbnails, largest first
+THUMBNAIL_SIZES = (640, 320, 160)
+THUMBNAIL_QUALITY = 80
+UPLOAD_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+MAX_UPLOAD_BYTES = getattr(settings, 'IMAGE_UPLOAD_MAX_BYTES', 10 * 1024 * 1024)
+# a small compressed file can decode to a huge bitmap
+MAX_UPLOAD_PIXELS = getattr(settings, 'IMAGE_UPLOAD_MAX_PIXELS', 50 * 1000 * 1000)
+# stored names contain their content hash, so their URLs never change content
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def content_name(directory, content, suffix):
+    return '%s/%s%s' % (directory, hashlib.sha256(content).hexdigest()[:20], suffix)
+
+
+def save_once(name, content):
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(content))
+    return name
+
+
+# check and store an uploaded original, returns the pending Office_Image
+# raises ValueError for files that are not a supported image
+def store_upload(office, upload):
+    if upload.size > MAX_UPLOAD_BYTES:
+        raise ValueError('Images can be at most %d MB.' % (MAX_UPLOAD_BYTES // (1024 * 1024)))
+    content = upload.read()
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            image_format, (width, height) = image.format, image.size
+            if width * height > MAX_UPLOAD_PIXELS:
+                raise ValueError('Images can be at most %d megapixels.' % (MAX_UPLOAD_PIXELS // (1000 * 1000)))
+            image.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError):
+        raise ValueError('The file is not a valid image.')
+    if image_format not in UPLOAD_FORMATS:
+        raise ValueError('Upload a JPEG, PNG or WEBP image.')
+    name = save_once(content_name('offices/%d' % office.id, content, '.' + UPLOAD_FORMATS[image_format]), content)
+    return Office_Image.objects.create(office_id=office, img_url=default_storage.url(name), original=name,
+                                       width=width, height=height, status=Office_Image.PENDING)
+
+
+# WEBP thumbnails of the original, each made from the next larger one
+def render_thumbnails(content):
+    thumbnails = {}
+    with Image.open(io.BytesIO(content)) as image:
+        if image.format == 'JPEG':
+            # decodes at the smallest 1/2, 1/4 or 1/8 scale still covering the largest thumbnail
+            image.draft('RGB', (THUMBNAIL_SIZES[0], THUMBNAIL_SIZES[0]))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        for size in THUMBNAIL_SIZES:
+            image.thumbnail((size, size))
+            output = io.BytesIO()
+            image.save(output, 'WEBP', quality=THUMBNAIL_QUALITY)
+            thumbnails[size] = output.getvalue()
+    return thumbnails
+
+
+def generate_thumbnails(image_id):
+    image = Office_Image.objects.filter(pk=image_id, status=Office_Image.PENDING).first()
+    if image is None:
+        return
+    try:
+        with default_storage.open(image.original) as original:
+            rendered = render_thumbnails(original.read())
+        directory = posixpath.dirname(image.original)
+        thumbnails = {
+            str(size): default_storage.url(save_once(content_name(directory, content, '_%d.webp' % size), content))
+            for size, content in rendered.items()
+        }
+    except Exception as error:
+        # any failure, also of the decoder, leaves the image FAILED instead of PENDING
+        Office_Image.objects.filter(pk=image.pk).update(status=Office_Image.FAILED, error=str(error))
+        return
+    with transaction.atomic():
+        Office_Image.objects.filter(pk=image.pk).update(status=Office_Image.READY, thumbnails=thumbnails)
+        # the office cards show the latest ready image
+        latest = Office_Image.objects.filter(office_id=image.office_id_id, status=Office_Image.READY).latest('id')
+        if latest.pk == image.pk:
+            Office.objects.filter(pk=image.office_id_id).update(thumbnails=thumbnails)
+            bump_version('office')
+
+
+def _run(image_id):
+    try:
+        generate_thumbnails(image_id)
+    finally:
+        # hands the worker thread's connection back to the pool
+        connections.close_all()
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+# Thumbnails are made by a per process thread pool, off the request thread
+# (Pillow releases the GIL while decoding and resizing). With IMAGE_WORKERS = 0
+# they are made inline. Pending images lost with a worker are picked up by
+# the process_office_images command.
+def submit(image_id):
+    workers = getattr(settings, 'IMAGE_WORKERS', 2)
+    if not workers:
+        generate_thumbnails(image_id)
+        return
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(workers, thread_name_prefix='thumbnails')
+            _executor_pid = os.getpid()
+        _executor.submit(_run, image_id)
+
+
+# serves stored images, which are immutable under their content hashed names
+def media_view(request, name):
+    etag = '"%s"' % posixpath.basename(name)
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        try:
+            response = FileResponse(default_storage.open(name),
+                                    content_type=mimetypes.guess_type(name)[0] or 'application/octet-stream')
+        except (FileNotFoundError, IsADirectoryError, SuspiciousFileOperation):
+            raise Http404
+    response['ETag'] = etag
+    response['Cache-Control'] = CACHE_CONTROL
+    return response
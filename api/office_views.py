@@ -1,39 +1,101 @@
-from .models import User, Office, Desk
-from .serializers import OfficeSerializer, OfficeGetSerializer, DeskGetSerializer
+import math
+from .models import User, Office, Desk, Office_Image
+from .serializers import (OfficeSerializer, OfficeGetSerializer, OfficeImageSerializer, DeskGetSerializer,
+                          DeskLayoutSerializer)
 from .permissions import UserAuthenticatedPermission, UserAdminPermission, UserOfficeAdminPermission
+from .pagination import filter_queryset, paginate
+from .occupancy import refresh_office_occupancy
+from .spatial import PX_PER_METER, get_office_grid
+from .response_cache import cached_response, bump_version
+from .allocation import get_week_start, plan_offices
+from .office_images import store_upload, submit
+from .floor_plan import get_floor_plan
+from .sync import sync_response
 from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from django.shortcuts import get_object_or_404
-from django.http import JsonResponse
+from django.db import connection, transaction
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, Http404
 from django.forms.models import model_to_dict
 
 
+def get_grid_or_404(pk):
+    try:
+        return get_office_grid(pk)
+    except (Office.DoesNotExist, ValueError):
+        raise Http404
+
+
+# bulk_update of n rows sends a CASE of n branches per field, slow to build and to run
+# for thousands of rows, the rows are joined from a VALUES list instead
+def update_rows(model, rows, fields, batch_size=1000):
+    columns = [model._meta.pk] + [model._meta.get_field(name) for name in fields]
+    types = [model._meta.pk.rel_db_type(connection)] + [field.db_type(connection) for field in columns[1:]]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    sql = 'UPDATE %s SET %s FROM (VALUES %%s) AS new (%s) WHERE %s.%s = new.%s' % (
+        table, ', '.join('%s = new.%s' % (quote(field.column), quote(field.column)) for field in columns[1:]),
+        ', '.join(quote(field.column) for field in columns), table, quote(columns[0].column),
+        quote(columns[0].column))
+    row_sql = '(%s)' % ', '.join('%%s::%s' % db_type for db_type in types)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            cursor.execute(sql % ', '.join([row_sql] * len(batch)),
+                           [field.get_db_prep_save(getattr(row, field.attname), connection)
+                            for row in batch for field in columns])
+
+
 # Display Offices
 class OfficeList(viewsets.ViewSet):
     permission_classes = [UserAdminPermission|UserOfficeAdminPermission]
     queryset = Office.objects.all()
     serializer_class = OfficeSerializer
+    filter_fields = {
+        'building_id': ('building_id', int),
+        'floor_number': ('floor_number', int),
+    }
 
+    # ?since=<cursor> returns the changed and deleted offices instead, see api.sync
     def list(self, request):
-        offices = Office.objects.all()
-        serializer = OfficeGetSerializer(offices, many=True)
-        return Response(serializer.data)
+        if 'since' in request.query_params:
+            return sync_response(Office.objects.all(), 'office', request, OfficeGetSerializer)
+        return self.list_page(request)
+
+    @cached_response('office', 'desk', 'user')
+    def list_page(self, request):
+        offices = filter_queryset(Office.objects.all(), request, self.filter_fields)
+        return paginate(offices, request, self, OfficeGetSerializer)
 
     
+    @cached_response('office', 'desk', 'user')
     def retrieve(self, request, pk=None):
         office = get_object_or_404(Office, pk=pk)
-        office_serialized = OfficeGetSerializer(office)
-        # get all desks in the office from 
-        desks = Desk.objects.filter(office_id=office_serialized.data['id'])
-        for desk in desks:
-            desk_serialized = DeskGetSerializer(desk)
-            user_name = User.objects.get(id=desk_serialized.data['user_id']).get_full_name()
-            # append full name field to desk
-            desk_serialized.data['user_name'] = user_name
-            office_serialized.data['desks_ids'].append(desk_serialized.data)
-        return Response(office_serialized.data)
+        office_serialized = OfficeGetSerializer(office).data
+        # get all desks in the office with their occupant names in one joined query
+        desks = Desk.objects.filter(office_id=office.id).order_by('desk_number', 'id').values_list(
+            'id', 'desk_number', 'user_id', 'user_id__first_name', 'user_id__last_name', 'is_usable',
+            'x_size_m', 'y_size_m', 'x_pos_px', 'y_pos_px')
+        office_serialized['desks'] = [
+            {
+                'id': desk_id,
+                'desk_number': desk_number,
+                'user_id': user_id,
+                'user_name': first_name + ' ' + last_name if user_id is not None else None,
+                'is_usable': is_usable,
+                'x_size_m': x_size_m,
+                'y_size_m': y_size_m,
+                'x_pos_px': x_pos_px,
+                'y_pos_px': y_pos_px,
+            }
+            for (desk_id, desk_number, user_id, first_name, last_name, is_usable,
+                 x_size_m, y_size_m, x_pos_px, y_pos_px) in desks
+        ]
+        return Response(office_serialized)
 
 
     # create a new office
@@ -45,8 +107,6 @@ class OfficeList(viewsets.ViewSet):
                 name=serializer.validated_data['name'],
                 building_id=serializer.validated_data['building_id'],
                 floor_number=serializer.validated_data['floor_number'],
-                total_desks=serializer.validated_data['total_desks'],
-                usable_desks=serializer.validated_data['usable_desks'],
                 x_size_m=serializer.validated_data['x_size_m'],
                 y_size_m=serializer.validated_data['y_size_m'],
                 # desk_ids=serializer.validated_data['desk_ids'],
@@ -57,8 +117,10 @@ class OfficeList(viewsets.ViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     # update a office
+    # the row is locked, moving it to another building moves its counters too
+    @transaction.atomic
     def update(self, request, pk=None):
-        office = get_object_or_404(Office, pk=pk)
+        office = get_object_or_404(Office.objects.select_for_update(), pk=pk)
         serializer = OfficeSerializer(office, data=request.data)
         if serializer.is_valid():
             serializer.save()
@@ -70,4 +132,118 @@ class OfficeList(viewsets.ViewSet):
     def destroy(self, request, pk=None):
         office = get_object_or_404(Office, pk=pk)
         office.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    # create or update the whole desk layout of an office in one transaction
+    # desks are matched on desk_number, desks missing from the payload are kept
+    @action(detail=True, methods=['post'], url_path='desks/bulk')
+    @transaction.atomic
+    def bulk_desks(self, request, pk=None):
+        office = get_object_or_404(Office.objects.select_for_update(), pk=pk)
+        serializer = DeskLayoutSerializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        layout = serializer.validated_data
+
+        errors = {}
+        desk_numbers = [desk['desk_number'] for desk in layout]
+        if len(set(desk_numbers)) != len(desk_numbers):
+            errors['desk_number'] = 'Desk numbers must be unique.'
+        # a desk has to fit in the office, unsized offices are not checked
+        width, height = office.x_size_m * PX_PER_METER, office.y_size_m * PX_PER_METER
+        if any((office.x_size_m and desk['x_size_m'] > office.x_size_m) or
+               (office.y_size_m and desk['y_size_m'] > office.y_size_m) for desk in layout):
+            errors['size'] = 'Desks can not be larger than the office.'
+        elif any((office.x_size_m and desk['x_pos_px'] + desk['x_size_m'] * PX_PER_METER > width) or
+                 (office.y_size_m and desk['y_pos_px'] + desk['y_size_m'] * PX_PER_METER > height) for desk in layout):
+            errors['position'] = 'Desks must be placed inside the office.'
+        user_ids = {desk['user_id'] for desk in layout if desk['user_id'] is not None}
+        missing_users = user_ids - set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+        if missing_users:
+            errors['user_id'] = 'Unknown users: %s.' % sorted(missing_users)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        existing = {desk.desk_number: desk for desk in Desk.objects.filter(office_id=office.id)}
+        fields = ('user_id', 'is_usable', 'x_size_m', 'y_size_m', 'x_pos_px', 'y_pos_px')
+        created, updated = [], []
+        for desk in layout:
+            instance = existing.get(desk['desk_number'])
+            if instance is None:
+                instance = Desk(office_id_id=office.id, desk_number=desk['desk_number'])
+                created.append(instance)
+            else:
+                updated.append(instance)
+            instance.user_id_id = desk['user_id']
+            for field in fields[1:]:
+                setattr(instance, field, desk[field])
+        Desk.objects.bulk_create(created, batch_size=1000)
+        update_rows(Desk, updated, fields)
+        # bulk writes skip the desk signals
+        refresh_office_occupancy(office)
+        bump_version('desk')
+        return Response({'created': len(created), 'updated': len(updated)}, status=status.HTTP_200_OK)
+
+    def _coordinates(self, request, names):
+        try:
+            values = [float(request.query_params[name]) for name in names]
+        except (KeyError, ValueError):
+            values = None
+        if values is None or not all(math.isfinite(value) for value in values):
+            raise ValidationError({'detail': 'Query parameters %s are required numbers.' % ', '.join(names)})
+        return values
+
+    # desks intersecting the rectangle x0, y0, x1, y1 (pixels)
+    @action(detail=True, methods=['get'], url_path='desks/region')
+    def desks_in_region(self, request, pk=None):
+        x0, y0, x1, y1 = self._coordinates(request, ('x0', 'y0', 'x1', 'y1'))
+        grid = get_grid_or_404(pk)
+        desks = Desk.objects.filter(id__in=grid.in_rect(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)))
+        return Response(DeskGetSerializer(desks.order_by('id'), many=True).data)
+
+    # closest free usable desk to the point x, y (pixels)
+    @action(detail=True, methods=['get'], url_path='desks/nearest_free')
+    def nearest_free_desk(self, request, pk=None):
+        x, y = self._coordinates(request, ('x', 'y'))
+        desk_id = get_grid_or_404(pk).nearest_free(x, y)
+        if desk_id is None:
+            return Response({'detail': 'No free desk in this office.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(DeskGetSerializer(Desk.objects.get(pk=desk_id)).data)
+
+    # hot-desking plan of the office for the week of ?week=YYYY-MM-DD (next week by default)
+    @action(detail=True, methods=['get'])
+    def allocation(self, request, pk=None):
+        office = get_object_or_404(Office, pk=pk)
+        return Response(plan_offices([office.id], get_week_start(request)))
+
+    # the office layout rendered as SVG, cached per layout_version
+    # the version doubles as ETag, so a client holding the current plan gets a 304
+    @action(detail=True, methods=['get'], url_path='floor_plan.svg', permission_classes=[UserAuthenticatedPermission])
+    def floor_plan(self, request, pk=None):
+        office = get_object_or_404(Office.objects.only('id', 'layout_version', 'x_size_m', 'y_size_m'), pk=pk)
+        etag = '"floor-plan-%d-%d"' % (office.id, office.layout_version)
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(get_floor_plan(office), content_type='image/svg+xml')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    # list the images of an office, or upload one ('image' file field)
+    # thumbnails are generated in the background, the upload answers 202 with the pending image
+    @action(detail=True, methods=['get', 'post'])
+    def images(self, request, pk=None):
+        office = get_object_or_404(Office, pk=pk)
+        if request.method == 'GET':
+            images = Office_Image.objects.filter(office_id=office.id).order_by('-id')
+            return Response(OfficeImageSerializer(images, many=True).data)
+        upload = request.FILES.get('image')
+        if upload is None:
+            return Response({'image': 'No image file was submitted.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            image = store_upload(office, upload)
+        except ValueError as error:
+            return Response({'image': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        transaction.on_commit(lambda: submit(image.id))
+        return Response(OfficeImageSerializer(image).data, status=status.HTTP_202_ACCEPTED)
@@ -0,0 +1,83 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models.constants import LOOKUP_SEP
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from .serializers import ProjectionSerializer
+from .metrics import record_phase
+
+
+# Keyset pagination on the primary key.
+# The cursor encodes the last seen id, so every page is an indexed range scan
+# (WHERE id > cursor ORDER BY id LIMIT n) and deep pages cost the same as page one.
+class IdCursorPagination(CursorPagination):
+    ordering = 'id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+def parse_bool(value):
+    if value.lower() in ('true', '1'):
+        return True
+    if value.lower() in ('false', '0'):
+        return False
+    raise ValueError(value)
+
+
+# (min, max) of the integer column an ORM lookup compares with, None for other columns
+def integer_range(queryset, lookup):
+    model, field = queryset.model, None
+    for name in lookup.split(LOOKUP_SEP):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # a transform or lookup like contains
+            break
+        model = field.related_model or model
+    if field is None:
+        return None
+    # foreign keys compare with the column of the primary key they point to
+    field = field.target_field if field.is_relation else field
+    return connections[queryset.db].ops.integer_field_ranges.get(field.get_internal_type())
+
+
+# filters: {query param: (ORM lookup, cast)}
+# integers out of the column's range are invalid, the database would fail the query
+def filter_queryset(queryset, request, filters):
+    for param, (lookup, cast) in filters.items():
+        value = request.query_params.get(param)
+        if value is None:
+            continue
+        try:
+            value = cast(value)
+            bounds = integer_range(queryset, lookup) if isinstance(value, int) else None
+            if bounds and not bounds[0] <= value <= bounds[1]:
+                raise ValueError(value)
+        except ValueError:
+            raise ValidationError({param: 'Invalid value.'})
+        queryset = queryset.filter(**{lookup: value})
+    return queryset
+
+
+_projections = {}
+
+
+def get_projection(serializer_class):
+    if serializer_class not in _projections:
+        _projections[serializer_class] = ProjectionSerializer(serializer_class)
+    return _projections[serializer_class]
+
+
+# list pages are rendered with the projection fast path of the serializer
+def paginate(queryset, request, view, serializer_class):
+    projection = get_projection(serializer_class)
+    paginator = IdCursorPagination()
+    # the cursor position is read from the ordering column of the last row
+    ordering = IdCursorPagination.ordering
+    page = paginator.paginate_queryset(projection.values(queryset, ordering), request, view=view)
+    response = paginator.get_paginated_response(page)
+    # rows are rendered in place once the page links are built
+    with record_phase(request, 'serialize'):
+        projection.render(page, ordering)
+    return response
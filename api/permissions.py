@@ -1,14 +1,15 @@
 from rest_framework. permissions import SAFE_METHODS, BasePermission
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from .authentication import get_auth_context
 
 
 # Custom permissions for the API
+# role checks only read the token claims, no DB lookup
 class UserAuthenticatedPermission(BasePermission):
     message = 'You are not authenticated.'
 
     def has_permission(self, request, view):
-        response = JWTAuthentication().authenticate(request)
-        if response is not None:
+        context = get_auth_context(request)
+        if context is not None:
             return True
         return False
 
@@ -17,11 +18,9 @@ class UserAdminPermission(BasePermission):
     message = 'You do not have Admin privileges.'
 
     def has_permission(self, request, view):
-        response = JWTAuthentication().authenticate(request)
-        if response is not None:
-            user , token = response
-            role = token.get('role')
-            if role == 'Admin':
+        context = get_auth_context(request)
+        if context is not None:
+            if context.role == 'Admin':
                 return True
         return False
 
@@ -30,10 +29,8 @@ class UserOfficeAdminPermission(BasePermission):
     message = 'You do not have Office Admin privileges.'
 
     def has_permission(self, request, view):
-        response = JWTAuthentication().authenticate(request)
-        if response is not None:
-            user , token = response
-            role = token.get('role')
-            if role == 'Office Admin':
+        context = get_auth_context(request)
+        if context is not None:
+            if context.role == 'Office Admin':
                 return True
-        return False
\ No newline at end of file
+        return False
@@ -0,0 +1,43 @@
+from django.db.backends.postgresql import base, creation
+from .pool import get_pool, close_pools
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # idle pooled connections would keep the test database in use
+        close_pools(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+# PostgreSQL backend borrowing its connections from api.postgresql_pool.pool.
+# Enabled by a POOL dict in the database settings (MIN_SIZE, MAX_SIZE, TIMEOUT,
+# CHECK_AFTER, MAX_IDLE), without it connections are opened and closed as usual.
+# Keep CONN_MAX_AGE at 0: Django closes the connection at the end of every
+# request, which hands it back to the pool.
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None
+
+    def get_new_connection(self, conn_params):
+        options = self.settings_dict.get('POOL')
+        if not options:
+            self.pool = None
+            return super().get_new_connection(conn_params)
+        self.pool = get_pool(conn_params, options)
+        connection = self.pool.get(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+        self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', connection.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is None or self.pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            if self.in_atomic_block:
+                # this wrapper keeps using the closed connection until the block exits
+                self.pool.discard(self.connection)
+            else:
+                self.pool.put(self.connection)
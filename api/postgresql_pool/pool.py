@@ -0,0 +1,198 @@
+import collections
+import os
+import threading
+import time
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from api.metrics import POOL_WAIT
+
+
+# Connections a forked process inherited from its parent.
+# They are never closed (or garbage collected) in the child, closing them would
+# terminate the parent's sessions on the shared sockets.
+_inherited = []
+
+
+# Thread safe pool of psycopg2 connections to one database, per process.
+# min_size: idle connections kept open however long they wait
+# max_size: open connections, checkouts wait up to timeout seconds for a free one
+# check_after: connections idle for longer are pinged on checkout
+# max_idle: seconds after which idle connections above min_size are closed
+class ConnectionPool:
+
+    def __init__(self, name, min_size=1, max_size=10, timeout=10, check_after=5, max_idle=300):
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_after = check_after
+        self.max_idle = max_idle
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.lock = threading.Condition()
+        # (connection, returned at), the most recently returned last
+        self.idle = collections.deque()
+        self.size = 0
+        self.waiting = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.health_check_failures = 0
+
+    def _check_fork(self):
+        # gunicorn workers forked from a preloaded master start with an empty pool
+        if self.pid != os.getpid():
+            _inherited.extend(connection for connection, returned_at in self.idle)
+            self._reset()
+
+    def get(self, connect):
+        self._check_fork()
+        started = time.monotonic()
+        while True:
+            connection, returned_at = self._checkout(started)
+            if connection is None:
+                try:
+                    connection = connect()
+                except BaseException:
+                    self._release_slot()
+                    raise
+                with self.lock:
+                    self.connects += 1
+                return connection
+            if self._healthy(connection, returned_at):
+                return connection
+            with self.lock:
+                self.health_check_failures += 1
+            self.discard(connection)
+
+    # an idle connection, or None when a new one may be opened
+    def _checkout(self, started):
+        with self.lock:
+            while not self.idle and self.size >= self.max_size:
+                remaining = started + self.timeout - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise psycopg2.OperationalError('No free connection in the %s pool after %ss (max size %d).' % (
+                        self.name, self.timeout, self.max_size))
+                self.waiting += 1
+                try:
+                    self.lock.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.checkouts += 1
+            if self.idle:
+                connection, returned_at = self.idle.pop()
+            else:
+                self.size += 1
+                connection, returned_at = None, None
+        POOL_WAIT.observe((self.name,), time.monotonic() - started)
+        return connection, returned_at
+
+    def _healthy(self, connection, returned_at):
+        if connection.closed:
+            return False
+        if time.monotonic() - returned_at < self.check_after:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not connection.autocommit:
+                connection.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def put(self, connection):
+        if self.pid != os.getpid():
+            _inherited.append(connection)
+            return
+        healthy = not connection.closed
+        if healthy and connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                healthy = False
+        if not healthy:
+            self.discard(connection)
+            return
+        now = time.monotonic()
+        expired = []
+        with self.lock:
+            self.idle.append((connection, now))
+            while len(self.idle) > self.min_size and now - self.idle[0][1] > self.max_idle:
+                expired.append(self.idle.popleft()[0])
+            self.size -= len(expired)
+            self.lock.notify()
+        for connection in expired:
+            connection.close()
+
+    def _release_slot(self):
+        with self.lock:
+            self.size -= 1
+            self.lock.notify()
+
+    def discard(self, connection):
+        self._release_slot()
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+    # close the idle connections, the ones in use are closed when they come back
+    def close_idle(self):
+        self._check_fork()
+        with self.lock:
+            idle = [connection for connection, returned_at in self.idle]
+            self.idle.clear()
+            self.size -= len(idle)
+        for connection in idle:
+            connection.close()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': self.size,
+                'idle': len(self.idle),
+                'in_use': self.size - len(self.idle),
+                'waiting': self.waiting,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'connects': self.connects,
+                'health_check_failures': self.health_check_failures,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+# one pool per set of connection parameters, so the test database and the
+# connections to the 'postgres' maintenance database get their own pools
+def get_pool(conn_params, options):
+    key = tuple(sorted((name, str(value)) for name, value in conn_params.items()))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ConnectionPool(
+                    conn_params.get('database', ''),
+                    min_size=options.get('MIN_SIZE', 1),
+                    max_size=options.get('MAX_SIZE', 10),
+                    timeout=options.get('TIMEOUT', 10),
+                    check_after=options.get('CHECK_AFTER', 5),
+                    max_idle=options.get('MAX_IDLE', 300),
+                )
+    return pool
+
+
+def all_pools():
+    return list(_pools.values())
+
+
+def close_pools(database=None):
+    for pool in all_pools():
+        if database is None or pool.name == database:
+            pool.close_idle()
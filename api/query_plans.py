@@ -0,0 +1,48 @@
+import datetime
+import json
+from django.db import connection
+from .models import User, Office, Desk, Request, DeskReservation
+from .reservation_views import availability_queryset
+
+
+PAGE = 101
+
+
+# The hot ORM queries of the API, as built by the views, for a seeded organisation,
+# with the table each of the hot-query indexes has to serve.
+def hot_queries(org):
+    office, user = org['office'].id, org['employee'].id
+    return {
+        'requests.admin_pending': (
+            Request.objects.filter(status='P', remote_percentage__gt=0).order_by('id')[:PAGE], Request),
+        'requests.office_pending': (
+            Request.objects.filter(status='P', office_id=office).order_by('id')[:PAGE], Request),
+        'requests.user_pending': (Request.objects.filter(user_id=user, status='P'), Request),
+        'requests.user': (Request.objects.filter(user_id=user).order_by('id')[:PAGE], Request),
+        'desks.office_page': (Desk.objects.filter(office_id=office).order_by('id')[:PAGE], Desk),
+        'desks.floor_plan': (
+            Desk.objects.filter(office_id=office).values_list('id', 'user_id__first_name', 'user_id__last_name'),
+            Desk),
+        'users.office_page': (User.objects.filter(office_id=office).order_by('id')[:PAGE], User),
+        'users.active_page': (User.userObjects.order_by('id')[:PAGE], User),
+        'reservations.building_day': (
+            availability_queryset(org['building'].id, datetime.date(2026, 1, 5)), DeskReservation),
+    }
+
+
+def analyze():
+    with connection.cursor() as cursor:
+        for model in (User, Office, Desk, Request, DeskReservation):
+            cursor.execute('ANALYZE %s' % connection.ops.quote_name(model._meta.db_table))
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from plan_nodes(child)
+
+
+# tables read with a sequential scan in the query plan
+def sequential_scans(queryset):
+    plan = json.loads(queryset.explain(format='json'))[0]['Plan']
+    return sorted({node['Relation Name'] for node in plan_nodes(plan) if node['Node Type'] == 'Seq Scan'})
@@ -1,11 +1,18 @@
-from .models import Request
-from .serializers import RequestSerializer
+from .models import User, Request
+from .serializers import RequestSerializer, RequestDecisionSerializer
 from .permissions import UserAuthenticatedPermission, UserAdminPermission, UserOfficeAdminPermission
+from .authentication import get_auth_context
+from .pagination import filter_queryset, paginate
+from .export import REQUEST_COLUMNS, export_response
+from .response_cache import bump_version
+from .analytics import StatsDelta, request_state, request_stats, user_state, user_stats
+from .sync import sync_response
 from rest_framework import status, viewsets
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
-from rest_framework_simplejwt.authentication import JWTAuthentication
 from django.shortcuts import get_object_or_404
+from django.db import transaction
 from django.http import JsonResponse
 from django.forms.models import model_to_dict
 
@@ -14,26 +21,53 @@ from django.forms.models import model_to_dict
 class RequestList(viewsets.ViewSet):
     permission_classes = [UserAuthenticatedPermission]
     serializer_class = RequestSerializer
+    filter_fields = {
+        'status': ('status', str),
+        'office_id': ('office_id', int),
+        'building_id': ('office_id__building_id', int),
+    }
 
+    # ?since=<cursor> returns the changed and deleted requests instead, see api.sync
+    # the feed holds every request the user can retrieve, whatever its status, deleted ids are
+    # not scoped as they only name rows that no longer exist
     def list(self, request):
-        response = JWTAuthentication().authenticate(request)
-        if response is not None:
-            user, token = response
-            role = token.get('role')
+        context = get_auth_context(request)
+        if context is not None and 'since' in request.query_params:
+            return sync_response(self.visible_requests(context), 'request', request, RequestSerializer,
+                                 visible=self.visibility(context))
+        if context is not None:
+            role = context.role
             if role == 'Admin':
                 # get remote pending requests
                 requests = Request.objects.filter(status='P', remote_percentage__gt=0)
-                return Response(RequestSerializer(requests, many=True).data)
             elif role == 'Office Admin':
                 # get desk requests
-                requests = Request.objects.filter(status='P', office_id=user.office_id)
-                return Response(RequestSerializer(requests, many=True).data)
+                requests = Request.objects.filter(status='P', office_id=context.user.office_id_id)
             elif role == 'Employee':
                 # get user requests
-                requests = Request.objects.filter(user_id=user.id)
-                return Response(RequestSerializer(requests, many=True).data, status=status.HTTP_200_OK)
+                requests = Request.objects.filter(user_id=context.user_id)
+            else:
+                return Response(status=status.HTTP_401_UNAUTHORIZED)
+            requests = filter_queryset(requests, request, self.filter_fields)
+            return paginate(requests, request, self, RequestSerializer)
         return Response(status=status.HTTP_401_UNAUTHORIZED)
-                
+
+    # Admins see every request, Office Admins the requests of their office, Employees their own
+    # lookups shared by the requests and their tombstones
+    def visibility(self, context):
+        if context.role == 'Office Admin':
+            return {'office_id': context.user.office_id_id}
+        if context.role != 'Admin':
+            return {'user_id': context.user_id}
+        return {}
+
+    def visible_requests(self, context):
+        return Request.objects.filter(**self.visibility(context))
+
+    def retrieve(self, request, pk=None):
+        remote_request = get_object_or_404(self.visible_requests(get_auth_context(request)), pk=pk)
+        return Response(RequestSerializer(remote_request).data)
+
 
     # create a new request
     def create(self, request):
@@ -55,5 +89,59 @@ class RequestList(viewsets.ViewSet):
                 request.save()
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-    
 
+    # stream the request history matching the list filters as CSV or NDJSON
+    # Office Admins only export the requests of their office
+    @action(detail=False, methods=['get'], url_path=r'export/(?P<file_format>csv|ndjson)',
+            permission_classes=[UserAdminPermission|UserOfficeAdminPermission])
+    def export(self, request, file_format=None):
+        requests = Request.objects.all()
+        context = get_auth_context(request)
+        if context.role == 'Office Admin':
+            requests = requests.filter(office_id=context.user.office_id_id)
+        requests = filter_queryset(requests, request, self.filter_fields)
+        return export_response(requests, REQUEST_COLUMNS, file_format, 'requests')
+
+    # approve or reject many pending requests in one transaction
+    # Office Admins can only decide requests of their own office
+    @action(detail=False, methods=['post'], permission_classes=[UserAdminPermission|UserOfficeAdminPermission])
+    @transaction.atomic
+    def decide(self, request):
+        serializer = RequestDecisionSerializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        decisions = {decision['id']: decision for decision in serializer.validated_data}
+
+        # the users are locked with their requests, their stored state feeds the analytics summary
+        pending = Request.objects.select_for_update().select_related('user_id').filter(id__in=decisions, status='P')
+        context = get_auth_context(request)
+        if context.role == 'Office Admin':
+            pending = pending.filter(office_id=context.user.office_id_id)
+
+        # one instance per user, of several approved requests of a user the last one counts
+        decided, users = list(pending.order_by('id')), {}
+        approved, rejected = [], []
+        # bulk updates skip the User and Request signals
+        delta = StatsDelta()
+        for pending_request in decided:
+            decision = decisions[pending_request.id]
+            if decision['approve']:
+                pending_request.status = 'A'
+                approved.append(pending_request.id)
+                user = users.setdefault(pending_request.user_id_id, pending_request.user_id)
+                before = user_state(user)
+                user.remote_percentage = pending_request.remote_percentage
+                delta.move(before, user_state(user), user_stats)
+            else:
+                pending_request.status = 'R'
+                pending_request.reject_reason = decision.get('reject_reason', pending_request.reject_reason)
+                rejected.append(pending_request.id)
+            delta.move((pending_request.office_id_id, Request.PENDING), request_state(pending_request), request_stats)
+        Request.objects.bulk_update(decided, ['status', 'reject_reason'])
+        if users:
+            User.objects.bulk_update(users.values(), ['remote_percentage'])
+            bump_version('user')
+        delta.apply()
+
+        skipped = sorted(set(decisions) - set(approved) - set(rejected))
+        return Response({'approved': approved, 'rejected': rejected, 'skipped': skipped})
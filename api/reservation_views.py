@@ -0,0 +1,126 @@
+import datetime
+from .models import User, Desk, DeskReservation
+from .serializers import ReservationSerializer, ReservationGetSerializer
+from .permissions import UserAuthenticatedPermission
+from .authentication import get_auth_context
+from .pagination import filter_queryset, paginate
+from rest_framework import status, viewsets
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from django.shortcuts import get_object_or_404
+from django.contrib.postgres.fields.ranges import DateRange
+from django.db import transaction, IntegrityError
+from django.db.models import DateField, OuterRef, Q, Subquery
+from django.db.models.functions import Cast, Lower, Upper
+
+
+ADMIN_ROLES = ('Admin', 'Office Admin')
+ONE_DAY = datetime.timedelta(days=1)
+
+
+# inclusive start_date and end_date of the [start, end) range
+def with_dates(reservations):
+    return reservations.annotate(start_date=Lower('dates'),
+                                 end_date=Cast(Upper('dates') - ONE_DAY, output_field=DateField()))
+
+
+def parse_date(request, name='date'):
+    try:
+        return datetime.date.fromisoformat(request.query_params[name])
+    except (KeyError, ValueError):
+        raise ValidationError({name: 'Expected a date as YYYY-MM-DD.'})
+
+
+# Usable desks of a building with the user holding each of them on the day.
+# One query: the reservation lookup per desk is a subquery on the desk_id btree index
+# (the GiST index of the exclusion constraint is on int8range(desk_id), not desk_id).
+def availability_queryset(building_id, day):
+    reserved_by = DeskReservation.objects.filter(desk_id=OuterRef('pk'), dates__contains=day).values('user_id')[:1]
+    return Desk.objects.filter(office_id__building_id=building_id, is_usable=True).annotate(
+        reserved_by=Subquery(reserved_by)).order_by('office_id', 'desk_number', 'id').values_list(
+        'id', 'office_id', 'desk_number', 'reserved_by')
+
+
+def building_availability(building_id, day):
+    desks = availability_queryset(building_id, day)
+    return [
+        {
+            'id': desk_id,
+            'office_id': office_id,
+            'desk_number': desk_number,
+            'reserved_by': reserved_by,
+            'available': reserved_by is None,
+        }
+        for desk_id, office_id, desk_number, reserved_by in desks
+    ]
+
+
+# Desk reservations
+# Overlaps are rejected by the exclusion constraints of DeskReservation, so two
+# concurrent bookings of the same desk can not both succeed.
+class ReservationList(viewsets.ViewSet):
+    permission_classes = [UserAuthenticatedPermission]
+    serializer_class = ReservationSerializer
+    filter_fields = {
+        'desk_id': ('desk_id', int),
+        'user_id': ('user_id', int),
+        'office_id': ('desk_id__office_id', int),
+        'date': ('dates__contains', datetime.date.fromisoformat),
+    }
+
+    def list(self, request):
+        reservations = DeskReservation.objects.all()
+        context = get_auth_context(request)
+        if context.role not in ADMIN_ROLES:
+            # employees only see their own bookings
+            reservations = reservations.filter(user_id=context.user_id)
+        reservations = filter_queryset(reservations, request, self.filter_fields)
+        return paginate(with_dates(reservations), request, self, ReservationGetSerializer)
+
+    def create(self, request):
+        serializer = ReservationSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        context = get_auth_context(request)
+        user_id = context.user_id
+        if 'user_id' in data and data['user_id'] != user_id:
+            if context.role not in ADMIN_ROLES:
+                return Response({'user_id': 'You can only reserve desks for yourself.'},
+                                status=status.HTTP_403_FORBIDDEN)
+            user_id = data['user_id']
+            # the foreign key is only checked on commit, its IntegrityError would read as a conflict
+            if not User.userObjects.filter(pk=user_id).exists():
+                return Response({'user_id': 'Unknown or inactive user.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not Desk.objects.filter(id=data['desk_id'], is_usable=True).exists():
+            return Response({'desk_id': 'Unknown or unusable desk.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        dates = DateRange(data['start_date'], data['end_date'] + ONE_DAY)
+        try:
+            with transaction.atomic():
+                reservation = DeskReservation.objects.create(desk_id_id=data['desk_id'], user_id_id=user_id,
+                                                             dates=dates)
+        except IntegrityError:
+            # the desk or the user is already booked on some of the days
+            conflicts = with_dates(DeskReservation.objects.filter(
+                Q(desk_id=data['desk_id']) | Q(user_id=user_id), dates__overlap=dates))
+            return Response({'detail': 'The reservation overlaps existing reservations.',
+                             'conflicts': ReservationGetSerializer(conflicts.order_by('id'), many=True).data},
+                            status=status.HTTP_409_CONFLICT)
+        reservation = with_dates(DeskReservation.objects.filter(pk=reservation.pk)).get()
+        return Response(ReservationGetSerializer(reservation).data, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk=None):
+        reservation = get_object_or_404(with_dates(self._visible(request)), pk=pk)
+        return Response(ReservationGetSerializer(reservation).data)
+
+    def destroy(self, request, pk=None):
+        reservation = get_object_or_404(self._visible(request), pk=pk)
+        reservation.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def _visible(self, request):
+        context = get_auth_context(request)
+        if context.role in ADMIN_ROLES:
+            return DeskReservation.objects.all()
+        return DeskReservation.objects.filter(user_id=context.user_id)
@@ -0,0 +1,64 @@
+import hashlib
+from functools import wraps
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from rest_framework import status
+from rest_framework.response import Response
+from .authentication import get_auth_context
+from .models import ApiCacheVersion
+
+
+RESPONSE_TIMEOUT = 60 * 60
+
+
+# Versions are bumped once the writing transaction committed: a bump inside it would
+# hold the version row lock until commit and serialize every writer of the model.
+# A reader between the commit and the bump caches the new rows under the old version,
+# the bump then moves every reader on. Rolled back writes bump nothing.
+# The rows are created by migration 0016, an increment of an existing row is atomic
+# where concurrent first bumps could both create version 1.
+def bump_version(*model_names):
+    transaction.on_commit(
+        lambda: ApiCacheVersion.objects.filter(name__in=model_names).update(version=F('version') + 1))
+
+
+def get_versions(model_names):
+    versions = dict(ApiCacheVersion.objects.filter(name__in=model_names).values_list('name', 'version'))
+    return [versions.get(name, 0) for name in model_names]
+
+
+# Cache successful GET responses of a view per endpoint, role and office scope.
+# The cache key doubles as a strong ETag: it changes whenever one of the models
+# the view depends on is written, so a matching If-None-Match is answered with
+# 304 before any table query or serialization runs.
+def cached_response(*model_names):
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            context = get_auth_context(request)
+            role = context.role if context is not None else ''
+            scope = '|'.join(str(part) for part in (
+                request.get_host(),
+                request.path,
+                '&'.join(sorted(request.GET.urlencode().split('&'))),
+                role,
+                *get_versions(model_names),
+            ))
+            digest = hashlib.sha1(scope.encode()).hexdigest()
+            etag = '"%s"' % digest
+
+            if etag in request.headers.get('If-None-Match', ''):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+            key = 'api:response:%s' % digest
+            data = cache.get(key)
+            if data is not None:
+                return Response(data, headers={'ETag': etag})
+
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                cache.set(key, response.data, timeout=RESPONSE_TIMEOUT)
+                response['ETag'] = etag
+            return response
+        return wrapper
+    return decorator
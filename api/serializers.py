@@ -1,78 +1,210 @@
-from .models import User, Building, Office, Desk, Request
-from rest_framework import serializers
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+import datetime
+from .models import User, Building, Office, Desk, Request, DeskReservation, Office_Image
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import serializers, relations
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from .token_blacklist import FilteredRefreshToken
+from .metrics import record_current_phase
 import django.contrib.auth.password_validation as validate_password
 
 
-class UserListSerializer(serializers.ModelSerializer):
+# model serializers count their rendering in the 'serialize' phase of the request metrics,
+# the list pages time their projection in api.pagination.paginate
+class ModelSerializer(serializers.ModelSerializer):
+
+    def to_representation(self, instance):
+        with record_current_phase('serialize'):
+            return super().to_representation(instance)
+
+
+class UserListSerializer(ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'email', 'password', 'role', 'first_name', 'last_name', 'office_id', 'building_id', 
                   'gender', 'birth_date', 'nationality', 'remote_percentage') 
 
 
-class UserPostSerializer(serializers.ModelSerializer):
+class UserPostSerializer(ModelSerializer):
     class Meta:
         model = User
         fields = ('email', 'password', 'role', 'first_name', 'last_name', 'office_id', 'building_id', 
                   'gender', 'birth_date', 'nationality', 'remote_percentage')
     
 
-class UserUpdateSerializer(serializers.ModelSerializer):
+class UserUpdateSerializer(ModelSerializer):
     class Meta: 
         model = User
         fields = ('email', 'password', 'role', 'first_name', 'last_name', 'office_id', 'building_id',
                   'gender', 'birth_date', 'nationality', 'remote_percentage', 'img_url', 'is_active')
 
 
-class RequestSerializer(serializers.ModelSerializer):
+class RequestSerializer(ModelSerializer):
     class Meta:
         model = Request
         fields = ('user_id', 'office_id', 'remote_percentage', 'request_reason', 'status', 'reject_reason')
 
 
-class BuildingSerializer(serializers.ModelSerializer):
+class BuildingSerializer(ModelSerializer):
     class Meta:
         model = Building
         fields = ('name', 'address', 'floors_count', 'img_url')
 
 
-class BuildingGetSerializer(serializers.ModelSerializer):
+class BuildingGetSerializer(ModelSerializer):
     class Meta:
         model = Building
-        fields = ('id', 'name', 'address', 'floors_count', 'img_url')
+        fields = ('id', 'name', 'address', 'floors_count', 'img_url',
+                  'total_desks', 'usable_desks', 'occupied_desks', 'free_desks')
 
 
-class OfficeSerializer(serializers.ModelSerializer):
+class OfficeSerializer(ModelSerializer):
     class Meta:
         model = Office
         fields = ('name', 'building_id', 'floor_number', 'total_desks', 'usable_desks', 
                   'x_size_m', 'y_size_m', 'desk_ids', 'office_admin')
+        # maintained from the desks of the office
+        read_only_fields = ('total_desks', 'usable_desks', 'desk_ids')
 
+    # only the submitted fields are written, the counters are maintained with F() updates
+    def update(self, instance, validated_data):
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
 
-class OfficeGetSerializer(serializers.ModelSerializer):
+
+class OfficeGetSerializer(ModelSerializer):
     class Meta:
         model = Office
         fields = ('id', 'name', 'building_id', 'floor_number', 'total_desks', 'usable_desks', 
-                  'x_size_m', 'y_size_m', 'desk_ids', 'office_admin')
+                  'occupied_desks', 'free_desks', 'x_size_m', 'y_size_m', 'desk_ids', 'office_admin', 'thumbnails')
 
 
-class DeskSerializer(serializers.ModelSerializer):
+class OfficeImageSerializer(ModelSerializer):
+    class Meta:
+        model = Office_Image
+        fields = ('id', 'office_id', 'img_url', 'width', 'height', 'thumbnails', 'status', 'error')
+
+
+class DeskSerializer(ModelSerializer):
     class Meta:
         model = Desk
         fields = ('office_id', 'desk_number', 'user_id', 'is_usable',
                   'x_size_m', 'y_size_m', 'x_pos_px', 'y_pos_px')
 
 
-class DeskGetSerializer(serializers.ModelSerializer):
+class DeskGetSerializer(ModelSerializer):
     class Meta:
         model = Desk
         fields = ('id', 'office_id', 'desk_number', 'user_id', 'is_usable',
                   'x_size_m', 'y_size_m', 'x_pos_px', 'y_pos_px')
 
 
+# Read-only fast path for flat model serializers.
+# Rows are read as dicts with queryset.values() and rendered in place, without
+# building model instances. Fields whose representation of a database value is
+# the value itself are passed through, the others use the field's own
+# to_representation, so the rendered JSON is identical to serializer_class(many=True).data.
+class ProjectionSerializer:
+    PASS_THROUGH_FIELDS = (serializers.IntegerField, serializers.FloatField, serializers.BooleanField,
+                           serializers.CharField, relations.PrimaryKeyRelatedField)
+
+    def __init__(self, serializer_class):
+        self.columns = []
+        self.converters = []
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if field.source != name:
+                raise ImproperlyConfigured('%s.%s: only flat fields can be projected.' % (
+                    serializer_class.__name__, name))
+            self.columns.append(name)
+            if isinstance(field, serializers.ChoiceField) and not isinstance(field, serializers.MultipleChoiceField):
+                # choice values may be lazy translations, which render to the same JSON as their str
+                choices = {key: str(value) for key, value in field.choice_strings_to_values.items()}
+                self.converters.append((name, lambda value, choices=choices: choices.get(str(value), value)))
+            # CharField subclasses are not plain pass-through
+            elif type(field) not in self.PASS_THROUGH_FIELDS:
+                self.converters.append((name, field.to_representation))
+
+    def values(self, queryset, *extra_columns):
+        return queryset.values(*self.columns, *[column for column in extra_columns if column not in self.columns])
+
+    def render(self, rows, *extra_columns):
+        extra_columns = [column for column in extra_columns if column not in self.columns]
+        for row in rows:
+            for name, to_representation in self.converters:
+                value = row[name]
+                if value is not None:
+                    row[name] = to_representation(value)
+            for column in extra_columns:
+                del row[column]
+        return rows
+
+
+# one row of a bulk user import, offices, buildings and emails are checked in bulk by api.user_import
+class UserImportSerializer(serializers.Serializer):
+    email = serializers.EmailField(max_length=200)
+    password = serializers.CharField()
+    role = serializers.ChoiceField(choices=User.USER_TYPE_CHOICES, required=False, default=User.EMPLOYEE)
+    first_name = serializers.CharField(max_length=200)
+    last_name = serializers.CharField(max_length=200)
+    office_id = serializers.IntegerField(required=False, allow_null=True, default=None)
+    building_id = serializers.IntegerField(required=False, allow_null=True, default=None)
+    gender = serializers.ChoiceField(choices=User.GENDER_CHOICES, required=False, allow_blank=True, default='')
+    birth_date = serializers.DateField(required=False, allow_null=True, default=None)
+    nationality = serializers.CharField(max_length=200, required=False, allow_blank=True, default='None')
+    remote_percentage = serializers.FloatField(min_value=0, max_value=100, required=False, default=0)
+
+    def validate_birth_date(self, value):
+        if value is not None and value > datetime.date.today():
+            raise serializers.ValidationError("Can't select a future date.")
+        return value
+
+
+# approve or reject one pending request
+class RequestDecisionSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    approve = serializers.BooleanField()
+    reject_reason = serializers.CharField(required=False, allow_blank=False)
+
+
+# one desk of a bulk office layout import, users are checked in bulk by the view
+class DeskLayoutSerializer(serializers.Serializer):
+    desk_number = serializers.IntegerField(min_value=0)
+    user_id = serializers.IntegerField(required=False, allow_null=True, default=None)
+    is_usable = serializers.BooleanField(required=False, default=True)
+    x_size_m = serializers.FloatField(min_value=0)
+    y_size_m = serializers.FloatField(min_value=0)
+    x_pos_px = serializers.IntegerField(min_value=0)
+    y_pos_px = serializers.IntegerField(min_value=0)
+
+
+# desk booking for the inclusive dates start_date..end_date
+class ReservationSerializer(serializers.Serializer):
+    desk_id = serializers.IntegerField()
+    user_id = serializers.IntegerField(required=False)
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+
+    def validate(self, data):
+        if data['end_date'] < data['start_date']:
+            raise serializers.ValidationError({'end_date': 'The reservation can not end before it starts.'})
+        return data
+
+
+# reads reservations annotated by api.reservation_views.with_dates
+class ReservationGetSerializer(ModelSerializer):
+    start_date = serializers.DateField(read_only=True)
+    end_date = serializers.DateField(read_only=True)
+
+    class Meta:
+        model = DeskReservation
+        fields = ('id', 'desk_id', 'user_id', 'start_date', 'end_date')
+
+
 # admin can set new password for user
-class ChangePasswordSerializer(serializers.ModelSerializer):
+class ChangePasswordSerializer(ModelSerializer):
     password = serializers.CharField(write_only=True, required = True, validators=[validate_password])
     password2 = serializers.CharField(write_only=True, required = True)
 
@@ -105,4 +237,9 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         if not self.user.is_active:
             raise serializers.ValidationError("User is not active.")
             
-        return data
\ No newline at end of file
+        return data
+
+
+# refresh with the blacklist check served by the per worker filter
+class MyTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = FilteredRefreshToken
@@ -0,0 +1,156 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import User, Building, Office, Desk, Request, OfficeStats
+from . import analytics, occupancy
+from .response_cache import bump_version
+
+
+@receiver(pre_save, sender=Desk)
+def desk_pre_save(sender, instance, **kwargs):
+    # lock the stored row and remember what it counted for
+    instance._occupancy_before = None
+    if instance.pk is not None:
+        stored = Desk.objects.filter(pk=instance.pk)
+        if transaction.get_connection().in_atomic_block:
+            stored = stored.select_for_update()
+        instance._occupancy_before = stored.values_list('office_id', 'is_usable', 'user_id').first()
+
+
+@receiver(post_save, sender=Desk)
+def desk_post_save(sender, instance, **kwargs):
+    occupancy.desk_saved(instance, instance._occupancy_before)
+    if instance._occupancy_before is None:
+        occupancy.bump_layout_version(instance.office_id_id)
+    else:
+        occupancy.bump_layout_version(instance._occupancy_before[0], instance.office_id_id)
+
+
+@receiver(post_delete, sender=Desk)
+def desk_post_delete(sender, instance, **kwargs):
+    occupancy.desk_deleted(instance)
+    occupancy.bump_layout_version(instance.office_id_id)
+
+
+# User fields shown on the floor plans
+NAME_FIELDS = ('first_name', 'last_name')
+
+
+def _stored_state(instance, fields):
+    # lock the stored row and read what it counted for
+    stored = type(instance).objects.filter(pk=instance.pk)
+    if transaction.get_connection().in_atomic_block:
+        stored = stored.select_for_update()
+    return stored.values_list(*fields).first()
+
+
+@receiver(pre_save, sender=User)
+def user_pre_save(sender, instance, update_fields=None, **kwargs):
+    instance._stats_before = None
+    instance._names_before = None
+    if instance.pk is not None:
+        fields = analytics.USER_FIELDS + NAME_FIELDS
+        if update_fields is not None and not set(update_fields) & set(fields):
+            # e.g. last_login updates, nothing to count or redraw
+            instance._stats_before = analytics.user_state(instance)
+        else:
+            stored = _stored_state(instance, fields)
+            if stored is not None:
+                instance._stats_before = stored[:len(analytics.USER_FIELDS)]
+                instance._names_before = stored[len(analytics.USER_FIELDS):]
+
+
+@receiver(post_save, sender=User)
+def user_post_save(sender, instance, **kwargs):
+    analytics.move_stats(instance._stats_before, analytics.user_state(instance), analytics.user_stats)
+    if instance._names_before not in (None, (instance.first_name, instance.last_name)):
+        # the floor plans show the initials of the occupants
+        occupancy.bump_layout_version(*Desk.objects.filter(user_id=instance.pk).values_list('office_id', flat=True))
+
+
+@receiver(post_delete, sender=User)
+def user_post_delete(sender, instance, **kwargs):
+    analytics.move_stats(analytics.user_state(instance), None, analytics.user_stats)
+
+
+@receiver(pre_save, sender=Request)
+def request_pre_save(sender, instance, **kwargs):
+    instance._stats_before = None
+    if instance.pk is not None:
+        instance._stats_before = _stored_state(instance, ('office_id', 'status'))
+
+
+@receiver(post_save, sender=Request)
+def request_post_save(sender, instance, **kwargs):
+    analytics.move_stats(instance._stats_before, analytics.request_state(instance), analytics.request_stats)
+
+
+@receiver(post_delete, sender=Request)
+def request_post_delete(sender, instance, **kwargs):
+    analytics.move_stats(analytics.request_state(instance), None, analytics.request_stats)
+
+
+# Office fields the counters and floor plans depend on
+OFFICE_LAYOUT_FIELDS = ('building_id', 'x_size_m', 'y_size_m')
+
+
+@receiver(pre_save, sender=Office)
+def office_pre_save(sender, instance, update_fields=None, **kwargs):
+    # lock the stored row and remember its building, size and the counters added to the building
+    instance._layout_before = None
+    if instance.pk is not None and (update_fields is None or set(update_fields) & set(OFFICE_LAYOUT_FIELDS)):
+        instance._layout_before = _stored_state(instance, OFFICE_LAYOUT_FIELDS + occupancy.COUNTER_FIELDS)
+
+
+@receiver(post_save, sender=Office)
+def office_post_save(sender, instance, created, **kwargs):
+    if created:
+        OfficeStats.objects.create(office=instance)
+        return
+    before = instance._layout_before
+    if before is None:
+        return
+    building_id, x_size_m, y_size_m = before[:len(OFFICE_LAYOUT_FIELDS)]
+    if building_id != instance.building_id_id:
+        occupancy.office_moved(building_id, instance.building_id_id,
+                               dict(zip(occupancy.COUNTER_FIELDS, before[len(OFFICE_LAYOUT_FIELDS):])))
+    # the floor plans are drawn to the office size
+    if (x_size_m, y_size_m) != (instance.x_size_m, instance.y_size_m):
+        occupancy.bump_layout_version(instance.id)
+
+
+# change_version is set by a trigger (api.sync), the saved value is stale: drop it from
+# the instance, it is read from the database if used again
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Request)
+@receiver(post_save, sender=Building)
+@receiver(post_save, sender=Office)
+@receiver(post_save, sender=Desk)
+def change_version_saved(sender, instance, **kwargs):
+    instance.__dict__.pop('change_version', None)
+
+
+# invalidate cached API responses
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    bump_version('user')
+
+
+@receiver(post_save, sender=Building)
+@receiver(post_delete, sender=Building)
+def building_changed(sender, instance, **kwargs):
+    bump_version('building')
+
+
+@receiver(post_save, sender=Office)
+@receiver(post_delete, sender=Office)
+def office_changed(sender, instance, **kwargs):
+    bump_version('office')
+
+
+@receiver(post_save, sender=Desk)
+@receiver(post_delete, sender=Desk)
+def desk_changed(sender, instance, **kwargs):
+    # desk writes also update the office and building occupancy counters
+    bump_version('desk')
@@ -0,0 +1,140 @@
+import math
+from collections import defaultdict
+from django.conf import settings
+from .models import Office, Desk
+
+
+# desk positions are stored in pixels and sizes in meters
+PX_PER_METER = getattr(settings, 'FLOOR_PLAN_PX_PER_METER', 50)
+
+
+# Uniform grid over the desks of one office.
+# Each desk is stored as a pixel bounding box in every cell it touches, so region
+# queries only look at the cells covering the region instead of the whole floor.
+class DeskGrid:
+
+    def __init__(self, desks):
+        # desks: iterable of (id, x_pos_px, y_pos_px, x_size_m, y_size_m, is_usable, user_id)
+        self.boxes = {}
+        self.free = set()
+        for desk_id, x, y, x_size_m, y_size_m, is_usable, user_id in desks:
+            self.boxes[desk_id] = (x, y, x + x_size_m * PX_PER_METER, y + y_size_m * PX_PER_METER)
+            if is_usable and user_id is None:
+                self.free.add(desk_id)
+
+        # cells about twice the average desk size keep buckets small
+        if self.boxes:
+            extent = sum(max(x1 - x0, y1 - y0) for x0, y0, x1, y1 in self.boxes.values()) / len(self.boxes)
+        else:
+            extent = 0
+        self.cell_size = max(2 * extent, 16)
+        self.cells = defaultdict(list)
+        for desk_id, box in self.boxes.items():
+            for cell in self._cells(*box):
+                self.cells[cell].append(desk_id)
+        if self.cells:
+            self.bounds = (min(cx for cx, cy in self.cells), min(cy for cx, cy in self.cells),
+                           max(cx for cx, cy in self.cells), max(cy for cx, cy in self.cells))
+
+    def _cells(self, x0, y0, x1, y1):
+        size = self.cell_size
+        for cx in range(math.floor(x0 / size), math.floor(x1 / size) + 1):
+            for cy in range(math.floor(y0 / size), math.floor(y1 / size) + 1):
+                yield cx, cy
+
+    # desks intersecting the rectangle, only the occupied cells it covers are visited
+    def in_rect(self, x0, y0, x1, y1):
+        found = set()
+        if not self.cells:
+            return found
+        size = self.cell_size
+        min_cx, min_cy, max_cx, max_cy = self.bounds
+        cx0, cx1 = max(math.floor(x0 / size), min_cx), min(math.floor(x1 / size), max_cx)
+        cy0, cy1 = max(math.floor(y0 / size), min_cy), min(math.floor(y1 / size), max_cy)
+        cells = ((cx, cy) for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1))
+        for cell in cells:
+            for desk_id in self.cells.get(cell, ()):
+                bx0, by0, bx1, by1 = self.boxes[desk_id]
+                if bx0 <= x1 and x0 <= bx1 and by0 <= y1 and y0 <= by1:
+                    found.add(desk_id)
+        return found
+
+    # other desks whose footprint overlaps the desk
+    def overlapping(self, desk_id):
+        x0, y0, x1, y1 = self.boxes[desk_id]
+        found = set()
+        for other in self.in_rect(x0, y0, x1, y1) - {desk_id}:
+            bx0, by0, bx1, by1 = self.boxes[other]
+            # touching edges are not an overlap
+            if bx0 < x1 and x0 < bx1 and by0 < y1 and y0 < by1:
+                found.add(other)
+        return found
+
+    def _distance(self, desk_id, x, y):
+        x0, y0, x1, y1 = self.boxes[desk_id]
+        return math.hypot((x0 + x1) / 2 - x, (y0 + y1) / 2 - y)
+
+    # closest free usable desk (by desk center), searching rings of cells outwards
+    def nearest_free(self, x, y):
+        if not self.free:
+            return None
+        if len(self.free) <= 64:
+            return min(self.free, key=lambda desk_id: (self._distance(desk_id, x, y), desk_id))
+
+        size = self.cell_size
+        min_cx, min_cy, max_cx, max_cy = self.bounds
+        # Rings start from the occupied cell closest to the point. The desks lie inside the
+        # occupied cells, so they are no closer to the point than to its projection on them
+        # and the ring distance bound below still holds.
+        cx = min(max(math.floor(x / size), min_cx), max_cx)
+        cy = min(max(math.floor(y / size), min_cy), max_cy)
+        # rings past the farthest occupied cell are empty
+        last_ring = max(cx - min_cx, max_cx - cx, cy - min_cy, max_cy - cy)
+        best, best_distance = None, math.inf
+        for ring in range(last_ring + 1):
+            # every desk beyond this ring is at least (ring - 1) cells away
+            if best is not None and best_distance <= (ring - 1) * size:
+                break
+            for cell in self._ring(cx, cy, ring):
+                for desk_id in self.cells.get(cell, ()):
+                    if desk_id in self.free:
+                        distance = self._distance(desk_id, x, y)
+                        if (distance, desk_id) < (best_distance, best or 0):
+                            best, best_distance = desk_id, distance
+        return best
+
+    @staticmethod
+    def _ring(cx, cy, ring):
+        if ring == 0:
+            yield cx, cy
+            return
+        for dx in range(-ring, ring + 1):
+            yield cx + dx, cy - ring
+            yield cx + dx, cy + ring
+        for dy in range(-ring + 1, ring):
+            yield cx - ring, cy + dy
+            yield cx + ring, cy + dy
+
+
+# per worker cache of office id -> (layout_version, DeskGrid), least recently built dropped first
+_grids = {}
+MAX_CACHED_GRIDS = getattr(settings, 'DESK_GRID_CACHE_SIZE', 256)
+
+
+def get_desk_grid(office):
+    cached = _grids.get(office.id)
+    if cached is not None and cached[0] == office.layout_version:
+        return cached[1]
+    desks = Desk.objects.filter(office_id=office.id).values_list(
+        'id', 'x_pos_px', 'y_pos_px', 'x_size_m', 'y_size_m', 'is_usable', 'user_id')
+    grid = DeskGrid(desks)
+    _grids.pop(office.id, None)
+    _grids[office.id] = (office.layout_version, grid)
+    while len(_grids) > MAX_CACHED_GRIDS:
+        _grids.pop(next(iter(_grids)), None)
+    return grid
+
+
+def get_office_grid(office_id):
+    office = Office.objects.only('id', 'layout_version').get(pk=office_id)
+    return get_desk_grid(office)
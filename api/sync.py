@@ -0,0 +1,98 @@
+import datetime
+from django.db import connections, transaction
+from django.db.models import F, Max, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from .models import ApiCacheVersion, Tombstone
+from .pagination import IdCursorPagination, get_projection
+
+
+# Delta sync of the list endpoints, ?since=<cursor>.
+#
+# Inserts and updates stamp the row's change_version, deletes write a Tombstone, both
+# with the id of the writing transaction (triggers of migration 0014). Transaction ids
+# are handed out in start order but commit in any order, so a feed only goes up to the
+# oldest transaction still running: every row below it is committed and visible, and
+# rows of transactions still running are picked up by the next poll.
+# The cursor is "<version>.<id>" of the last row sent, since=0 returns every row.
+# The list filters do not apply: a row moved out of a filtered list would never be reported.
+# Deletes are filtered with the same lookups (user_id, office_id) as the caller's rows.
+
+# tombstones below this version were pruned, older cursors have to reload the list
+HORIZON_NAME = 'sync_horizon'
+
+
+def parse_cursor(value):
+    try:
+        version, _, last_id = value.partition('.')
+        version, last_id = int(version), int(last_id or 0)
+    except ValueError:
+        raise ValidationError({'since': 'Invalid cursor.'})
+    if version < 0 or last_id < 0:
+        raise ValidationError({'since': 'Invalid cursor.'})
+    return version, last_id
+
+
+def sync_horizons(database):
+    with connections[database].cursor() as cursor:
+        cursor.execute(
+            'SELECT txid_snapshot_xmin(txid_current_snapshot()), '
+            '(SELECT version FROM %s WHERE name = %%s)' % ApiCacheVersion._meta.db_table, [HORIZON_NAME])
+        return cursor.fetchone()
+
+
+def page_size(request):
+    try:
+        size = int(request.query_params.get(IdCursorPagination.page_size_query_param, IdCursorPagination.page_size))
+    except ValueError:
+        raise ValidationError({IdCursorPagination.page_size_query_param: 'Invalid value.'})
+    return min(max(size, 1), IdCursorPagination.max_page_size)
+
+
+# rows of queryset changed since the cursor plus the ids of the deleted ones, one page at
+# a time ("more" while the next page is ready), rendered like the list pages with their id
+def sync_response(queryset, model_name, request, serializer_class, visible=None):
+    version, last_id = parse_cursor(request.query_params['since'])
+    end, pruned = sync_horizons(queryset.db)
+    if version and pruned and version < pruned:
+        return Response({'detail': 'The cursor expired, reload the list.'}, status=status.HTTP_410_GONE)
+
+    size = page_size(request)
+    projection = get_projection(serializer_class)
+    changed = queryset.filter(change_version__gte=version, change_version__lt=end)
+    if last_id:
+        changed = changed.filter(Q(change_version__gt=version) | Q(id__gt=last_id))
+    rows = list(projection.values(changed.order_by('change_version', 'id'), 'change_version', 'id')[:size + 1])
+    more = len(rows) > size
+    if more:
+        rows = rows[:size]
+        # the next page starts behind the last row, deletes up to its version are sent now
+        end, cursor = rows[-1]['change_version'], '%d.%d' % (rows[-1]['change_version'], rows[-1]['id'])
+    else:
+        end = max(end, version)
+        cursor = '%d.0' % end
+    deleted = Tombstone.objects.using(queryset.db).filter(
+        model=model_name, change_version__gte=version, change_version__lt=end, **(visible or {})).values_list(
+        'object_id', flat=True)
+    return Response({
+        'cursor': cursor,
+        'more': more,
+        'results': projection.render(rows, 'change_version'),
+        'deleted': sorted(set(deleted)),
+    })
+
+
+# delete the tombstones older than days, cursors from before them get 410 Gone
+@transaction.atomic
+def prune_tombstones(days):
+    pruned = Tombstone.objects.filter(deleted_at__lt=timezone.now() - datetime.timedelta(days=days))
+    horizon = pruned.aggregate(version=Max('change_version'))['version']
+    if horizon is None:
+        return 0
+    horizon += 1
+    if not ApiCacheVersion.objects.filter(name=HORIZON_NAME).update(version=Greatest(F('version'), horizon)):
+        ApiCacheVersion.objects.create(name=HORIZON_NAME, version=horizon)
+    return pruned.delete()[0]
@@ -1,5 +1,61 @@
-from django.test import TestCase
+import datetime
+import random
+import struct
+import time
+import zlib
+from unittest import mock
+from django.test import TestCase, TransactionTestCase, AsyncClient, RequestFactory, override_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth.hashers import check_password
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+from .models import User, Building, Office, Desk, Request, DeskReservation, OfficeStats
+from .serializers import (MyTokenObtainPairSerializer, ProjectionSerializer, UserListSerializer, BuildingGetSerializer,
+                          OfficeSerializer, OfficeGetSerializer, DeskSerializer, DeskGetSerializer, RequestSerializer)
+from .occupancy import rebuild_occupancy
+from .spatial import DeskGrid
+from .response_cache import bump_version, get_versions
+from .benchmark import seed_organisation, api_endpoints, run_endpoints, read_endpoints
+from . import urls as api_urls
+from .query_plans import hot_queries, analyze, sequential_scans
+from .allocation import allocate_week, office_days, WORK_DAYS
+from .reservation_views import building_availability
+from . import export
+from .user_import import hash_passwords, import_users
+from . import user_import
+from .token_blacklist import MIN_CAPACITY, BlacklistFilter, BloomFilter, blacklist_filter
+from .analytics import rebuild_stats
+from .postgresql_pool.base import DatabaseWrapper as PooledDatabaseWrapper
+from .postgresql_pool.pool import ConnectionPool, _inherited
+from .metrics import render_pools
+import psycopg2
+from .middleware import ReplicaReadMiddleware
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+import tempfile
+import shutil
+from PIL import Image
+from .models import Office_Image
+from .db_router import PrimaryReplicaRouter
+from .models import Tombstone
+from .sync import prune_tombstones
+from .events import broker
+from offices.asgi import application as asgi_application
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken, BlacklistedToken
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.utils import timezone
+import uuid
+import csv
+import io
+import json
+from django.contrib.postgres.fields.ranges import DateRange
+from django.db import IntegrityError, transaction
+from django.http import StreamingHttpResponse
+from django.urls import resolve
 
 
 class UserModelTest(TestCase):
@@ -18,4 +74,1485 @@ class UserModelTest(TestCase):
         self.assertEqual(super_user.remote_percentage, 0)
         self.assertTrue(super_user.is_superuser)
         self.assertTrue(super_user.is_staff)
-        self.assertTrue(super_user.is_active)
\ No newline at end of file
+        self.assertTrue(super_user.is_active)
+
+# cached responses outlive the rolled back test transactions
+class ApiTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+
+def create_test_user(email, role='Employee', **fields):
+    return User.objects.create(email=email, role=role, first_name='Test', last_name='User',
+                               is_active=True, **fields)
+
+
+def auth_header(user):
+    token = MyTokenObtainPairSerializer.get_token(user).access_token
+    return {'HTTP_AUTHORIZATION': 'Bearer ' + str(token)}
+
+
+class AuthContextTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.building = Building.objects.create(name='HQ', floors_count=2, address='Main St 1')
+        self.office = Office.objects.create(name='Floor 1', building_id=self.building, floor_number=1,
+                                            total_desks=0, usable_desks=0)
+        self.admin = create_test_user('admin@test.com', role='Admin')
+        self.office_admin = create_test_user('officeadmin@test.com', role='Office Admin',
+                                             office_id=self.office)
+        self.employee = create_test_user('employee@test.com', office_id=self.office)
+
+    def test_role_permissions_use_claims_only(self):
+        # cache versions + buildings list query, no auth lookup
+        headers = auth_header(self.office_admin)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/buildings/', **headers)
+        self.assertEqual(response.status_code, 200)
+
+    def test_wrong_role_is_rejected(self):
+        response = self.client.get('/api/buildings/', **auth_header(self.employee))
+        self.assertEqual(response.status_code, 403)
+
+    def test_missing_token_is_rejected(self):
+        response = self.client.get('/api/requests/')
+        self.assertEqual(response.status_code, 403)
+
+    def test_me_single_user_lookup(self):
+        headers = auth_header(self.admin)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/me/', **headers)
+        self.assertEqual(response.json()['email'], 'admin@test.com')
+
+    def test_office_admin_requests_single_user_lookup(self):
+        Request.objects.create(user_id=self.employee, office_id=self.office, remote_percentage=50,
+                               request_reason='Commute')
+        # user lookup + requests query
+        headers = auth_header(self.office_admin)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/requests/', **headers)
+        self.assertEqual(len(response.json()['results']), 1)
+
+    def test_employee_requests_no_user_lookup(self):
+        headers = auth_header(self.employee)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/requests/', **headers)
+        self.assertEqual(response.json()['results'], [])
+
+
+class OfficeFloorPlanTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.building = Building.objects.create(name='HQ', floors_count=2, address='Main St 1')
+        self.office = Office.objects.create(name='Floor 1', building_id=self.building, floor_number=1,
+                                            total_desks=0, usable_desks=0)
+        self.admin = create_test_user('admin@test.com', role='Admin')
+        self.occupants = [create_test_user('user%d@test.com' % i) for i in range(20)]
+
+    def add_desks(self, count):
+        start = Desk.objects.filter(office_id=self.office).count()
+        Desk.objects.bulk_create([
+            Desk(office_id=self.office, desk_number=start + i,
+                 # every other desk is unassigned
+                 user_id=self.occupants[i % len(self.occupants)] if i % 2 else None)
+            for i in range(count)
+        ])
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_version('desk')
+
+    def test_query_count_constant(self):
+        headers = auth_header(self.admin)
+        for total in (10, 5000):
+            self.add_desks(total - Desk.objects.filter(office_id=self.office).count())
+            # cache versions + office + desks joined with occupants
+            with self.assertNumQueries(3):
+                response = self.client.get('/api/offices/%d/' % self.office.id, **headers)
+            self.assertEqual(len(response.json()['desks']), total)
+
+    def test_occupant_names(self):
+        self.add_desks(2)
+        desks = self.client.get('/api/offices/%d/' % self.office.id, **auth_header(self.admin)).json()['desks']
+        self.assertIsNone(desks[0]['user_name'])
+        self.assertEqual(desks[1]['user_name'], 'Test User')
+
+
+class ListPaginationTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.building = Building.objects.create(name='HQ', floors_count=2, address='Main St 1')
+        self.offices = [Office.objects.create(name='Floor %d' % i, building_id=self.building, floor_number=i,
+                                              total_desks=0, usable_desks=0) for i in range(2)]
+        Desk.objects.bulk_create([
+            Desk(office_id=self.offices[i % 2], desk_number=i, is_usable=i % 3 != 0) for i in range(250)
+        ])
+
+    def test_pages_cover_all_rows(self):
+        url, seen = '/api/desks/?page_size=40', []
+        while url:
+            # deep pages cost one range query (plus cache versions), like the first page
+            with self.assertNumQueries(2):
+                page = self.client.get(url).json()
+            seen += [desk['desk_number'] for desk in page['results']]
+            url = page['next']
+        self.assertEqual(sorted(seen), list(range(250)))
+
+    def test_filters(self):
+        response = self.client.get('/api/desks/?office_id=%d&is_usable=false&page_size=1000' % self.offices[0].id)
+        expected = Desk.objects.filter(office_id=self.offices[0], is_usable=False).count()
+        self.assertEqual(len(response.json()['results']), expected)
+
+    def test_invalid_filter(self):
+        response = self.client.get('/api/desks/?office_id=abc')
+        self.assertEqual(response.status_code, 400)
+
+    def test_filter_out_of_column_range(self):
+        response = self.client.get('/api/desks/?building_id=99999999999999999999')
+        self.assertEqual((response.status_code, response.json()), (400, {'building_id': 'Invalid value.'}))
+        headers = auth_header(create_test_user('admin@test.com', role='Admin'))
+        # floor_number is a 4 byte column, the ids are 8 byte ones
+        response = self.client.get('/api/offices/?floor_number=%d' % 2 ** 31, **headers)
+        self.assertEqual((response.status_code, response.json()), (400, {'floor_number': 'Invalid value.'}))
+        self.assertEqual(self.client.get('/api/offices/?floor_number=%d' % (2 ** 31 - 1), **headers).status_code, 200)
+        self.assertEqual(self.client.get('/api/offices/?building_id=%d' % 2 ** 31, **headers).status_code, 200)
+
+
+class OccupancyCounterTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.building = Building.objects.create(name='HQ', floors_count=2, address='Main St 1')
+        self.offices = [Office.objects.create(name='Floor %d' % i, building_id=self.building, floor_number=i)
+                        for i in range(2)]
+        self.user = create_test_user('employee@test.com')
+
+    def counters(self, instance):
+        instance.refresh_from_db()
+        return (instance.total_desks, instance.usable_desks, instance.occupied_desks, instance.free_desks)
+
+    def post_desk(self, **fields):
+        data = {'office_id': self.offices[0].id, 'desk_number': 1, 'user_id': '', 'is_usable': True,
+                'x_size_m': 1, 'y_size_m': 1, 'x_pos_px': 0, 'y_pos_px': 0}
+        data.update(fields)
+        self.assertEqual(self.client.post('/api/desks/', data).status_code, 201)
+        return Desk.objects.latest('id')
+
+    def test_create_update_delete(self):
+        desk = self.post_desk()
+        self.post_desk(desk_number=2, user_id=self.user.id)
+        self.assertEqual(self.counters(self.offices[0]), (2, 2, 1, 1))
+        self.assertEqual(self.offices[0].desk_ids, list(Desk.objects.order_by('id').values_list('id', flat=True)))
+
+        desk.is_usable = False
+        desk.save()
+        self.assertEqual(self.counters(self.offices[0]), (2, 1, 1, 0))
+        self.assertEqual(self.counters(self.building), (2, 1, 1, 0))
+
+        self.client.delete('/api/desks/%d/' % desk.id)
+        self.assertEqual(self.counters(self.offices[0]), (1, 1, 1, 0))
+        self.assertNotIn(desk.id, self.offices[0].desk_ids)
+
+    def test_move_between_offices(self):
+        desk = self.post_desk(user_id=self.user.id)
+        desk.office_id = self.offices[1]
+        desk.save()
+        self.assertEqual(self.counters(self.offices[0]), (0, 0, 0, 0))
+        self.assertEqual(self.counters(self.offices[1]), (1, 1, 1, 0))
+        self.assertEqual(self.offices[1].desk_ids, [desk.id])
+        self.assertEqual(self.counters(self.building), (1, 1, 1, 0))
+
+    def test_office_update_keeps_counters(self):
+        office = Office.objects.get(pk=self.offices[0].pk)
+        # added after the office was loaded
+        self.post_desk()
+        serializer = OfficeSerializer(office, data={'name': 'Renamed', 'building_id': self.building.id,
+                                                    'floor_number': 0, 'x_size_m': 10, 'y_size_m': 10})
+        self.assertTrue(serializer.is_valid())
+        serializer.save()
+        self.assertEqual(self.counters(self.offices[0]), (1, 1, 0, 1))
+        self.assertEqual(self.offices[0].name, 'Renamed')
+
+    def test_office_moves_counters_between_buildings(self):
+        self.post_desk()
+        self.post_desk(desk_number=2, user_id=self.user.id)
+        other = Building.objects.create(name='Annex', floors_count=1, address='Main St 2')
+        admin = create_test_user('admin@test.com', role='Admin')
+        response = self.client.put('/api/offices/%d/' % self.offices[0].id, {
+            'name': 'Floor 0', 'building_id': other.id, 'floor_number': 0, 'x_size_m': 10, 'y_size_m': 10,
+        }, content_type='application/json', **auth_header(admin))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counters(self.building), (0, 0, 0, 0))
+        self.assertEqual(self.counters(other), (2, 2, 1, 1))
+        self.assertEqual(self.counters(self.offices[0]), (2, 2, 1, 1))
+
+    def test_rebuild_fixes_drift(self):
+        Desk.objects.bulk_create([Desk(office_id=self.offices[1], desk_number=i) for i in range(3)])
+        self.assertEqual(rebuild_occupancy(), 2)
+        self.assertEqual(self.counters(self.offices[1]), (3, 3, 0, 3))
+        self.assertEqual(self.counters(self.building), (3, 3, 0, 3))
+        self.assertEqual(rebuild_occupancy(), 0)
+
+
+class BulkDeskLayoutTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.building = Building.objects.create(name='HQ', floors_count=2, address='Main St 1')
+        self.office = Office.objects.create(name='Floor 1', building_id=self.building, floor_number=1,
+                                            x_size_m=100, y_size_m=50)
+        self.admin = create_test_user('admin@test.com', role='Admin')
+        self.url = '/api/offices/%d/desks/bulk/' % self.office.id
+        self.headers = auth_header(self.admin)
+
+    def layout(self, count, **fields):
+        desks = [{'desk_number': i, 'x_size_m': 1.5, 'y_size_m': 0.8, 'x_pos_px': i % 50 * 20,
+                  'y_pos_px': i // 50 * 20, 'is_usable': True, 'user_id': None} for i in range(count)]
+        for desk in desks:
+            desk.update(fields)
+        return desks
+
+    def post(self, layout):
+        return self.client.post(self.url, layout, content_type='application/json', **self.headers)
+
+    def test_import_2000_desks(self):
+        layout = self.layout(2000)
+        # one insert per 1000 desks, the other queries (and the cache version bump after commit)
+        # do not grow with the layout
+        with self.assertNumQueries(11), self.captureOnCommitCallbacks(execute=True):
+            response = self.post(layout)
+        self.assertEqual(response.json(), {'created': 2000, 'updated': 0})
+        self.office.refresh_from_db()
+        self.assertEqual((self.office.total_desks, self.office.free_desks), (2000, 2000))
+        self.assertEqual(len(self.office.desk_ids), 2000)
+
+    def test_update_2000_desks(self):
+        layout = self.layout(2000)
+        layout[5]['user_id'] = self.admin.id
+        self.post(layout)
+        layout = self.layout(2000, x_size_m=1.2, is_usable=False)
+        # one update per 1000 desks
+        with self.assertNumQueries(11), self.captureOnCommitCallbacks(execute=True):
+            response = self.post(layout)
+        self.assertEqual(response.json(), {'created': 0, 'updated': 2000})
+        self.assertEqual(set(Desk.objects.values_list('x_size_m', 'is_usable', 'user_id')), {(1.2, False, None)})
+        self.office.refresh_from_db()
+        self.assertEqual((self.office.total_desks, self.office.usable_desks), (2000, 0))
+
+    def test_upsert(self):
+        self.post(self.layout(10))
+        layout = self.layout(12, is_usable=False)
+        layout[0]['user_id'] = self.admin.id
+        self.assertEqual(self.post(layout).json(), {'created': 2, 'updated': 10})
+        self.assertEqual(Desk.objects.get(desk_number=0).user_id, self.admin)
+        self.building.refresh_from_db()
+        self.assertEqual((self.building.total_desks, self.building.usable_desks), (12, 0))
+
+    def test_rejects_oversized_desk_and_unknown_user(self):
+        layout = self.layout(2)
+        layout[0]['x_size_m'] = 101
+        layout[1]['user_id'] = 0
+        response = self.post(layout)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'size', 'user_id'})
+        self.assertFalse(Desk.objects.exists())
+
+    def test_rejects_desk_outside_the_office(self):
+        layout = self.layout(1, x_pos_px=4950)
+        response = self.post(layout)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'position'})
+        layout[0]['x_pos_px'] = 4900
+        self.assertEqual(self.post(layout).status_code, 200)
+
+
+class DeskSpatialIndexTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.building = Building.objects.create(name='HQ', floors_count=2, address='Main St 1')
+        self.office = Office.objects.create(name='Floor 1', building_id=self.building, floor_number=1)
+        self.admin = create_test_user('admin@test.com', role='Admin')
+        rng = random.Random(6)
+        self.rows = [(i, rng.randrange(0, 4000), rng.randrange(0, 3000), 1.6, 0.8, rng.random() < 0.9,
+                      None if rng.random() < 0.3 else 1) for i in range(5000)]
+        self.grid = DeskGrid(self.rows)
+
+    def test_region_matches_brute_force(self):
+        expected = {desk_id for desk_id, (x0, y0, x1, y1) in self.grid.boxes.items()
+                    if x0 <= 1200 and 1000 <= x1 and y0 <= 900 and 500 <= y1}
+        self.assertEqual(self.grid.in_rect(1000, 500, 1200, 900), expected)
+
+    def test_nearest_free_matches_brute_force(self):
+        for x, y in ((0, 0), (2000, 1500), (3999, 10), (-500, 8000)):
+            expected = min(self.grid.free, key=lambda desk_id: (self.grid._distance(desk_id, x, y), desk_id))
+            self.assertEqual(self.grid.nearest_free(x, y), expected)
+
+    def test_overlapping(self):
+        grid = DeskGrid([(1, 0, 0, 1, 1, True, None), (2, 25, 25, 1, 1, True, None), (3, 80, 0, 1, 1, True, None)])
+        self.assertEqual(grid.overlapping(1), {2})
+        self.assertEqual(grid.overlapping(3), set())
+
+    def test_queries_are_sub_millisecond(self):
+        started = time.perf_counter()
+        for i in range(200):
+            self.grid.in_rect(i * 10, i * 5, i * 10 + 200, i * 5 + 200)
+            self.grid.nearest_free(i * 17, i * 13)
+        self.assertLess((time.perf_counter() - started) / 400, 0.001)
+
+    def test_endpoints_and_invalidation(self):
+        desk = Desk.objects.create(office_id=self.office, desk_number=1, x_pos_px=100, y_pos_px=100,
+                                   x_size_m=1, y_size_m=1)
+        headers = auth_header(self.admin)
+        url = '/api/offices/%d/desks/' % self.office.id
+        response = self.client.get(url + 'nearest_free/?x=0&y=0', **headers)
+        self.assertEqual(response.json()['id'], desk.id)
+        # office version + matched desks, the whole floor is never loaded
+        with self.assertNumQueries(2):
+            response = self.client.get(url + 'region/?x0=0&y0=0&x1=120&y1=120', **headers)
+        self.assertEqual([row['id'] for row in response.json()], [desk.id])
+
+        desk.user_id = self.admin
+        desk.save()
+        response = self.client.get(url + 'nearest_free/?x=0&y=0', **headers)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get(url + 'region/?x0=0', **headers).status_code, 400)
+        self.assertEqual(self.client.get(url + 'nearest_free/?x=inf&y=0', **headers).status_code, 400)
+
+    def test_queries_are_clipped_to_the_desks(self):
+        grid = DeskGrid([(1, 100, 100, 1, 1, True, None)])
+        # would cover about 10^10 cells
+        self.assertEqual(grid.in_rect(0, 0, 1e6, 1e6), {1})
+        self.assertEqual(grid.in_rect(1e6, 1e6, 2e6, 2e6), set())
+        self.assertEqual(DeskGrid([]).in_rect(0, 0, 1e6, 1e6), set())
+        for x, y in ((1e12, 1e12), (-1e12, 50), (1e9, -1e9)):
+            expected = min(self.grid.free, key=lambda desk_id: (self.grid._distance(desk_id, x, y), desk_id))
+            self.assertEqual(self.grid.nearest_free(x, y), expected)
+
+
+class ResponseCacheTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.building = Building.objects.create(name='HQ', floors_count=2, address='Main St 1')
+        self.office = Office.objects.create(name='Floor 1', building_id=self.building, floor_number=1)
+        self.admin = create_test_user('admin@test.com', role='Admin')
+        self.headers = auth_header(self.admin)
+
+    def test_not_modified(self):
+        response = self.client.get('/api/offices/', **self.headers)
+        etag = response['ETag']
+        # only the version lookup runs, no table query or serialization
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/offices/', HTTP_IF_NONE_MATCH=etag, **self.headers)
+        self.assertEqual(response.status_code, 304)
+
+    def test_cached_body(self):
+        first = self.client.get('/api/offices/%d/' % self.office.id, **self.headers)
+        with self.assertNumQueries(1):
+            second = self.client.get('/api/offices/%d/' % self.office.id, **self.headers)
+        self.assertEqual(first.json(), second.json())
+
+    def test_desk_write_invalidates(self):
+        etag = self.client.get('/api/offices/', **self.headers)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Desk.objects.create(office_id=self.office, desk_number=1)
+        response = self.client.get('/api/offices/', HTTP_IF_NONE_MATCH=etag, **self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['results'][0]['total_desks'], 1)
+
+    def test_versions_bumped_after_commit(self):
+        versions = get_versions(['desk'])
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                Desk.objects.create(office_id=self.office, desk_number=1)
+                transaction.set_rollback(True)
+            Desk.objects.create(office_id=self.office, desk_number=2)
+            # the version row is not locked by the writing transaction
+            self.assertEqual(get_versions(['desk']), versions)
+        # the rolled back write bumped nothing
+        self.assertEqual(get_versions(['desk']), [versions[0] + 1])
+
+    def test_etag_depends_on_role_and_query(self):
+        office_admin = create_test_user('officeadmin@test.com', role='Office Admin')
+        etags = {
+            self.client.get('/api/buildings/', **self.headers)['ETag'],
+            self.client.get('/api/buildings/', **auth_header(office_admin))['ETag'],
+            self.client.get('/api/buildings/?page_size=5', **self.headers)['ETag'],
+        }
+        self.assertEqual(len(etags), 3)
+
+
+class ProjectionSerializerTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        building = Building.objects.create(name='HQ', floors_count=2, address='Main St 1')
+        office = Office.objects.create(name='Floor 1', building_id=building, floor_number=1, x_size_m=12.5)
+        Office.objects.create(name='Floor 2', building_id=building, floor_number=2, desk_ids=[3, 1])
+        user = create_test_user('employee@test.com', office_id=office, gender='F',
+                                birth_date=datetime.date(1990, 5, 17), remote_percentage=40)
+        create_test_user('admin@test.com', role='Admin')
+        Desk.objects.create(office_id=office, desk_number=1, user_id=user, x_size_m=1.2)
+        Desk.objects.create(office_id=office, desk_number=2, is_usable=False)
+        Request.objects.create(user_id=user, office_id=office, remote_percentage=60, request_reason='Commute')
+
+    def test_identical_output(self):
+        renderer = JSONRenderer()
+        for model, serializer_class in ((User, UserListSerializer), (Building, BuildingGetSerializer),
+                                        (Office, OfficeGetSerializer), (Desk, DeskSerializer),
+                                        (Desk, DeskGetSerializer), (Request, RequestSerializer)):
+            queryset = model.objects.order_by('id')
+            projection = ProjectionSerializer(serializer_class)
+            rows = projection.render(list(projection.values(queryset, 'id')), 'id')
+            self.assertEqual(renderer.render(rows), renderer.render(serializer_class(queryset, many=True).data))
+
+
+class BenchmarkTest(ApiTestCase):
+
+    def test_every_endpoint_succeeds_on_seeded_org(self):
+        org = seed_organisation(buildings=1, floors=1, offices_per_floor=2, desks_per_office=30, users=40,
+                                requests=10, reservations=5)
+        results = run_endpoints(org, iterations=2)
+        self.assertEqual({name: row['status'] for name, row in results.items() if row['status'] not in (200, 201)},
+                         {})
+        self.assertGreater(results['offices.retrieve']['queries'], 0)
+        self.assertGreater(results['users.export']['queries'], 0)
+        self.assertEqual(Desk.objects.filter(office_id=org['office']).count(), 2000)
+        self.assertEqual(User.objects.filter(email__startswith='import-').count(), 10)
+
+    def test_every_route_is_benchmarked(self):
+        org = seed_organisation(buildings=1, floors=1, offices_per_floor=1, desks_per_office=5, users=10,
+                                requests=2, reservations=1)
+        covered = {resolve(path.partition('?')[0]).func for name, role, method, path, body in api_endpoints(org)}
+        routes = {pattern.callback for pattern in api_urls.router.urls if pattern.name != 'api-root'}
+        self.assertEqual(routes - covered, set())
+
+
+class MetricsTest(ApiTestCase):
+
+    def test_server_timing_and_metrics(self):
+        admin = create_test_user('admin@test.com', role='Admin')
+        response = self.client.get('/api/offices/', **auth_header(admin))
+        timing = response['Server-Timing']
+        for phase in ('total;dur=', 'auth;dur=', 'serialize;dur=', 'db;dur='):
+            self.assertIn(phase, timing)
+        self.assertIn('desc="2 queries"', timing)
+
+        metrics = self.client.get('/metrics').content.decode()
+        self.assertIn('# TYPE offices_request_duration_seconds histogram', metrics)
+        self.assertIn('offices_db_queries_bucket{view="OfficeList.list",method="GET",le="2"}', metrics)
+        self.assertRegex(metrics, r'offices_request_duration_seconds_count\{view="OfficeList.list",method="GET"\} \d+')
+
+    def test_retrieve_times_serialization(self):
+        admin = create_test_user('admin@test.com', role='Admin')
+        building = Building.objects.create(name='B', address='A', floors_count=1)
+        response = self.client.get('/api/buildings/%d/' % building.id, **auth_header(admin))
+        self.assertIn('serialize;dur=', response['Server-Timing'])
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.1'], METRICS_TOKEN='scrape')
+    def test_metrics_are_restricted(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer other').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code, 200)
+
+
+class RequestDecisionTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.building = Building.objects.create(name='HQ', floors_count=2, address='Main St 1')
+        self.offices = [Office.objects.create(name='Floor %d' % i, building_id=self.building, floor_number=i)
+                        for i in range(2)]
+        self.admin = create_test_user('admin@test.com', role='Admin')
+        self.office_admin = create_test_user('officeadmin@test.com', role='Office Admin', office_id=self.offices[0])
+
+    def create_requests(self, count, office):
+        users = User.objects.bulk_create([
+            User(email='user%d-%d-%d@test.com' % (office.id, count, i), first_name='Test', last_name='User', office_id=office)
+            for i in range(count)
+        ])
+        return Request.objects.bulk_create([
+            Request(user_id=user, office_id=office, remote_percentage=60, request_reason='Commute') for user in users
+        ])
+
+    def decide(self, user, decisions):
+        return self.client.post('/api/requests/decide/', decisions, content_type='application/json',
+                                **auth_header(user))
+
+    def test_query_count_independent_of_batch_size(self):
+        for count in (5, 300):
+            requests = self.create_requests(count, self.offices[0])
+            decisions = [{'id': item.id, 'approve': i % 2 == 0, 'reject_reason': 'Team is on site.'}
+                         for i, item in enumerate(requests)]
+            headers = auth_header(self.admin)
+            # lock, request update, user update, analytics summary update, the savepoint pair and the
+            # cache version bump after commit
+            with self.assertNumQueries(7), self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/requests/decide/', decisions, content_type='application/json',
+                                            **headers)
+            self.assertEqual(len(response.json()['approved']), (count + 1) // 2)
+
+    def test_decisions_apply(self):
+        approved, rejected = self.create_requests(2, self.offices[0])
+        response = self.decide(self.admin, [{'id': approved.id, 'approve': True},
+                                            {'id': rejected.id, 'approve': False, 'reject_reason': 'No.'}])
+        self.assertEqual(response.json(), {'approved': [approved.id], 'rejected': [rejected.id], 'skipped': []})
+        approved.refresh_from_db()
+        rejected.refresh_from_db()
+        self.assertEqual((approved.status, rejected.status, rejected.reject_reason), ('A', 'R', 'No.'))
+        self.assertEqual(User.objects.get(pk=approved.user_id_id).remote_percentage, 60)
+        self.assertEqual(User.objects.get(pk=rejected.user_id_id).remote_percentage, 0)
+        # already decided
+        self.assertEqual(self.decide(self.admin, [{'id': approved.id, 'approve': False}]).json()['skipped'],
+                         [approved.id])
+
+    def test_several_requests_of_one_user(self):
+        first, = self.create_requests(1, self.offices[0])
+        second = Request.objects.create(user_id=first.user_id, office_id=self.offices[0], remote_percentage=20,
+                                        request_reason='Commute')
+        # the bulk created rows skipped the signals
+        rebuild_stats()
+        response = self.decide(self.admin, [{'id': first.id, 'approve': True}, {'id': second.id, 'approve': True}])
+        self.assertEqual(response.json()['approved'], [first.id, second.id])
+        self.assertEqual(User.objects.get(pk=first.user_id_id).remote_percentage, 20)
+        # the analytics summary matches a full recount
+        self.assertEqual(rebuild_stats(), 0)
+
+    def test_office_admin_limited_to_own_office(self):
+        own, = self.create_requests(1, self.offices[0])
+        other, = self.create_requests(1, self.offices[1])
+        response = self.decide(self.office_admin, [{'id': own.id, 'approve': True}, {'id': other.id, 'approve': True}])
+        self.assertEqual(response.json(), {'approved': [own.id], 'rejected': [], 'skipped': [other.id]})
+
+    def test_employee_forbidden(self):
+        employee = create_test_user('employee@test.com')
+        self.assertEqual(self.decide(employee, []).status_code, 403)
+
+
+class HotQueryPlanTest(ApiTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.org = seed_organisation(buildings=2, floors=5, offices_per_floor=4, desks_per_office=150, users=10000,
+                                    requests=5000, reservations=20000)
+        analyze()
+
+    def test_hot_queries_use_indexes(self):
+        for name, (queryset, model) in hot_queries(self.org).items():
+            with self.subTest(name):
+                self.assertNotIn(model._meta.db_table, sequential_scans(queryset),
+                                 '%s:\n%s' % (name, queryset.explain()))
+
+
+class AllocationTest(ApiTestCase):
+
+    def check_plan(self, employees, desks, plan):
+        needed = {user_id: days for user_id, office_id, days, fixed_desk in employees}
+        booked = set()
+        for user_id, days in plan.items():
+            self.assertLessEqual(len(days), needed[user_id])
+            for day, desk_id in days.items():
+                self.assertNotIn((day, desk_id), booked)
+                booked.add((day, desk_id))
+        for day in range(WORK_DAYS):
+            self.assertLessEqual(sum(day in days for days in plan.values()), len(desks))
+
+    def test_random_plans_are_valid(self):
+        rng = random.Random(13)
+        for capacity in (50, 300, 1000):
+            desks = [(desk_id, desk_id % 7) for desk_id in range(capacity)]
+            employees = [(user_id, user_id % 7, office_days(rng.randrange(0, 101)), None) for user_id in range(1000)]
+            plan, unmet = allocate_week(employees, desks)
+            self.check_plan(employees, desks, plan)
+            placed = sum(len(days) for days in plan.values())
+            self.assertEqual(placed + unmet, sum(employee[2] for employee in employees))
+            if capacity == 1000:
+                self.assertEqual(unmet, 0)
+
+    def test_teams_are_spread_over_the_week(self):
+        desks = [(desk_id, desk_id % 4) for desk_id in range(400)]
+        employees = [(user_id, user_id % 4, 2 + user_id % 2, None) for user_id in range(400)]
+        plan, unmet = allocate_week(employees, desks)
+        for office_id in range(4):
+            per_day = [sum(day in plan[user_id] for user_id in range(office_id, 400, 4)) for day in range(WORK_DAYS)]
+            self.assertLessEqual(max(per_day) - min(per_day), 1)
+
+    def test_owners_keep_their_desk_and_others_mostly_keep_one_desk(self):
+        desks = [(desk_id, 1) for desk_id in range(10)]
+        employees = [(0, 1, 5, 3)] + [(user_id, 1, 2, None) for user_id in range(1, 19)]
+        plan, unmet = allocate_week(employees, desks)
+        self.assertEqual(plan[0], dict.fromkeys(range(WORK_DAYS), 3))
+        self.assertEqual(unmet, 0)
+        # the bucket search is greedy, a couple of people may change desk during the week
+        self.assertGreaterEqual(sum(len(set(days.values())) == 1 for days in plan.values()), 17)
+
+    def test_endpoint(self):
+        building = Building.objects.create(name='HQ', floors_count=2, address='Main St 1')
+        office = Office.objects.create(name='Floor 1', building_id=building, floor_number=1)
+        admin = create_test_user('admin@test.com', role='Admin')
+        users = [create_test_user('user%d@test.com' % i, office_id=office, remote_percentage=60) for i in range(4)]
+        Desk.objects.create(office_id=office, desk_number=1, user_id=users[0])
+        Desk.objects.create(office_id=office, desk_number=2)
+        Desk.objects.create(office_id=office, desk_number=3, is_usable=False)
+        for url in ('/api/offices/%d/allocation/' % office.id, '/api/buildings/%d/allocation/' % building.id):
+            response = self.client.get(url, {'week': '2026-10-21'}, **auth_header(admin))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['week'], '2026-10-19')
+            self.assertEqual(response.data['capacity'], 2)
+            self.assertEqual(sum(response.data['demand'].values()), 8)
+            self.assertEqual(response.data['unmet_days'], 0)
+            self.assertEqual(len(response.data['employees']), 4)
+        response = self.client.get('/api/offices/%d/allocation/' % office.id, {'week': 'monday'}, **auth_header(admin))
+        self.assertEqual(response.status_code, 400)
+
+
+class DeskReservationTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.building = Building.objects.create(name='HQ', floors_count=2, address='Main St 1')
+        self.office = Office.objects.create(name='Floor 1', building_id=self.building, floor_number=1)
+        self.desks = [Desk.objects.create(office_id=self.office, desk_number=i) for i in range(3)]
+        self.admin = create_test_user('admin@test.com', role='Admin')
+        self.alice = create_test_user('alice@test.com', office_id=self.office)
+        self.bob = create_test_user('bob@test.com', office_id=self.office)
+
+    def reserve(self, user, desk, start, end, **fields):
+        return self.client.post('/api/reservations/', {'desk_id': desk.id, 'start_date': start, 'end_date': end,
+                                                       **fields}, **auth_header(user))
+
+    def test_database_rejects_overlaps(self):
+        DeskReservation.objects.create(desk_id=self.desks[0], user_id=self.alice,
+                                       dates=DateRange(datetime.date(2026, 10, 19), datetime.date(2026, 10, 22)))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            DeskReservation.objects.create(desk_id=self.desks[0], user_id=self.bob,
+                                           dates=DateRange(datetime.date(2026, 10, 21), datetime.date(2026, 10, 23)))
+        # back to back ranges do not overlap
+        DeskReservation.objects.create(desk_id=self.desks[0], user_id=self.bob,
+                                       dates=DateRange(datetime.date(2026, 10, 22), datetime.date(2026, 10, 23)))
+
+    def test_create_and_conflicts(self):
+        response = self.reserve(self.alice, self.desks[0], '2026-10-19', '2026-10-21')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['start_date'], '2026-10-19')
+        self.assertEqual(response.data['end_date'], '2026-10-21')
+        # same desk, overlapping day
+        response = self.reserve(self.bob, self.desks[0], '2026-10-21', '2026-10-23')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual([conflict['user_id'] for conflict in response.data['conflicts']], [self.alice.id])
+        # same user, other desk
+        self.assertEqual(self.reserve(self.alice, self.desks[1], '2026-10-20', '2026-10-20').status_code, 409)
+        self.assertEqual(self.reserve(self.bob, self.desks[0], '2026-10-22', '2026-10-23').status_code, 201)
+        self.assertEqual(self.reserve(self.bob, self.desks[1], '2026-10-25', '2026-10-24').status_code, 400)
+        # employees book for themselves, admins for anyone
+        self.assertEqual(self.reserve(self.bob, self.desks[2], '2026-11-02', '2026-11-02',
+                                      user_id=self.alice.id).status_code, 403)
+        self.assertEqual(self.reserve(self.admin, self.desks[2], '2026-11-02', '2026-11-02',
+                                      user_id=self.alice.id).status_code, 201)
+        self.assertEqual(self.reserve(self.admin, self.desks[2], '2026-11-09', '2026-11-09',
+                                      user_id=0).data, {'user_id': 'Unknown or inactive user.'})
+        User.objects.filter(pk=self.bob.id).update(is_active=False)
+        self.assertEqual(self.reserve(self.admin, self.desks[2], '2026-11-09', '2026-11-09',
+                                      user_id=self.bob.id).status_code, 400)
+        User.objects.filter(pk=self.bob.id).update(is_active=True)
+        response = self.client.get('/api/reservations/', **auth_header(self.bob))
+        self.assertEqual([reservation['user_id'] for reservation in response.data['results']], [self.bob.id])
+        response = self.client.get('/api/reservations/', {'date': '2026-11-02'}, **auth_header(self.admin))
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_availability(self):
+        Desk.objects.create(office_id=self.office, desk_number=9, is_usable=False)
+        self.reserve(self.alice, self.desks[1], '2026-10-19', '2026-10-23')
+        with self.assertNumQueries(1):
+            desks = building_availability(self.building.id, datetime.date(2026, 10, 20))
+        self.assertEqual([(desk['id'], desk['reserved_by']) for desk in desks],
+                         [(self.desks[0].id, None), (self.desks[1].id, self.alice.id), (self.desks[2].id, None)])
+        response = self.client.get('/api/buildings/%d/availability/' % self.building.id, {'date': '2026-10-24'},
+                                   **auth_header(self.bob))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['available'], 3)
+        self.assertEqual(self.client.get('/api/buildings/0/availability/', {'date': '2026-10-24'},
+                                         **auth_header(self.bob)).status_code, 404)
+
+
+# the async views query from executor threads, on their own connections
+class AsyncReadTest(TransactionTestCase):
+    # keeps the cache version rows of migration 0016 for the tests after it
+    serialized_rollback = True
+
+    def setUp(self):
+        cache.clear()
+        self.org = seed_organisation(buildings=1, floors=1, offices_per_floor=2, desks_per_office=10, users=20,
+                                     requests=10)
+        employee = self.org['employee']
+        self.request_id = Request.objects.create(user_id=employee, office_id_id=employee.office_id_id,
+                                                 remote_percentage=40, request_reason='Test').id
+        # tokens are stored on creation, so they are built outside the async tests
+        self.admin_headers = auth_header(self.org['admin'])
+        self.employee_headers = auth_header(employee)
+
+    def asgi_headers(self, headers):
+        # AsyncClient takes raw header names
+        return {'authorization': headers['HTTP_AUTHORIZATION']}
+
+    def test_matches_sync_endpoints(self):
+        headers = {role: auth_header(self.org[role]) for role in ('admin', 'office_admin', 'employee')}
+        for name, role, path in read_endpoints(self.org):
+            with self.subTest(name):
+                sync_response = self.client.get('/api/' + path, **headers[role])
+                async_response = self.client.get('/api/async/' + path, **headers[role])
+                self.assertEqual(sync_response.status_code, 200)
+                self.assertEqual(async_response.status_code, 200)
+                sync_data, async_data = sync_response.json(), async_response.json()
+                if 'results' in sync_data:
+                    sync_data, async_data = sync_data['results'], async_data['results']
+                self.assertEqual(async_data, sync_data)
+
+    def test_bench_asgi_needs_scratch_database(self):
+        with self.assertRaisesMessage(CommandError, '--scratch-database'):
+            call_command('bench_asgi', asgi_url='http://127.0.0.1:1')
+
+    async def test_asgi_handler(self):
+        client = AsyncClient()
+        response = await client.get('/api/async/offices/', **self.asgi_headers(self.admin_headers))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('ETag', response)
+        self.assertEqual((await client.get('/api/async/offices/')).status_code, 403)
+        response = await client.get('/api/async/users/', **self.asgi_headers(self.employee_headers))
+        self.assertEqual(response.status_code, 403)
+        response = await client.get('/api/async/requests/%d/' % self.request_id, **self.asgi_headers(self.employee_headers))
+        self.assertEqual(response.status_code, 200)
+        response = await client.get('/api/async/desks/0/', **self.asgi_headers(self.admin_headers))
+        self.assertEqual(response.status_code, 404)
+
+
+class ExportTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.org = seed_organisation(buildings=2, floors=1, offices_per_floor=2, desks_per_office=700, users=300,
+                                     requests=100)
+        self.headers = auth_header(self.org['admin'])
+
+    def test_csv_streams_in_chunks(self):
+        response = self.client.get('/api/desks/export/csv/', **self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="desks.csv"')
+        parts = list(response.streaming_content)
+        # header, then one part per CHUNK_SIZE rows
+        self.assertEqual(len(parts), 1 + -(-2800 // export.CHUNK_SIZE))
+        rows = list(csv.reader(io.StringIO(b''.join(parts).decode())))
+        self.assertEqual(rows[0], [column for column, lookup in export.DESK_COLUMNS])
+        self.assertEqual([int(row[0]) for row in rows[1:]], list(Desk.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_ndjson_with_filters(self):
+        building = self.org['building']
+        response = self.client.get('/api/users/export/ndjson/', {'building_id': building.id}, **self.headers)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), User.objects.filter(building_id=building).count())
+        self.assertTrue(all(row['building_id'] == building.id for row in rows))
+        self.assertNotIn('password', rows[0])
+
+    def test_request_export_scope(self):
+        office_admin = self.org['office_admin']
+        response = self.client.get('/api/requests/export/ndjson/', **auth_header(office_admin))
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), Request.objects.filter(office_id=office_admin.office_id_id).count())
+        self.assertEqual(self.client.get('/api/users/export/csv/', **auth_header(office_admin)).status_code, 403)
+        self.assertEqual(self.client.get('/api/desks/export/xml/', **self.headers).status_code, 404)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class UserImportTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.building = Building.objects.create(name='HQ', floors_count=2, address='Main St 1')
+        self.office = Office.objects.create(name='Floor 1', building_id=self.building, floor_number=1)
+        self.admin = create_test_user('admin@test.com', role='Admin')
+
+    def row(self, i, **fields):
+        return {'email': 'user%d@test.com' % i, 'password': 'secret%d' % i, 'first_name': 'first',
+                'last_name': 'last', 'office_id': self.office.id, 'building_id': self.building.id, **fields}
+
+    def test_reports_row_errors_and_imports_the_rest(self):
+        rows = [self.row(1), self.row(2, email='admin@test.com'), self.row(3, office_id=0),
+                self.row(4, role='Boss'), self.row(1), self.row(5, role='Office Admin', gender='F')]
+        response = self.client.post('/api/users/import/', rows, content_type='application/json',
+                                    **auth_header(self.admin))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([(error['row'], sorted(error['errors'])) for error in response.data['errors']],
+                         [(2, ['email']), (3, ['office_id']), (4, ['role']), (5, ['email'])])
+        user = User.objects.get(email='user1@test.com')
+        self.assertEqual((user.first_name, user.office_id_id, user.role), ('First', self.office.id, 'Employee'))
+        self.assertTrue(user.check_password('secret1'))
+        self.assertEqual(User.objects.get(email='user5@test.com').role, 'Office Admin')
+
+    def test_queries_do_not_grow_with_rows(self):
+        import_users([self.row(i) for i in range(3)], workers=1)
+        with self.assertNumQueries(9), self.captureOnCommitCallbacks(execute=True):
+            import_users([self.row(i) for i in range(100, 400)], workers=1)
+        self.assertEqual(User.objects.count(), 304)
+
+    def test_email_taken_during_the_import(self):
+        def hash_and_sign_up(passwords, workers):
+            # a concurrent signup commits one of the checked emails before the insert
+            create_test_user('user2@test.com')
+            return hash_passwords(passwords, workers)
+
+        with mock.patch('api.user_import.hash_passwords', side_effect=hash_and_sign_up):
+            result = import_users([self.row(i) for i in range(1, 4)], workers=1)
+        self.assertEqual(result, {'created': 2, 'errors': [
+            {'row': 2, 'errors': {'email': ['A user with this email already exists.']}}]})
+        self.assertEqual(set(User.objects.filter(email__startswith='user').values_list('email', flat=True)),
+                         {'user1@test.com', 'user2@test.com', 'user3@test.com'})
+        # the summary counted only the inserted rows
+        self.assertEqual(rebuild_stats(), 0)
+
+    def test_csv_upload(self):
+        content = 'email,password,first_name,last_name,office_id,birth_date\n' \
+                  'a@test.com,pw,ann,lee,%d,1990-01-02\nb@test.com,pw,bob,,,\n' % self.office.id
+        upload = SimpleUploadedFile('users.csv', content.encode(), content_type='text/csv')
+        response = self.client.post('/api/users/import/', {'file': upload}, **auth_header(self.admin))
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([error['row'] for error in response.data['errors']], [2])
+        self.assertEqual(User.objects.get(email='a@test.com').birth_date, datetime.date(1990, 1, 2))
+
+    def test_hashing_in_worker_processes(self):
+        passwords = ['secret%d' % i for i in range(40)]
+        hashes = hash_passwords(passwords, workers=2)
+        self.assertTrue(all(check_password(password, hashed) for password, hashed in zip(passwords, hashes)))
+        # the worker processes are kept for the next import
+        pool = user_import.get_pool(2)
+        self.assertEqual(len(hash_passwords(passwords, workers=2)), 40)
+        self.assertIs(user_import.get_pool(2), pool)
+
+    def test_rows_per_request_are_capped(self):
+        rows = [{}] * (user_import.MAX_REQUEST_ROWS + 1)
+        response = self.client.post('/api/users/import/', rows, content_type='application/json',
+                                    **auth_header(self.admin))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(User.objects.count(), 1)
+
+
+class TokenBlacklistFilterTest(ApiTestCase):
+
+    def blacklist(self, count, first_id=None):
+        expires_at = timezone.now() + datetime.timedelta(days=1)
+        tokens = OutstandingToken.objects.bulk_create([
+            OutstandingToken(jti=uuid.uuid4().hex, token='-', expires_at=expires_at) for i in range(count)])
+        BlacklistedToken.objects.bulk_create([
+            BlacklistedToken(id=None if first_id is None else first_id + i, token=token)
+            for i, token in enumerate(tokens)])
+        return [token.jti for token in tokens]
+
+    def test_no_false_negatives(self):
+        jtis = self.blacklist(3000)
+        blacklist = BlacklistFilter(sync_seconds=3600)
+        self.assertTrue(all(blacklist.might_contain(jti) for jti in jtis))
+        # rows added after the load are found once the worker synced
+        jtis += self.blacklist(3000)
+        blacklist.sync(force=True)
+        self.assertTrue(all(blacklist.might_contain(jti) for jti in jtis))
+        false_positives = sum(blacklist.might_contain(uuid.uuid4().hex) for i in range(3000))
+        self.assertLess(false_positives, 90)
+
+    def test_rows_committed_out_of_id_order(self):
+        blacklist = BlacklistFilter(sync_seconds=0)
+        blacklist.sync()
+        later = self.blacklist(1, first_id=1000000)
+        self.assertTrue(blacklist.might_contain(later[0]))
+        # a lower id committed after the sync that saw the higher one
+        earlier = self.blacklist(1, first_id=999990)
+        self.assertTrue(blacklist.might_contain(earlier[0]))
+
+    def test_floor_follows_snapshot_horizon(self):
+        blacklist = BlacklistFilter()
+        blacklist.bloom = BloomFilter(MIN_CAPACITY)
+        with mock.patch('api.token_blacklist.time.monotonic', side_effect=[100, 110, 120]):
+            blacklist.merge(10, 20, [(5, 'a'), (7, 'b')])
+            # transactions below the first xmax may still commit ids up to 7
+            blacklist.merge(15, 25, [])
+            self.assertEqual(blacklist.floor, 0)
+            blacklist.merge(20, 30, [(6, 'c')])
+        self.assertEqual(blacklist.floor, 7)
+        self.assertEqual(blacklist.loaded_ids, set())
+        self.assertEqual(len(blacklist.checkpoints), 2)
+        self.assertTrue(all(jti in blacklist.bloom for jti in 'abc'))
+
+    def test_sync_interval(self):
+        blacklist = BlacklistFilter(sync_seconds=3600)
+        blacklist.sync()
+        with self.assertNumQueries(0):
+            self.assertFalse(blacklist.might_contain(uuid.uuid4().hex))
+
+    def test_blacklisted_by_another_worker(self):
+        jti = self.blacklist(1)[0]
+        workers = [BlacklistFilter(sync_seconds=0), BlacklistFilter(sync_seconds=0)]
+        for worker in workers:
+            worker.sync()
+        token = OutstandingToken.objects.create(jti=uuid.uuid4().hex, token='-',
+                                                expires_at=timezone.now() + datetime.timedelta(days=1))
+        self.assertFalse(workers[1].might_contain(token.jti))
+        # blacklisted through the first worker, refused by the second on its next sync
+        BlacklistedToken.objects.create(token=token)
+        workers[0].add(token.jti)
+        self.assertTrue(workers[1].might_contain(token.jti))
+        self.assertTrue(workers[1].might_contain(jti))
+
+    def test_refresh_rotation(self):
+        blacklist_filter.bloom = None
+        user = create_test_user('user@test.com')
+        refresh = str(MyTokenObtainPairSerializer.get_token(user))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/token/refresh/', {'refresh': refresh})
+        self.assertEqual(response.status_code, 200)
+        # the unknown JTI was answered by the filter
+        self.assertFalse([query for query in queries.captured_queries if
+                          'FROM "token_blacklist_blacklistedtoken"' in query['sql'] and '"jti" =' in query['sql']])
+        # the rotated token was blacklisted by this worker and is refused
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': refresh}).status_code, 401)
+        new_refresh = response.data['refresh']
+        self.assertEqual(self.client.post('/api/token/blacklist/', {'refresh_token': new_refresh}).status_code, 205)
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': new_refresh}).status_code, 401)
+
+
+class AnalyticsTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.building = Building.objects.create(name='HQ', floors_count=2, address='Main St 1')
+        self.offices = [Office.objects.create(name='Floor %d' % i, building_id=self.building, floor_number=i)
+                        for i in range(2)]
+        self.admin = create_test_user('admin@test.com', role='Admin')
+
+    def stats(self, office):
+        stats = OfficeStats.objects.get(office=office)
+        return (stats.employees, stats.remote_percentage_sum, stats.remote_0, stats.remote_1_25, stats.remote_26_50,
+                stats.remote_51_75, stats.remote_76_100, stats.pending_requests, stats.approved_requests,
+                stats.rejected_requests)
+
+    def test_user_and_request_changes(self):
+        user = create_test_user('employee@test.com', office_id=self.offices[0], remote_percentage=40)
+        create_test_user('other@test.com', office_id=self.offices[0])
+        self.assertEqual(self.stats(self.offices[0]), (2, 40, 1, 0, 1, 0, 0, 0, 0, 0))
+
+        user.office_id = self.offices[1]
+        user.remote_percentage = 80
+        user.save()
+        self.assertEqual(self.stats(self.offices[0]), (1, 0, 1, 0, 0, 0, 0, 0, 0, 0))
+        self.assertEqual(self.stats(self.offices[1]), (1, 80, 0, 0, 0, 0, 1, 0, 0, 0))
+
+        request = Request.objects.create(user_id=user, office_id=self.offices[1], remote_percentage=20,
+                                         request_reason='Commute')
+        self.assertEqual(self.stats(self.offices[1])[7:], (1, 0, 0))
+        self.client.post('/api/requests/decide/', [{'id': request.id, 'approve': True}],
+                         content_type='application/json', **auth_header(self.admin))
+        self.assertEqual(self.stats(self.offices[1]), (1, 20, 0, 1, 0, 0, 0, 0, 1, 0))
+
+        user.is_active = False
+        user.save()
+        self.assertEqual(self.stats(self.offices[1])[:7], (0, 0, 0, 0, 0, 0, 0))
+        request.refresh_from_db()
+        request.delete()
+        self.assertEqual(self.stats(self.offices[1])[7:], (0, 0, 0))
+        self.assertEqual(rebuild_stats(), 0)
+
+    def test_rebuild_fixes_drift(self):
+        User.objects.bulk_create([User(email='user%d@test.com' % i, first_name='Test', last_name='User',
+                                       office_id=self.offices[1], remote_percentage=i * 50, is_active=True)
+                                  for i in range(3)])
+        self.assertEqual(rebuild_stats(), 1)
+        self.assertEqual(self.stats(self.offices[1]), (3, 150, 1, 0, 1, 0, 1, 0, 0, 0))
+        self.assertEqual(rebuild_stats(), 0)
+
+    def test_endpoint(self):
+        org = seed_organisation(buildings=2, floors=2, offices_per_floor=2, desks_per_office=10, users=200,
+                                requests=100, seed=19)
+        headers = auth_header(org['admin'])
+        # one query for the offices and one for the buildings, whatever the headcount
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/analytics/', **headers)
+        data = response.json()
+        office = next(row for row in data['offices'] if row['id'] == org['office'].id)
+        users = User.userObjects.filter(office_id=org['office'])
+        self.assertEqual(office['employees'], users.count())
+        self.assertEqual(sum(office['remote_percentage']['distribution'].values()), users.count())
+        self.assertEqual(office['requests']['pending'],
+                         Request.objects.filter(office_id=org['office'], status='P').count())
+        occupied = Desk.objects.filter(office_id=org['office'], user_id__isnull=False).count()
+        self.assertEqual(office['occupancy_percentage'], round(100 * occupied / 10, 1))
+        building = next(row for row in data['buildings'] if row['id'] == org['building'].id)
+        self.assertEqual(building['employees'], User.userObjects.filter(office_id__building_id=org['building']).count())
+        self.assertEqual(data['organisation']['requests']['pending'], Request.objects.filter(status='P').count())
+        self.assertEqual(self.client.get('/api/analytics/', **auth_header(org['employee'])).status_code, 403)
+
+
+class ConnectionPoolTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.pools = []
+
+    def tearDown(self):
+        for pool in self.pools:
+            pool.close_idle()
+
+    def make_pool(self, **options):
+        pool = ConnectionPool('pool-test', **options)
+        self.pools.append(pool)
+        return pool
+
+    def connect(self):
+        return psycopg2.connect(**connection.get_connection_params())
+
+    def backend_pid(self, raw):
+        with raw.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            return cursor.fetchone()[0]
+
+    def test_reuse_and_rollback(self):
+        pool = self.make_pool()
+        raw = pool.get(self.connect)
+        with raw.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        pool.put(raw)
+        self.assertEqual(raw.get_transaction_status(), psycopg2.extensions.TRANSACTION_STATUS_IDLE)
+        self.assertIs(pool.get(self.connect), raw)
+        pool.put(raw)
+        self.assertEqual(pool.stats(), dict(size=1, idle=1, in_use=0, waiting=0, checkouts=2, timeouts=0, connects=1,
+                                            health_check_failures=0))
+
+    def test_max_size_timeout(self):
+        pool = self.make_pool(max_size=1, timeout=0.05)
+        raw = pool.get(self.connect)
+        with self.assertRaises(psycopg2.OperationalError):
+            pool.get(self.connect)
+        pool.put(raw)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_health_check_replaces_dead_connection(self):
+        pool = self.make_pool(check_after=0)
+        raw = pool.get(self.connect)
+        dead_pid = self.backend_pid(raw)
+        pool.put(raw)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [dead_pid])
+        fresh = pool.get(self.connect)
+        self.assertNotEqual(self.backend_pid(fresh), dead_pid)
+        pool.put(fresh)
+        self.assertEqual((pool.stats()['health_check_failures'], pool.stats()['size']), (1, 1))
+
+    def test_fork_starts_empty_pool(self):
+        pool = self.make_pool()
+        inherited = pool.get(self.connect)
+        pool.put(inherited)
+        # as seen from a forked worker
+        pool.pid = -1
+        fresh = pool.get(self.connect)
+        self.assertIsNot(fresh, inherited)
+        self.assertIn(inherited, _inherited)
+        pool.put(fresh)
+        _inherited.remove(inherited)
+        inherited.close()
+
+    def test_database_wrapper_returns_connections(self):
+        settings_dict = dict(connection.settings_dict, POOL={'MAX_SIZE': 2})
+        wrapper = PooledDatabaseWrapper(settings_dict, alias='pool_test')
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            first = cursor.fetchone()[0]
+        self.pools.append(wrapper.pool)
+        wrapper.close()
+        # the pool is shared with the default connection of the tests
+        connects = wrapper.pool.stats()['connects']
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            self.assertEqual(cursor.fetchone()[0], first)
+        wrapper.close()
+        self.assertEqual(wrapper.pool.stats()['connects'], connects)
+        self.assertIn('offices_db_pool_checkouts_total{database="%s"}' % settings_dict['NAME'],
+                      '\n'.join(render_pools()))
+
+
+@override_settings(DATABASE_REPLICAS=['replica_test'], REPLICA_STICKY_SECONDS=0.2)
+class ReplicaRouterTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = create_test_user('employee@test.com')
+        self.other = create_test_user('other@test.com')
+        self.factory = RequestFactory()
+        # the database the ORM would read from inside the request, no query is run
+        self.middleware = ReplicaReadMiddleware(lambda request: Desk.objects.all().db)
+
+    def read_database(self, method, user=None):
+        headers = auth_header(user) if user is not None else {}
+        return self.middleware(getattr(self.factory, method)('/api/desks/', **headers))
+
+    def test_reads_go_to_replica_writes_to_primary(self):
+        self.assertEqual(self.read_database('get', self.user), 'replica_test')
+        self.assertEqual(self.read_database('get'), 'replica_test')
+        self.assertEqual(self.read_database('post', self.user), 'default')
+
+    def test_read_your_writes(self):
+        self.read_database('put', self.user)
+        self.assertEqual(self.read_database('get', self.user), 'default')
+        self.assertEqual(self.read_database('get', self.other), 'replica_test')
+        time.sleep(0.3)
+        self.assertEqual(self.read_database('get', self.user), 'replica_test')
+
+    def test_async_requests(self):
+        async def get_response(request):
+            return Desk.objects.all().db
+
+        middleware = ReplicaReadMiddleware(get_response)
+        self.assertEqual(async_to_sync(middleware)(self.factory.get('/api/desks/', **auth_header(self.user))),
+                         'replica_test')
+
+    def test_streamed_responses_read_from_the_replica(self):
+        def chunks():
+            yield Desk.objects.all().db
+
+        middleware = ReplicaReadMiddleware(lambda request: StreamingHttpResponse(chunks()))
+        response = middleware(self.factory.get('/api/desks/export/csv/', **auth_header(self.user)))
+        # the chunks are read once the middleware is done, as by the server
+        self.assertEqual(b''.join(response.streaming_content), b'replica_test')
+
+    def test_outside_requests_and_migrations(self):
+        router = PrimaryReplicaRouter()
+        self.assertIsNone(router.db_for_read(Desk))
+        self.assertEqual(router.db_for_write(Desk), 'default')
+        self.assertFalse(router.allow_migrate('replica_test', 'api'))
+        self.assertIsNone(router.allow_migrate('default', 'api'))
+
+
+class OfficeImageTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, IMAGE_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        building = Building.objects.create(name='HQ', floors_count=1, address='Main St 1')
+        self.office = Office.objects.create(name='Floor 0', building_id=building, floor_number=0)
+        self.headers = auth_header(create_test_user('admin@test.com', role='Admin'))
+
+    def upload(self, content, name='office.png'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/offices/%d/images/' % self.office.id,
+                                    {'image': SimpleUploadedFile(name, content)}, **self.headers)
+
+    def png(self, width, height):
+        output = io.BytesIO()
+        Image.new('RGB', (width, height), (200, 120, 40)).save(output, 'PNG')
+        return output.getvalue()
+
+    def test_upload_generates_thumbnails(self):
+        response = self.upload(self.png(1200, 800))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'P')
+        image = Office_Image.objects.get(pk=response.json()['id'])
+        self.assertEqual((image.status, image.width, image.height), ('R', 1200, 800))
+        self.assertEqual(sorted(image.thumbnails, key=int), ['160', '320', '640'])
+
+        thumbnail = self.client.get(image.thumbnails['320'])
+        self.assertEqual(thumbnail['Content-Type'], 'image/webp')
+        self.assertIn('immutable', thumbnail['Cache-Control'])
+        with Image.open(io.BytesIO(b''.join(thumbnail.streaming_content))) as rendered:
+            self.assertEqual(rendered.width, 320)
+        self.assertEqual(self.client.get(image.thumbnails['320'], HTTP_IF_NONE_MATCH=thumbnail['ETag']).status_code,
+                         304)
+
+        offices = self.client.get('/api/offices/', **self.headers).json()['results']
+        self.assertEqual(offices[0]['thumbnails'], image.thumbnails)
+
+    def test_rejects_invalid_files(self):
+        response = self.upload(b'not an image', name='office.png')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Office_Image.objects.exists())
+        self.assertEqual(self.client.get('/media/offices/missing.webp').status_code, 404)
+
+    def test_rejects_too_many_pixels(self):
+        # a 1x1 PNG claiming 10000x10000 pixels in its header
+        content = self.png(1, 1)
+        header = b'IHDR' + struct.pack('>II', 10000, 10000) + content[24:29]
+        content = content[:12] + header + struct.pack('>I', zlib.crc32(header)) + content[33:]
+        response = self.upload(content)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('megapixels', str(response.json()))
+        self.assertFalse(Office_Image.objects.exists())
+
+    def test_jpeg_thumbnails(self):
+        output = io.BytesIO()
+        Image.new('RGB', (4000, 3000), (200, 120, 40)).save(output, 'JPEG')
+        image = Office_Image.objects.get(pk=self.upload(output.getvalue(), name='office.jpg').json()['id'])
+        self.assertEqual(image.status, 'R')
+        thumbnail = self.client.get(image.thumbnails['640'])
+        with Image.open(io.BytesIO(b''.join(thumbnail.streaming_content))) as rendered:
+            self.assertEqual(rendered.size, (640, 480))
+
+    def test_failures_are_recorded(self):
+        with mock.patch('api.office_images.render_thumbnails', side_effect=ValueError('Unsupported mode')):
+            response = self.upload(self.png(100, 100))
+        image = Office_Image.objects.get(pk=response.json()['id'])
+        self.assertEqual((image.status, image.error), ('F', 'Unsupported mode'))
+
+
+class FloorPlanSvgTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        building = Building.objects.create(name='HQ', floors_count=1, address='Main St 1')
+        self.office = Office.objects.create(name='Floor 0', building_id=building, floor_number=0,
+                                            x_size_m=20, y_size_m=10)
+        self.user = create_test_user('jane@test.com')
+        self.user.first_name, self.user.last_name = 'Jane', 'Doe'
+        self.user.save()
+        self.desks = [
+            Desk.objects.create(office_id=self.office, desk_number=1, user_id=self.user, x_size_m=1.6, y_size_m=0.8,
+                                x_pos_px=10, y_pos_px=10),
+            Desk.objects.create(office_id=self.office, desk_number=2, x_size_m=1.6, y_size_m=0.8, x_pos_px=100,
+                                y_pos_px=10),
+            Desk.objects.create(office_id=self.office, desk_number=3, is_usable=False, x_size_m=1.6, y_size_m=0.8,
+                                x_pos_px=200, y_pos_px=10),
+        ]
+        self.headers = auth_header(self.user)
+        self.path = '/api/offices/%d/floor_plan.svg/' % self.office.id
+
+    def test_render(self):
+        response = self.client.get(self.path, **self.headers)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        svg = response.content.decode()
+        self.assertTrue(svg.startswith('<svg xmlns="http://www.w3.org/2000/svg" width="1000" height="500"'))
+        self.assertIn('<title>Desk 1: Jane Doe</title><rect class="desk occupied" x="10" y="10" width="80" '
+                      'height="40"/><text x="50" y="30">JD</text>', svg)
+        self.assertIn('class="desk free" x="100"', svg)
+        self.assertIn('class="desk unusable" x="200"', svg)
+
+    def test_cached_per_layout_version(self):
+        first = self.client.get(self.path, **self.headers)
+        # office lookup only
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.path, **self.headers).content, first.content)
+        self.assertEqual(self.client.get(self.path, HTTP_IF_NONE_MATCH=first['ETag'], **self.headers).status_code, 304)
+
+        self.desks[1].user_id = self.user
+        self.desks[1].save()
+        second = self.client.get(self.path, **self.headers)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.content.decode().count('desk occupied'), 2)
+
+        self.user.first_name = 'Ada'
+        self.user.save()
+        self.assertIn('>AD</text>', self.client.get(self.path, **self.headers).content.decode())
+
+    def test_office_saves_keep_layout_version(self):
+        stale = Office.objects.get(pk=self.office.pk)
+        version = stale.layout_version
+        self.desks[1].save()
+        # a rename neither writes back the loaded version nor bumps it
+        stale.name = 'Renamed'
+        stale.save()
+        self.office.refresh_from_db()
+        self.assertEqual((self.office.name, self.office.layout_version), ('Renamed', version + 1))
+        stale.x_size_m = 30
+        stale.save()
+        self.office.refresh_from_db()
+        self.assertEqual((self.office.x_size_m, self.office.layout_version), (30, version + 2))
+
+
+# change versions are transaction ids, so every write has to commit
+class SyncFeedTest(TransactionTestCase):
+    # keeps the cache version rows of migration 0016 for the tests after it
+    serialized_rollback = True
+
+    def setUp(self):
+        cache.clear()
+        self.building = Building.objects.create(name='HQ', floors_count=1, address='Main St 1')
+        self.office = Office.objects.create(name='Floor 0', building_id=self.building, floor_number=0)
+        self.desks = [Desk.objects.create(office_id=self.office, desk_number=number) for number in range(5)]
+
+    def sync(self, cursor, path='/api/desks/', **params):
+        response = self.client.get(path, {'since': cursor, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_changes_since_cursor(self):
+        first = self.sync('0')
+        self.assertEqual([desk['id'] for desk in first['results']], [desk.id for desk in self.desks])
+        self.assertFalse(first['more'])
+        # horizon, changed rows and tombstones
+        with self.assertNumQueries(3):
+            self.assertEqual(self.sync(first['cursor'])['results'], [])
+
+        self.desks[2].is_usable = False
+        self.desks[2].save()
+        Desk.objects.filter(pk=self.desks[3].pk).update(desk_number=30)
+        deleted_id = self.desks[4].id
+        self.desks[4].delete()
+        changes = self.sync(first['cursor'])
+        self.assertEqual([(desk['id'], desk['desk_number'], desk['is_usable']) for desk in changes['results']],
+                         [(self.desks[2].id, 2, False), (self.desks[3].id, 30, True)])
+        self.assertEqual(changes['deleted'], [deleted_id])
+        self.assertEqual(self.sync(changes['cursor']), {
+            'cursor': changes['cursor'], 'more': False, 'results': [], 'deleted': []})
+
+    def test_pages(self):
+        seen, cursor, more = [], '0', True
+        while more:
+            page = self.sync(cursor, page_size=2)
+            self.assertLessEqual(len(page['results']), 2)
+            seen += [desk['id'] for desk in page['results']]
+            cursor, more = page['cursor'], page['more']
+        self.assertEqual(seen, [desk.id for desk in self.desks])
+
+    def test_waits_for_running_transactions(self):
+        cursor = self.sync('0')['cursor']
+        writer = psycopg2.connect(**connection.get_connection_params())
+        try:
+            with writer.cursor() as write:
+                write.execute('UPDATE api_desk SET desk_number = 10 WHERE id = %s', [self.desks[0].id])
+                # a later transaction commits first
+                self.desks[1].save()
+                page = self.sync(cursor)
+                self.assertEqual([desk['id'] for desk in page['results']], [])
+                writer.commit()
+        finally:
+            writer.close()
+        page = self.sync(page['cursor'])
+        self.assertEqual([desk['id'] for desk in page['results']], [self.desks[0].id, self.desks[1].id])
+
+    def test_requests_feed_is_scoped(self):
+        employee = create_test_user('employee@test.com', office_id=self.office)
+        other = create_test_user('other@test.com', office_id=self.office)
+        own = Request.objects.create(user_id=employee, office_id=self.office, request_reason='own')
+        others = [Request.objects.create(user_id=other, office_id=self.office, request_reason='other')
+                  for i in range(2)]
+        own.status = Request.APPROVED
+        own.save()
+        headers = auth_header(employee)
+        response = self.client.get('/api/requests/', {'since': '0'}, **headers)
+        self.assertEqual([row['id'] for row in response.json()['results']], [own.id])
+        self.assertEqual(response.json()['results'][0]['status'], 'A')
+        # only the deletes of the caller's own requests are sent
+        deleted = [own.id, others[0].id]
+        own.delete()
+        others[0].delete()
+        response = self.client.get('/api/requests/', {'since': response.json()['cursor']}, **headers)
+        self.assertEqual(response.json()['deleted'], [deleted[0]])
+        office_admin = create_test_user('officeadmin@test.com', role='Office Admin', office_id=self.office)
+        response = self.client.get('/api/requests/', {'since': '0'}, **auth_header(office_admin))
+        self.assertEqual(response.json()['deleted'], sorted(deleted))
+
+    def test_saved_instances_read_their_change_version(self):
+        desk = self.desks[0]
+        desk.desk_number = 10
+        desk.save()
+        self.assertEqual(desk.change_version, Desk.objects.get(pk=desk.pk).change_version)
+        self.assertGreater(desk.change_version, 0)
+
+    def test_expired_cursor(self):
+        cursor = self.sync('0')['cursor']
+        self.desks[0].delete()
+        Tombstone.objects.update(deleted_at=timezone.now() - datetime.timedelta(days=60))
+        self.assertEqual(prune_tombstones(30), 1)
+        self.assertEqual(self.client.get('/api/desks/', {'since': cursor}).status_code, 410)
+        self.assertEqual(len(self.sync('0')['results']), 4)
+        self.assertEqual(self.client.get('/api/desks/', {'since': 'x'}).status_code, 400)
+
+
+# notifications are only sent on commit
+class RequestEventsTest(TransactionTestCase):
+    # keeps the cache version rows of migration 0016 for the tests after it
+    serialized_rollback = True
+
+    def setUp(self):
+        building = Building.objects.create(name='HQ', floors_count=1, address='Main St 1')
+        self.office = Office.objects.create(name='Floor 0', building_id=building, floor_number=0)
+        other_office = Office.objects.create(name='Floor 1', building_id=building, floor_number=1)
+        self.employee = create_test_user('employee@test.com', office_id=self.office)
+        self.office_admin = create_test_user('office.admin@test.com', role='Office Admin', office_id=self.office)
+        self.other_admin = create_test_user('other.admin@test.com', role='Office Admin', office_id=other_office)
+
+    def stream(self, user, path='/api/events/requests/'):
+        headers = [(b'authorization', auth_header(user)['HTTP_AUTHORIZATION'].encode())] if user else []
+        return ApplicationCommunicator(asgi_application, {
+            'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'', 'headers': headers})
+
+    async def open(self, stream):
+        await stream.send_input({'type': 'http.request'})
+        start = await stream.receive_output(5)
+        body = await stream.receive_output(5)
+        return start['status'], body['body']
+
+    async def event(self, stream):
+        message = await stream.receive_output(5)
+        event, data = message['body'].decode().strip().split('\n')
+        return event, json.loads(data[len('data: '):])
+
+    def test_pushes_to_the_user_and_office_admins(self):
+        streams = [self.stream(user) for user in (self.employee, self.office_admin, self.other_admin)]
+
+        async def scenario():
+            try:
+                for stream in streams:
+                    self.assertEqual(await self.open(stream), (200, b'retry: 5000\n\n'))
+                request = await sync_to_async(Request.objects.create)(
+                    user_id=self.employee, office_id=self.office, remote_percentage=40, request_reason='x')
+                for stream in streams[:2]:
+                    self.assertEqual(await self.event(stream), ('event: created', {
+                        'id': request.id, 'user_id': self.employee.id, 'office_id': self.office.id,
+                        'status': 'P', 'remote_percentage': 40}))
+
+                # unchanged status, no event
+                await sync_to_async(request.save)()
+                await sync_to_async(Request.objects.filter(pk=request.pk).update)(status=Request.APPROVED)
+                for stream in streams[:2]:
+                    event, data = await self.event(stream)
+                    self.assertEqual((event, data['status']), ('event: updated', 'A'))
+                self.assertTrue(await streams[2].receive_nothing())
+
+                for stream in streams:
+                    await stream.send_input({'type': 'http.disconnect'})
+                    await stream.wait(5)
+                self.assertEqual(broker.subscribers, {})
+            finally:
+                broker.close()
+        async_to_sync(scenario)()
+
+    def test_streams_end_when_the_listen_connection_fails(self):
+        stream = self.stream(self.employee)
+
+        async def scenario():
+            try:
+                self.assertEqual((await self.open(stream))[0], 200)
+                self.assertEqual(broker.connection.get_dsn_parameters()['keepalives'], '1')
+                pid = broker.connection.get_backend_pid()
+                await sync_to_async(self.terminate)(pid)
+                self.assertEqual(await stream.receive_output(5), {'type': 'http.response.body', 'body': b''})
+                self.assertIsNone(broker.connection)
+            finally:
+                broker.close()
+        async_to_sync(scenario)()
+
+    def terminate(self, pid):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [pid])
+
+    def test_unauthenticated(self):
+        async def scenario():
+            stream = self.stream(None)
+            await stream.send_input({'type': 'http.request'})
+            self.assertEqual((await stream.receive_output(5))['status'], 401)
+        async_to_sync(scenario)()
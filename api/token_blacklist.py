@@ -0,0 +1,154 @@
+import hashlib
+import math
+import threading
+import time
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+# seconds between two incremental reads of new blacklist rows in a worker, tokens other
+# workers blacklisted within that time can still be used once
+SYNC_SECONDS = getattr(settings, 'TOKEN_BLACKLIST_SYNC_SECONDS', 1)
+# an id is taken just before its transaction id, a checkpoint waits this long for that gap
+CHECKPOINT_GRACE_SECONDS = 5
+MIN_CAPACITY = 1024
+
+# Unexpired blacklist rows above an id, read with the snapshot they were read in.
+# Every row gives one result row, with no row above the id a single row of NULLs.
+SYNC_SQL = '''
+    SELECT txid_snapshot_xmin(snapshot), txid_snapshot_xmax(snapshot), blacklisted.id, outstanding.jti
+    FROM txid_current_snapshot() AS snapshot
+    LEFT JOIN (%(blacklisted)s AS blacklisted JOIN %(outstanding)s AS outstanding
+               ON outstanding.id = blacklisted.token_id AND outstanding.expires_at > now())
+    ON blacklisted.id > %%s
+''' % {'blacklisted': BlacklistedToken._meta.db_table, 'outstanding': OutstandingToken._meta.db_table}
+
+
+class BloomFilter:
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, key):
+        # double hashing on two halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+
+# Per worker Bloom filter of blacklisted refresh token JTIs.
+# Loaded with the unexpired blacklist on first use and topped up with the rows added
+# since, at most every SYNC_SECONDS, plus the tokens this worker blacklists itself.
+# A JTI missing from the filter is not blacklisted (as of the last sync), one in the
+# filter may be a false positive and is checked in the database.
+#
+# Ids are not committed in order, so every sync reads the rows above a floor below
+# which all rows are known to be loaded. Each sync checkpoints the highest id it saw
+# with the snapshot's xmax: every id up to it was taken by a transaction below xmax.
+# Once a later snapshot's xmin passes that xmax those transactions have ended and
+# the floor moves up to the checkpoint, as the sync horizon of api.sync does.
+class BlacklistFilter:
+
+    def __init__(self, sync_seconds=SYNC_SECONDS):
+        self.sync_seconds = sync_seconds
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.floor = 0
+        # ids above the floor already in the filter
+        self.loaded_ids = set()
+        # (xmax, highest id seen, monotonic time) of the syncs not below the floor yet
+        self.checkpoints = []
+        self.synced_at = 0
+        self.syncing = False
+
+    def read(self, floor):
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute(SYNC_SQL, [floor])
+            rows = cursor.fetchall()
+        xmin, xmax = rows[0][:2]
+        return xmin, xmax, [(row_id, jti) for _, _, row_id, jti in rows if row_id is not None]
+
+    def merge(self, xmin, xmax, rows):
+        for row_id, jti in rows:
+            if row_id > self.floor and row_id not in self.loaded_ids:
+                self.bloom.add(jti)
+                self.loaded_ids.add(row_id)
+        now = time.monotonic()
+        self.checkpoints.append((xmax, max(self.loaded_ids, default=self.floor), now))
+        settled = [checkpoint for checkpoint in self.checkpoints
+                   if checkpoint[0] <= xmin and now - checkpoint[2] >= CHECKPOINT_GRACE_SECONDS]
+        if settled:
+            self.floor = max(self.floor, settled[-1][1])
+            self.checkpoints = [checkpoint for checkpoint in self.checkpoints if checkpoint[2] > settled[-1][2]]
+            self.loaded_ids = {row_id for row_id in self.loaded_ids if row_id > self.floor}
+        self.synced_at = now
+
+    def load(self):
+        xmin, xmax, rows = self.read(0)
+        self.bloom = BloomFilter(max(MIN_CAPACITY, 2 * len(rows)))
+        self.floor = 0
+        self.loaded_ids = set()
+        self.checkpoints = []
+        self.merge(xmin, xmax, rows)
+
+    def sync(self, force=False):
+        with self.lock:
+            if self.bloom is None:
+                # nothing to answer with yet, the other threads wait for the load
+                self.load()
+                return
+            if self.syncing or not force and time.monotonic() - self.synced_at < self.sync_seconds:
+                return
+            self.syncing = True
+            floor = self.floor
+        # the other threads keep checking against the filter meanwhile
+        try:
+            xmin, xmax, rows = self.read(floor)
+            with self.lock:
+                self.merge(xmin, xmax, rows)
+                if self.bloom.count > self.bloom.capacity:
+                    # rebuild larger, which also drops the expired tokens
+                    self.load()
+        finally:
+            self.syncing = False
+
+    def might_contain(self, jti):
+        self.sync()
+        return jti in self.bloom
+
+    def add(self, jti):
+        with self.lock:
+            if self.bloom is not None:
+                self.bloom.add(jti)
+
+
+blacklist_filter = BlacklistFilter()
+
+
+# refresh token whose blacklist check only reaches the database for JTIs in the filter
+class FilteredRefreshToken(RefreshToken):
+
+    def check_blacklist(self):
+        if blacklist_filter.might_contain(self.payload[api_settings.JTI_CLAIM]):
+            super().check_blacklist()
+
+    def blacklist(self):
+        result = super().blacklist()
+        blacklist_filter.add(self.payload[api_settings.JTI_CLAIM])
+        return result
@@ -4,6 +4,8 @@ from .building_views import BuildingList#, BuildingDetail
 from .office_views import OfficeList#, OfficeDetail
 from .desk_views import DeskList#, DeskDetail
 from .request_views import RequestList#, RequestDetail
+from .reservation_views import ReservationList
+from .analytics_views import AnalyticsView
 from rest_framework.routers import DefaultRouter
 
 
@@ -19,6 +21,8 @@ router.register('buildings', BuildingList, basename='post')
 router.register('offices', OfficeList, basename='post')
 router.register('desks', DeskList, basename='post')
 router.register('requests', RequestList, basename='post')
+router.register('reservations', ReservationList, basename='reservations')
+router.register('analytics', AnalyticsView, basename='analytics')
 
 
 urlpatterns = router.urls
\ No newline at end of file
@@ -0,0 +1,168 @@
+import csv
+import io
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from .models import User, Office, Building
+from .serializers import UserImportSerializer
+from .response_cache import bump_version
+from .analytics import StatsDelta, user_state, user_stats
+
+
+BATCH_SIZE = 1000
+# below this many passwords starting the worker processes costs more than it saves
+INLINE_HASH_ROWS = 16
+WORKERS = getattr(settings, 'USER_IMPORT_WORKERS', None) or os.cpu_count()
+# rows of one import request, larger files go through the import_users command
+MAX_REQUEST_ROWS = getattr(settings, 'USER_IMPORT_MAX_ROWS', 10000)
+
+
+def parse_rows(content, file_format):
+    if file_format == 'json':
+        rows = json.loads(content)
+        if not isinstance(rows, list):
+            raise ValueError('Expected a list of users.')
+        return rows
+    # empty CSV cells are missing values
+    return [{key: value for key, value in row.items() if value not in ('', None)}
+            for row in csv.DictReader(io.StringIO(content))]
+
+
+def check_request_rows(rows):
+    if len(rows) > MAX_REQUEST_ROWS:
+        raise ValueError('At most %d users can be imported at once.' % MAX_REQUEST_ROWS)
+
+
+_pool = None
+_pool_key = None
+_pool_lock = threading.Lock()
+
+
+# one pool per process and worker count, started by the first import that needs it
+def get_pool(workers):
+    global _pool, _pool_key
+    with _pool_lock:
+        if _pool is None or _pool_key != (os.getpid(), workers):
+            _pool = ProcessPoolExecutor(max_workers=workers, initializer=django.setup)
+            _pool_key = (os.getpid(), workers)
+        return _pool
+
+
+def discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+# Password hashing is CPU bound (PBKDF2), it runs in a pool of worker processes.
+def hash_passwords(passwords, workers=WORKERS):
+    if workers <= 1 or len(passwords) <= INLINE_HASH_ROWS:
+        return [make_password(password) for password in passwords]
+    chunksize = max(1, len(passwords) // (workers * 4))
+    pool = get_pool(workers)
+    try:
+        return list(pool.map(make_password, passwords, chunksize=chunksize))
+    except BrokenProcessPool:
+        # a worker died, e.g. killed for memory, the next pool starts fresh ones
+        discard_pool(pool)
+        return list(get_pool(workers).map(make_password, passwords, chunksize=chunksize))
+
+
+# Create users in bulk.
+# Every row is validated on its own and invalid rows are reported by their
+# 1-based position without stopping the import. Emails, offices and buildings are
+# checked with one query each, the valid rows are inserted in batches.
+def import_users(rows, workers=WORKERS):
+    errors = {}
+    valid = []
+    for number, row in enumerate(rows, 1):
+        serializer = UserImportSerializer(data=row)
+        if serializer.is_valid():
+            valid.append((number, serializer.validated_data))
+        else:
+            errors[number] = serializer.errors
+
+    for number, data in valid:
+        data['email'] = User.objects.normalize_email(data['email'])
+    emails = {data['email'] for number, data in valid}
+    existing = set(User.objects.filter(email__in=emails).values_list('email', flat=True))
+    offices = set(Office.objects.filter(
+        id__in={data['office_id'] for number, data in valid}).values_list('id', flat=True))
+    buildings = set(Building.objects.filter(
+        id__in={data['building_id'] for number, data in valid}).values_list('id', flat=True))
+
+    accepted = []
+    seen = set()
+    for number, data in valid:
+        row_errors = {}
+        if data['email'] in existing:
+            row_errors['email'] = ['A user with this email already exists.']
+        elif data['email'] in seen:
+            row_errors['email'] = ['This email appears more than once in the import.']
+        if data['office_id'] is not None and data['office_id'] not in offices:
+            row_errors['office_id'] = ['Unknown office.']
+        if data['building_id'] is not None and data['building_id'] not in buildings:
+            row_errors['building_id'] = ['Unknown building.']
+        seen.add(data['email'])
+        if row_errors:
+            errors[number] = row_errors
+        else:
+            accepted.append((number, data))
+
+    passwords = hash_passwords([data['password'] for number, data in accepted], workers)
+    # same normalisation as CustomUserManager.create_user
+    users = [
+        User(
+            email=data['email'],
+            password=password,
+            role=str(data['role']),
+            first_name=data['first_name'].capitalize(),
+            last_name=data['last_name'].capitalize(),
+            office_id_id=data['office_id'],
+            building_id_id=data['building_id'],
+            gender=data['gender'],
+            birth_date=data['birth_date'],
+            nationality=data['nationality'].capitalize(),
+            remote_percentage=data['remote_percentage'],
+        )
+        for (number, data), password in zip(accepted, passwords)
+    ]
+    numbers = [number for number, data in accepted]
+    with transaction.atomic():
+        while True:
+            try:
+                with transaction.atomic():
+                    User.objects.bulk_create(users, batch_size=BATCH_SIZE)
+                break
+            except IntegrityError:
+                # another request created some of the emails after the check above
+                taken = set(User.objects.filter(email__in=[user.email for user in users]).values_list(
+                    'email', flat=True))
+                if not taken:
+                    raise
+                kept = []
+                for number, user in zip(numbers, users):
+                    if user.email in taken:
+                        errors[number] = {'email': ['A user with this email already exists.']}
+                    else:
+                        kept.append((number, user))
+                numbers, users = [number for number, user in kept], [user for number, user in kept]
+        # bulk inserts skip the User signals
+        if users:
+            bump_version('user')
+            delta = StatsDelta()
+            for user in users:
+                delta.move(None, user_state(user), user_stats)
+            delta.apply()
+    return {
+        'created': len(users),
+        'errors': [{'row': number, 'errors': errors[number]} for number in sorted(errors)],
+    }
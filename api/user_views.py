@@ -1,10 +1,15 @@
 from .models import User
 from .serializers import UserListSerializer, UserPostSerializer, UserUpdateSerializer
 from .permissions import UserAuthenticatedPermission, UserAdminPermission, UserOfficeAdminPermission
+from .authentication import get_auth_context
+from .pagination import filter_queryset, paginate, parse_bool
+from .export import USER_COLUMNS, export_response
+from .user_import import parse_rows, check_request_rows, import_users
+from .sync import sync_response
 from rest_framework import status, viewsets
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
-from rest_framework_simplejwt.authentication import JWTAuthentication
 from django.shortcuts import get_object_or_404
 from django.http import JsonResponse
 from django.forms.models import model_to_dict
@@ -15,9 +20,7 @@ class Me(viewsets.ViewSet):
     permission_classes = [UserAdminPermission]
 
     def list(self, request):
-        response = JWTAuthentication().authenticate(request)
-        user , token = response
-        user = get_object_or_404(User, pk=user.id)
+        user = get_auth_context(request).user
         response_fields = ['id', 'email', 'first_name', 'last_name', 'role' ]
         return JsonResponse(model_to_dict(user, fields=response_fields), safe=False)
 
@@ -26,11 +29,25 @@ class UserList(viewsets.ViewSet):
     permission_classes = [UserAdminPermission]
     queryset = User.objects.all()
     serializer_class = UserPostSerializer
+    filter_fields = {
+        'office_id': ('office_id', int),
+        'building_id': ('building_id', int),
+        'role': ('role', str),
+        'is_active': ('is_active', parse_bool),
+    }
 
+    # ?since=<cursor> returns the changed and deleted users instead, see api.sync
     def list(self, request):
-        users = User.objects.all()
-        serializer = UserListSerializer(users, many=True)
-        return Response(serializer.data)
+        if 'since' in request.query_params:
+            return sync_response(User.objects.all(), 'user', request, UserListSerializer)
+        users = filter_queryset(User.objects.all(), request, self.filter_fields)
+        return paginate(users, request, self, UserListSerializer)
+
+    # stream every user matching the list filters as CSV or NDJSON
+    @action(detail=False, methods=['get'], url_path=r'export/(?P<file_format>csv|ndjson)')
+    def export(self, request, file_format=None):
+        users = filter_queryset(User.objects.all(), request, self.filter_fields)
+        return export_response(users, USER_COLUMNS, file_format, 'users')
 
     # create a new user with CustomUserManager
     def create(self, request):
@@ -49,10 +66,27 @@ class UserList(viewsets.ViewSet):
                 nationality=serializer.validated_data['nationality'],
                 remote_percentage=serializer.validated_data['remote_percentage'],
             )
-            user.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    # create many users from a CSV/JSON file upload ('file') or a JSON list body
+    # invalid rows are reported and skipped, the others are created
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_users(self, request):
+        upload = request.FILES.get('file')
+        try:
+            if upload is not None:
+                file_format = 'json' if upload.name.lower().endswith('.json') else 'csv'
+                rows = parse_rows(upload.read().decode('utf-8-sig'), file_format)
+            elif isinstance(request.data, list):
+                rows = request.data
+            else:
+                raise ValueError('Upload a CSV or JSON file or send a list of users.')
+            check_request_rows(rows)
+        except (ValueError, UnicodeDecodeError) as error:
+            return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(import_users(rows), status=status.HTTP_200_OK)
+
 
 class UserDetail(viewsets.ViewSet):
     permission_classes = [UserAdminPermission]
@@ -67,9 +101,9 @@ class UserDetail(viewsets.ViewSet):
     # Update a user
     # to-do: handle password update
     def update(self, request, pk=None):
-        response = JWTAuthentication().authenticate(request)
-        if response is not None:
-            user , token = response
+        context = get_auth_context(request)
+        if context is not None:
+            user = context.user
             serializer = UserUpdateSerializer(user, data=request.data)
             if serializer.is_valid():
                 user.save()
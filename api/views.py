@@ -1,12 +1,12 @@
 from .permissions import UserAdminPermission
 from .models import User
-from .serializers import MyTokenObtainPairSerializer, ChangePasswordSerializer
+from .serializers import MyTokenObtainPairSerializer, MyTokenRefreshSerializer, ChangePasswordSerializer
+from .token_blacklist import FilteredRefreshToken
 from rest_framework import viewsets, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
-from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 
 
@@ -19,17 +19,37 @@ class getRoutesView(APIView):
         {'GET': '/admin', 'description': 'Admin Dashboard'},
         {'GET': '/api/users'},
         {'GET': '/api/users/<int:pk>'},
+        {'GET': '/api/users/export/<csv|ndjson>'},
+        {'POST': '/api/users/import'},
         {'GET': '/api/users/<int:pk>/requests'},
         {'GET': '/api/buildings'},
         {'GET': '/api/buildings/<int:pk>'},
+        {'GET': '/api/buildings/<int:pk>/allocation'},
+        {'GET': '/api/buildings/<int:pk>/availability'},
         {'GET': '/api/offices'},
         {'GET': '/api/offices/<int:pk>'},
+        {'GET': '/api/offices/<int:pk>/allocation'},
+        {'GET': '/api/offices/<int:pk>/floor_plan.svg'},
+        {'GET': '/api/offices/<int:pk>/images'},
+        {'POST': '/api/offices/<int:pk>/images'},
         {'GET': '/api/offices/<int:pk>/requests'},
         {'GET': '/api/offices/<int:pk>/requests/<int:pk>'},
         {'GET': '/api/offices/<int:pk>/requests/<int:pk>/approve'},
         {'GET': '/api/offices/<int:pk>/requests/<int:pk>/deny'},
+        {'POST': '/api/requests/decide'},
+        {'GET': '/api/requests/export/<csv|ndjson>'},
         {'GET': '/api/desks'},
         {'GET': '/api/desks/<int:pk>'},
+        {'GET': '/api/desks/export/<csv|ndjson>'},
+        {'GET': '/api/reservations'},
+        {'POST': '/api/reservations'},
+        {'DELETE': '/api/reservations/<int:pk>'},
+        {'GET': '/api/analytics'},
+        {'GET': '/api/<users|buildings|offices|desks|requests>?since=<cursor>', 'description': 'Changes since the cursor'},
+
+        {'GET': '/api/async/<users|buildings|offices|desks|requests>'},
+        {'GET': '/api/async/<users|buildings|offices|desks|requests>/<int:pk>'},
+        {'GET': '/api/events/requests', 'description': 'Server-sent request events (ASGI)'},
 
         {'POST': '/api/token'},
         {'POST': '/api/token/refresh'},
@@ -64,12 +84,17 @@ class BlacklistTokenView(APIView):
     def post(self, request):
         try:
             refresh_token = request.data['refresh_token']
-            token = RefreshToken(refresh_token)
+            token = FilteredRefreshToken(refresh_token)
             token.blacklist()
         except Exception as e:
             return Response(status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_205_RESET_CONTENT)
 
 
 class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
 
+
+class MyTokenRefreshView(TokenRefreshView):
+    serializer_class = MyTokenRefreshSerializer
+
@@ -13,4 +13,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'offices.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# imported once the apps are loaded
+from api.events import EVENTS_PATH, request_events
+
+
+# server-sent request events stream outside of Django, see api.events
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] in (EVENTS_PATH, EVENTS_PATH.rstrip('/')):
+        await request_events(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
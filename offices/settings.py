@@ -1,7 +1,8 @@
 import os
 from pathlib import Path
 from datetime import timedelta
-from decouple import config
+from decouple import config, Csv
+from django.core.exceptions import ImproperlyConfigured
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -30,9 +31,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # outermost, so the timings cover the whole request
+    'api.middleware.MetricsMiddleware',
+    # picks the database the request reads from, see api.db_router
+    'api.middleware.ReplicaReadMiddleware',
     'django.middleware.security.SecurityMiddleware',
 
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # WhiteNoise, usable by the async views under ASGI
+    'api.middleware.StaticFilesMiddleware',
     'corsheaders.middleware.CorsMiddleware',
 
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -69,14 +75,55 @@ WSGI_APPLICATION = 'offices.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        # psycopg2 with a per process connection pool, see api/postgresql_pool
+        'ENGINE': 'api.postgresql_pool',
         'NAME': config('DB_NAME'),
         'USER': config('DB_USER'),
         'PASSWORD': config('DB_REMOTE_PASSWORD'),
         'HOST': config('DB_HOST'),
         'PORT': '5432',
+        'POOL': {
+            'MIN_SIZE': config('DB_POOL_MIN_SIZE', default=1, cast=int),
+            'MAX_SIZE': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+            # seconds to wait for a free connection
+            'TIMEOUT': config('DB_POOL_TIMEOUT', default=10, cast=float),
+            # ping connections idle for longer than this on checkout
+            'CHECK_AFTER': config('DB_POOL_CHECK_AFTER', default=5, cast=float),
+        },
+    }
+}
+
+
+# Read replicas, e.g. DB_REPLICA_HOSTS=10.0.0.2,10.0.0.3:5433
+# streaming replicas of the primary, with its database name and credentials
+DATABASE_REPLICAS = []
+for number, replica_host in enumerate(config('DB_REPLICA_HOSTS', default='', cast=Csv()), 1):
+    replica_host, _, replica_port = replica_host.partition(':')
+    DATABASES['replica_%d' % number] = dict(DATABASES['default'], HOST=replica_host, PORT=replica_port or '5432',
+                                            TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append('replica_%d' % number)
+
+DATABASE_ROUTERS = ['api.db_router.PrimaryReplicaRouter']
+# seconds a user's reads stay on the primary after a write
+REPLICA_STICKY_SECONDS = config('DB_REPLICA_STICKY_SECONDS', default=5, cast=float)
+
+
+# Cache
+# holds rendered API responses, their versions live in the database (api.ApiCacheVersion)
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='offices'),
     }
 }
+# the read-your-writes pin of api.middleware.ReplicaReadMiddleware lives in the cache, every
+# worker has to see it, a per process cache would send the next request to a lagging replica
+if DATABASE_REPLICAS and CACHES['default']['BACKEND'] in ('django.core.cache.backends.locmem.LocMemCache',
+                                                          'django.core.cache.backends.dummy.DummyCache'):
+    raise ImproperlyConfigured('DB_REPLICA_HOSTS needs a cache shared by all workers, set CACHE_BACKEND '
+                               '(e.g. django.core.cache.backends.redis.RedisCache) and CACHE_LOCATION.')
 
 
 # Password validation
@@ -112,6 +159,17 @@ USE_TZ = True
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATIC_URL = '/static/'
 
+# Uploaded images and their thumbnails (api.office_images), served by api.office_images.media_view
+MEDIA_ROOT = config('MEDIA_ROOT', default=os.path.join(BASE_DIR, 'media'))
+MEDIA_URL = '/media/'
+# threads per worker process generating thumbnails, 0 makes them in the request
+IMAGE_WORKERS = config('IMAGE_WORKERS', default=2, cast=int)
+
+# /metrics (api.metrics) answers these addresses, and requests sending
+# "Authorization: Bearer <METRICS_TOKEN>" when it is set
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='127.0.0.1,::1', cast=Csv())
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
 # CORS_ALLOWED_ORIGINS = [
 #     "https://offices-frontend.herokuapp.com",
 #     "http://localhost:3000",
@@ -1,10 +1,11 @@
 from django.contrib import admin
-from api.views import getRoutesView, MyTokenObtainPairView, BlacklistTokenView
+from api.views import getRoutesView, MyTokenObtainPairView, MyTokenRefreshView, BlacklistTokenView
+from api.metrics import metrics_view
+from api.office_images import media_view
 from django.urls import path, include, re_path
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
-from rest_framework_simplejwt.views import TokenRefreshView
 
 
 schema_view = get_schema_view(
@@ -23,11 +24,14 @@ schema_view = get_schema_view(
 
 urlpatterns = [
     path('api/token', MyTokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/refresh/', MyTokenRefreshView.as_view(), name='token_refresh'),
     path('api/token/blacklist/', BlacklistTokenView.as_view(), name='token_blacklist'),
     path('admin', admin.site.urls),
+    path('api/async/', include('api.async_urls', namespace='api_async')),
     path('api/', include('api.urls', namespace='api')),
     path('', getRoutesView.as_view(), name='getRoutes'),
+    path('metrics', metrics_view, name='metrics'),
+    path('media/<path:name>', media_view, name='media'),
     # API schema views
     re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     re_path(r'^swagger/$', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),